@@ -94,6 +94,7 @@ setup(
         create-mapping = snovault.elasticsearch.create_mapping:main
         dev-servers = snovault.dev_servers:main
         es-index-listener = snovault.elasticsearch.es_index_listener:main
+        indexer-worker = snovault.elasticsearch.indexer_worker:main
 
         add-date-created = snowflakes.commands.add_date_created:main
         check-rendering = snowflakes.commands.check_rendering:main
@@ -26,6 +26,7 @@ from snovault import (
     UPGRADER,
 )
 from snovault.schema_utils import validate
+from snovault.util import guided_chunks
 
 
 BATCH_UPGRADE_LOG = logging.getLogger('snovault.batchupgrade')
@@ -117,10 +118,10 @@ def batch_upgrade(request):
     return {'results': results}
 
 
-def _pool_batch_results(iterable, n=1):
-    l = len(iterable)
-    for ndx in range(0, l, n):
-        yield iterable[ndx:min(ndx+n, l)]
+def _pool_batch_results(iterable, n=1, processes=1):
+    # Batches of at most n shrink near the end so the last ones finish
+    # together, down to n / 4 to keep the number of transactions down
+    return guided_chunks(iterable, processes, n, min_size=max(n // 4, 1))
 
 
 def _pool_initializer(*args, **kw):
@@ -133,13 +134,6 @@ def _pool_worker(batch):
     return res.json
 
 
-def _pool_chunksize(uuid_count, chunksize, processes):
-    chunkiness = int((uuid_count - 1) / processes) + 1
-    if chunkiness > chunksize:
-        return chunksize
-    return chunkiness
-
-
 def _run_pool(uuids, args):
     from multiprocessing import get_context
     from multiprocessing.pool import Pool
@@ -151,12 +145,13 @@ def _run_pool(uuids, args):
         context=get_context('forkserver'),
         maxtasksperchild=args.maxtasksperchild,
     )
-    est_loops = int(len(uuids) / args.batchsize)
+    batches = list(_pool_batch_results(uuids, args.batchsize, args.processes))
+    est_loops = len(batches)
     all_results = []
     try:
         pool_gen = pool.imap_unordered(
             _pool_worker,
-            _pool_batch_results(uuids, args.batchsize),
+            batches,
             chunksize=args.chunksize,
         )
         for loop, result in enumerate(pool_gen, 1):
@@ -167,7 +162,7 @@ def _run_pool(uuids, args):
                 if error_msg
             ]
             updated_cnt = sum(update for _, _, update, _, _ in results)
-            log_msg = "{} of ~{} Batch: Updated {} of {} (errors {})".format(
+            log_msg = "{} of {} Batch: Updated {} of {} (errors {})".format(
                 loop,
                 est_loops,
                 updated_cnt,
@@ -1,7 +1,15 @@
+from collections import (
+    OrderedDict,
+    deque,
+)
 from pyramid.threadlocal import manager
+from sqlalchemy import func
 from sqlalchemy.util import LRUCache
-import transaction.interfaces
 from zope.interface import implementer
+from .interfaces import DBSESSION
+from .storage import TransactionRecord
+import threading
+import transaction.interfaces
 
 
 @implementer(transaction.interfaces.ISynchronizer)
@@ -59,3 +67,171 @@ class ManagerLRUCache(object):
 
     def newTransaction(self, transaction):
         pass
+
+
+class SharedLRUCache(object):
+    """ Process wide cache tier shared by requests.
+
+    Entries are ``(result, embedded_uuids, linked_uuids)`` tuples as stored
+    in the embed cache. They are dropped when a later transaction updates
+    one of their embedded uuids or renames one of their linked uuids, as
+    recorded in the transactions table by ``invalidation.es_update_data``.
+
+    Only GET and HEAD requests rendering from the database use this tier.
+    Entries are keyed by host and the effective principals of the request,
+    so a result is only served to users with the same permissions.
+    Each request reads the transactions committed since the last poll
+    before its first lookup. An entry is only stored if no invalidation
+    touching it was seen after its request started.
+    """
+    def __init__(self, name, capacity, poll_window=1000, log_size=10000):
+        self.name = name
+        self.capacity = capacity
+        # Transaction orders are assigned before commit, so recheck a window
+        # of recent orders for transactions that committed out of order.
+        self.poll_window = poll_window
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._generation = 0
+        self._min_generation = 1
+        self._log = deque(maxlen=log_size)
+        self._last_order = None
+        self._seen_orders = set()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def __len__(self):
+        return len(self._entries)
+
+    def new_request(self, event):
+        ''' NewRequest subscriber, remembers the generation a request started at
+        '''
+        if not manager.stack:
+            return
+        threadlocals = manager.stack[0]
+        if threadlocals.get('request') is not event.request:
+            return
+        threadlocals[self.name + '.generation'] = self._generation
+
+    def _request_state(self, request):
+        ''' Returns (threadlocals, key prefix) if request may use the cache
+        '''
+        if not manager.stack:
+            return None, None
+        threadlocals = manager.stack[0]
+        if self.name + '.generation' not in threadlocals:
+            return None, None
+        root_request = threadlocals['request']
+        if root_request.method not in ('GET', 'HEAD'):
+            return None, None
+        if getattr(request, 'datastore', 'database') != 'database':
+            return None, None
+        if not threadlocals.get(self.name + '.polled'):
+            threadlocals[self.name + '.polled'] = True
+            self.poll(threadlocals['registry'][DBSESSION]())
+        prefix = threadlocals.get(self.name + '.prefix')
+        if prefix is None:
+            prefix = threadlocals[self.name + '.prefix'] = (
+                root_request.host_url,
+                frozenset(root_request.effective_principals),
+            )
+        return threadlocals, prefix
+
+    def get(self, request, key, default=None):
+        threadlocals, prefix = self._request_state(request)
+        if threadlocals is None:
+            return default
+        key = (prefix, key)
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def set(self, request, key, value):
+        threadlocals, prefix = self._request_state(request)
+        if threadlocals is None:
+            return False
+        result, embedded, linked = value
+        embedded = frozenset(embedded)
+        linked = frozenset(linked)
+        generation = threadlocals[self.name + '.generation']
+        with self._lock:
+            if generation < self._min_generation:
+                # Started before the first poll
+                return False
+            if self._generation > generation:
+                if not self._log or self._log[0][0] > generation + 1:
+                    # Invalidations since the request started are lost
+                    return False
+                for event_generation, updated, renamed in self._log:
+                    if event_generation <= generation:
+                        continue
+                    if not embedded.isdisjoint(updated) or not linked.isdisjoint(renamed):
+                        return False
+            key = (prefix, key)
+            self._entries[key] = (result, embedded, linked)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, updated, renamed):
+        updated = set(updated)
+        renamed = set(renamed)
+        with self._lock:
+            self._generation += 1
+            self._log.append((self._generation, updated, renamed))
+            stale = [
+                key for key, (result, embedded, linked) in self._entries.items()
+                if not embedded.isdisjoint(updated) or not linked.isdisjoint(renamed)
+            ]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def poll(self, session):
+        ''' Invalidate entries changed by transactions since the last poll
+
+        Only the orders in the window are read for every poll, the data of
+        a transaction is read once.  The database is read outside the lock.
+        '''
+        with self._poll_lock:
+            last_order = self._last_order
+            seen_orders = set(self._seen_orders)
+        first_poll = last_order is None
+        if first_poll:
+            last_order = session.query(func.max(TransactionRecord.order)).scalar() or 0
+        orders = [
+            order for order, in session.query(TransactionRecord.order).filter(
+                TransactionRecord.order > last_order - self.poll_window
+            )
+        ]
+        unseen = [order for order in orders if order not in seen_orders]
+        updated = set()
+        renamed = set()
+        if unseen and not first_poll:
+            # Nothing can be cached from before the first poll
+            for data, in session.query(TransactionRecord.data).filter(
+                    TransactionRecord.order.in_(unseen)):
+                data = data or {}
+                updated.update(data.get('updated', ()))
+                renamed.update(data.get('renamed', ()))
+        with self._poll_lock:
+            if self._last_order is None:
+                with self._lock:
+                    self._generation += 1
+                    self._min_generation = self._generation
+            if updated or renamed:
+                self.invalidate(updated, renamed)
+            last_order = max([last_order, self._last_order or 0] + orders)
+            self._last_order = last_order
+            self._seen_orders.update(unseen)
+            self._seen_orders = {
+                order for order in self._seen_orders
+                if order > last_order - self.poll_window
+            }
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 import venusian
 from pyramid.decorator import reify
 from pyramid.traversal import find_root
+from inspect import getattr_static
 from types import MethodType
 from .interfaces import (
     CALCULATED_PROPERTIES,
@@ -47,6 +48,7 @@ class ItemNamespace(object):
             value = self._properties[name]
             if name in context.type_info.schema_links:
                 if isinstance(value, list):
+                    conn.get_many_by_uuid(value)
                     value = [
                         request.resource_path(conn.get_by_uuid(v))
                         for v in value
@@ -56,16 +58,15 @@ class ItemNamespace(object):
             setattr(self, name, value)
             return value
         if name in context.rev:
-            value = context.get_rev_links(name)
-            value = [
-                request.resource_path(conn.get_by_uuid(v))
-                for v in value
-            ]
+            rev_links = context.get_rev_link_paths(name)
+            # Record linking objects as Item.__resource_url__ would
+            request._linked_uuids.update(uuid for uuid, _, _ in rev_links)
+            value = [path for _, _, path in rev_links]
             setattr(self, name, value)
             return value
         raise AttributeError(name)
 
-    def __call__(self, fn):
+    def __call__(self, fn, args=None):
         try:
             return self._results[fn]
         except KeyError:
@@ -75,9 +76,8 @@ class ItemNamespace(object):
             result = self._results[fn] = getattr(self, fn, None)
             return result
 
-        start = 1 if isinstance(fn, MethodType) else 0
-        # Not using inspect.getargspec as it is slow
-        args = fn.__code__.co_varnames[start:fn.__code__.co_argcount]
+        if args is None:
+            args = _arg_names(fn, 1 if isinstance(fn, MethodType) else 0)
         kw = {}
         for name in args:
             try:
@@ -89,37 +89,178 @@ class ItemNamespace(object):
         return result
 
 
+def _arg_names(fn, start=0):
+    # Not using inspect.getargspec as it is slow
+    return fn.__code__.co_varnames[start:fn.__code__.co_argcount]
+
+
+def _bound_arg_names(cls, fn, attr=None):
+    """ Argument names of a property function or condition as it is called.
+
+    Strings are looked up on the namespace and have no arguments. Methods
+    named by attr are bound to the context so lose their first argument.
+    """
+    if attr is None and (fn is None or isinstance(fn, str)):
+        return None
+    try:
+        if attr is not None:
+            start = 0 if isinstance(getattr_static(cls, attr, None), staticmethod) else 1
+            return _arg_names(getattr(cls, attr), start)
+        return _arg_names(fn, 1 if isinstance(fn, MethodType) else 0)
+    except AttributeError:
+        # Left to ItemNamespace to work out when called
+        return None
+
+
+class PropertyPlan(object):
+    """ Calculated properties of one class and category, ready to evaluate.
+
+    Built once by CalculatedProperties.plan_for with the argument names of
+    every property function and condition bound up front. Properties are
+    kept in registration order, which is the order they are rendered in.
+    Defined properties are always available to the namespace since other
+    properties may take them as arguments, whether or not they are rendered.
+    """
+    def __init__(self, cls, props, defined):
+        self.props = props
+        self.defined = defined
+        self.steps = []
+        for name, prop in props.items():
+            self.steps.append((
+                name,
+                prop.condition,
+                _bound_arg_names(cls, prop.condition),
+                prop.attr,
+                prop.fn,
+                _bound_arg_names(cls, prop.fn, prop.attr),
+            ))
+        self.depends_on = self._depends_on(cls)
+
+    def _depends_on(self, cls):
+        """ Names the rendered properties read from the namespace.
+
+        That is their arguments, string conditions and declared depends_on,
+        following defined properties through to what they read in turn.
+        None when a function's arguments are not known up front.
+        """
+        depends_on = set()
+        pending = list(self.props.values())
+        seen = set()
+        while pending:
+            prop = pending.pop()
+            if prop.name in seen:
+                continue
+            seen.add(prop.name)
+            names = set(prop.depends_on)
+            for fn, attr in ((prop.condition, None), (prop.fn, prop.attr)):
+                if isinstance(fn, str):
+                    names.add(fn)
+                elif fn is not None or attr is not None:
+                    args = _bound_arg_names(cls, fn, attr)
+                    if args is None:
+                        return None
+                    names.update(args)
+            for name in names:
+                if name in self.defined:
+                    pending.append(self.defined[name])
+            depends_on.update(names)
+        return frozenset(depends_on)
+
+    def __call__(self, namespace):
+        results = {}
+        for name, condition, condition_args, attr, fn, args in self.steps:
+            if condition is not None and not namespace(condition, condition_args):
+                continue
+            if attr:
+                fn = getattr(namespace.context, attr)
+            value = namespace(fn, args)
+            if value is not None:
+                results[name] = value
+        return results
+
+
 class CalculatedProperties(object):
+    # Bound on plans kept for the include and exclude lists of requests
+    max_plans = 1000
+
     def __init__(self):
         self.category_cls_props = {}
+        self._cls_props = {}
+        self._plans = {}
 
     def register_prop(self, fn, name, context, condition=None, schema=None,
-                      attr=None, define=False, category='object'):
-        prop = CalculatedProperty(fn, name, attr, condition, schema, define)
+                      attr=None, define=False, category='object', depends_on=None):
+        prop = CalculatedProperty(fn, name, attr, condition, schema, define, depends_on)
         cls_props = self.category_cls_props.setdefault(category, {})
         cls_props.setdefault(context, {})[name] = prop
+        self._cls_props.clear()
+        self._plans.clear()
 
-    def props_for(self, context, category='object'):
-        if isinstance(context, type):
-            cls = context
-        else:
-            cls = type(context)
+    def _props_for(self, cls, category):
+        key = (cls, category)
+        try:
+            return self._cls_props[key]
+        except KeyError:
+            pass
         props = {}
         cls_props = self.category_cls_props.get(category, {})
         for base in reversed(cls.mro()):
             props.update(cls_props.get(base, {}))
+        self._cls_props[key] = props
         return props
 
+    def props_for(self, context, category='object'):
+        if isinstance(context, type):
+            cls = context
+        else:
+            cls = type(context)
+        return dict(self._props_for(cls, category))
+
+    def plan_for(self, context, category='object', include=None, exclude=None):
+        """ Cached PropertyPlan for the class of context.
+
+        include and exclude filter the rendered properties by name, None
+        meaning no filter.
+        """
+        if isinstance(context, type):
+            cls = context
+        else:
+            cls = type(context)
+        if include is not None:
+            include = frozenset(include)
+        if exclude is not None:
+            exclude = frozenset(exclude)
+        key = (cls, category, include, exclude)
+        try:
+            return self._plans[key]
+        except KeyError:
+            pass
+        all_props = self._props_for(cls, category)
+        props = {
+            name: prop
+            for name, prop in all_props.items()
+            if _should_render_property(include, exclude, name)
+        }
+        defined = {name: prop for name, prop in all_props.items() if prop.define}
+        plan = PropertyPlan(cls, props, defined)
+        if len(self._plans) >= self.max_plans:
+            self._plans.clear()
+        self._plans[key] = plan
+        return plan
+
 
 class CalculatedProperty(object):
     condition_args = None
 
-    def __init__(self, fn, name, attr=None, condition=None, schema=None, define=False):
+    def __init__(self, fn, name, attr=None, condition=None, schema=None, define=False,
+                 depends_on=None):
         self.fn = fn
         self.attr = attr
         self.name = name
         self.condition = condition
         self.define = define
+        # Fields read other than through arguments, e.g. from context.properties
+        self.depends_on = tuple(depends_on or ())
 
         if schema is not None:
             if 'default' in schema:
@@ -142,18 +283,22 @@ class CalculatedProperty(object):
 
 # Imperative configuration
 def add_calculated_property(config, fn, name, context, condition=None, schema=None,
-                            attr=None, define=False, category='object'):
+                            attr=None, define=False, category='object', depends_on=None):
     calculated_properties = config.registry[CALCULATED_PROPERTIES]
     config.action(
         ('calculated_property', context, category, name),
         calculated_properties.register_prop,
-        (fn, name, context, condition, schema, attr, define, category),
+        (fn, name, context, condition, schema, attr, define, category, depends_on),
     )
 
 
 # Declarative configuration
 def calculated_property(**settings):
     """ Register a calculated property
+
+    depends_on lists the stored fields, links and rev links the property
+    reads other than through its arguments, so that callers asking for only
+    some properties know what else must be loaded to calculate them.
     """
 
     def decorate(wrapped):
@@ -183,46 +328,27 @@ def calculated_property(**settings):
     return decorate
 
 
-def calculate_properties(context, request, ns=None, category='object'):
+def _init_property_calculation(context, request, ns=None, category='object',
+                               include=None, exclude=None):
     calculated_properties = request.registry[CALCULATED_PROPERTIES]
-    props = calculated_properties.props_for(context, category)
-    defined = {name: prop for name, prop in props.items() if prop.define}
+    plan = calculated_properties.plan_for(context, category, include, exclude)
     if isinstance(context, type):
         context = None
-    namespace = ItemNamespace(context, request, defined, ns)
-    return {
-        name: value
-        for name, value in (
-            (name, prop(namespace))
-            for name, prop in props.items()
-        ) if value is not None
-    }
+    namespace = ItemNamespace(context, request, plan.defined, ns)
+    return namespace, plan
 
 
-def _init_property_calculation(context, request, ns=None, category='object'):
-    calculated_properties = request.registry[CALCULATED_PROPERTIES]
-    props = calculated_properties.props_for(context, category)
-    defined = {name: prop for name, prop in props.items() if prop.define}
-    if isinstance(context, type):
-        context = None
-    namespace = ItemNamespace(context, request, defined, ns)
-    return namespace, props
+def calculate_properties(context, request, ns=None, category='object'):
+    namespace, plan = _init_property_calculation(context, request, ns=ns, category=category)
+    return plan(namespace)
 
 
 def calculate_select_properties(context, request, ns=None, category='object', select_properties=None):
     select_properties = select_properties or []
-    namespace, props = _init_property_calculation(context, request, ns=ns, category=category)
-    filtered_properties = (
-        (name, prop(namespace))
-        for name, prop in props.items()
-        if name in select_properties
+    namespace, plan = _init_property_calculation(
+        context, request, ns=ns, category=category, include=select_properties
     )
-    select_calculated_properties = {
-        name: value
-        for name, value in filtered_properties
-        if value is not None
-    }
-    return select_calculated_properties
+    return plan(namespace)
 
 
 def _should_render_property(include, exclude, name):
@@ -234,15 +360,7 @@ def _should_render_property(include, exclude, name):
 
 
 def calculate_filtered_properties(context, request, ns=None, category='object', include=None, exclude=None):
-    namespace, props = _init_property_calculation(context, request, ns=ns, category=category)
-    filtered_properties = (
-        (name, prop(namespace))
-        for name, prop in props.items()
-        if _should_render_property(include, exclude, name)
+    namespace, plan = _init_property_calculation(
+        context, request, ns=ns, category=category, include=include, exclude=exclude
     )
-    filtered_calculated_properties = {
-        name: value
-        for name, value in filtered_properties
-        if value is not None
-    }
-    return filtered_calculated_properties
+    return plan(namespace)
@@ -1,22 +1,46 @@
 from past.builtins import basestring
 from pyramid.decorator import reify
+from pyramid.events import NewRequest
+from pyramid.settings import asbool
+from pyramid.traversal import (
+    quote_path_segment,
+    resource_path,
+)
 from uuid import UUID
-from .cache import ManagerLRUCache
+from .cache import (
+    ManagerLRUCache,
+    SharedLRUCache,
+)
 from .interfaces import (
+    COLLECTIONS,
     CONNECTION,
     STORAGE,
     TYPES,
 )
+from .resources import Item
 
 def includeme(config):
     registry = config.registry
-    registry[CONNECTION] = Connection(registry)
+    registry[CONNECTION] = connection = Connection(registry)
+    if connection.shared_embed_cache is not None:
+        config.add_subscriber(connection.shared_embed_cache.new_request, NewRequest)
 
 
 class UnknownItemTypeError(Exception):
     pass
 
 
+def _uses_item_path(factory):
+    ''' Is the item path of factory built by Item.__name__ and Item.__parent__ '''
+    for name in ('__name__', '__parent__', 'collection'):
+        for cls in factory.__mro__:
+            if name in cls.__dict__:
+                if cls is not Item:
+                    return False
+                break
+    return True
+
+
 class Connection(object):
     ''' Intermediates between the storage and the rest of the system
     '''
@@ -26,6 +50,17 @@ class Connection(object):
         self.unique_key_cache = ManagerLRUCache('snovault.connection.key_cache', 1000)
         embed_cache_capacity = int(registry.settings.get('embed_cache.capacity', 5000))
         self.embed_cache = ManagerLRUCache('snovault.connection.embed_cache', embed_cache_capacity)
+        # Optional process wide tier behind embed_cache, not for indexers
+        # which render many objects once from a fixed snapshot.
+        shared_capacity = int(registry.settings.get('embed_cache.shared_capacity', 0))
+        self.shared_embed_cache = None
+        if shared_capacity and not (
+                asbool(registry.settings.get('indexer')) or
+                asbool(registry.settings.get('indexer_worker'))):
+            self.shared_embed_cache = SharedLRUCache(
+                'snovault.connection.shared_embed_cache', shared_capacity
+            )
+
     @reify
     def storage(self):
         return self.registry[STORAGE]
@@ -52,6 +87,39 @@ class Connection(object):
         if model is None:
             return default
 
+        item = self._item_for_model(model)
+        self.item_cache[uuid] = item
+        return item
+
+    def get_many_by_uuid(self, uuids):
+        ''' Return items for uuids, loading the uncached ones in one storage call
+
+        Prefills the item cache and, for database models, the unique key
+        cache so that later lookups by uuid or path hit the caches.
+        Uuids that are invalid or not found are left out.
+        '''
+        items = {}
+        missing = []
+        for uuid in uuids:
+            try:
+                uuid = str(UUID(str(uuid)))
+            except ValueError:
+                continue
+            if uuid in items:
+                continue
+            items[uuid] = self.item_cache.get(uuid)
+            if items[uuid] is None:
+                missing.append(uuid)
+        if missing:
+            for model in self.storage.get_many_by_uuid(missing):
+                uuid = str(model.uuid)
+                items[uuid] = item = self._item_for_model(model)
+                self.item_cache[uuid] = item
+                for key in getattr(model, 'unique_keys', ()):
+                    self.unique_key_cache[(key.name, key.value)] = model.uuid
+        return [item for item in items.values() if item is not None]
+
+    def _item_for_model(self, model):
         try:
             Item = self.types.by_item_type[model.item_type].factory
         except KeyError:
@@ -59,7 +127,6 @@ class Connection(object):
 
         item = Item(self.registry, model)
         model.used_for(item)
-        self.item_cache[uuid] = item
         return item
 
     def get_by_unique_key(self, unique_key, name, default=None, index=None):
@@ -93,6 +160,61 @@ class Connection(object):
         item_types = [self.types[t].item_type for t in types]
         return self.storage.get_rev_links(model, rel, *item_types)
 
+    @reify
+    def path_item_types(self):
+        ''' Item types whose paths can be built from the name key without the item '''
+        return {
+            item_type
+            for item_type, type_info in self.types.by_item_type.items()
+            if _uses_item_path(type_info.factory)
+        }
+
+    @reify
+    def name_keys(self):
+        return {
+            item_type: self.types.by_item_type[item_type].factory.name_key
+            for item_type in self.path_item_types
+            if self.types.by_item_type[item_type].factory.name_key is not None
+        }
+
+    def get_rev_link_paths(self, model, rel, *types):
+        """ (uuid, item_type, resource path) of every rev link
+
+        In the order of get_rev_links.  Paths are built from the names the
+        storage returns in one query rather than by loading every linking
+        item.  Only items of types overriding how Item builds its path
+        are loaded.
+        """
+        item_types = [self.types[t].item_type for t in types]
+        names = {
+            str(uuid): (item_type, name)
+            for uuid, item_type, name in self.storage.get_rev_link_names(
+                model, rel, *item_types, name_keys=self.name_keys)
+        }
+        collections = self.registry[COLLECTIONS]
+        collection_paths = {}
+        results = []
+        # Not filtered by item type, so the sources need not be loaded
+        for uuid in self.storage.get_rev_links(model, rel):
+            uuid = str(uuid)
+            try:
+                item_type, name = names[uuid]
+            except KeyError:
+                continue
+            if item_type not in self.path_item_types:
+                path = resource_path(self.get_by_uuid(uuid)) + '/'
+                results.append((uuid, item_type, path))
+                continue
+            try:
+                collection_path = collection_paths[item_type]
+            except KeyError:
+                collection = collections[self.types.by_item_type[item_type].name]
+                collection_path = resource_path(collection) + '/'
+                collection_paths[item_type] = collection_path
+            name = quote_path_segment(str(name or uuid))
+            results.append((uuid, item_type, collection_path + name + '/'))
+        return results
+
     def __iter__(self, *types):
         if not types:
             item_types = self.types.by_item_type.keys()
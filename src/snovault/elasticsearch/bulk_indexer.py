@@ -0,0 +1,261 @@
+'''
+Bulk writes of rendered index-data documents
+
+Documents are buffered and written with the elasticsearch _bulk api instead
+of one index request per uuid.  Every document keeps the external_gte
+versioning used by Indexer.update_object and gets the same es_info timing
+and backoff records.
+
+With indexer.bulk_queue_size set, ThreadedBulkWriter runs the BulkIndexer in
+a writer thread fed by a bounded queue, so rendering goes on while bulk
+requests and their backoffs are in flight.
+'''
+import logging
+import queue
+import threading
+import time
+
+from elasticsearch.exceptions import (
+    ConnectionError,
+    TransportError,
+)
+from pyramid.settings import asbool
+from urllib3.exceptions import ReadTimeoutError
+
+from snovault.json_renderer import json_renderer
+
+
+log = logging.getLogger('snovault.elasticsearch.es_index_listener')
+BULK_BACKOFFS = [0, 10, 20, 40, 80]
+BULK_MAX_DOCS = 500
+BULK_MAX_BYTES = 10 * 1024 * 1024
+BULK_REQUEST_TIMEOUT = 30
+_STOP = object()
+
+
+def get_bulk_options(settings):
+    '''Returns BulkIndexer options from settings or None if bulk is off'''
+    if not asbool(settings.get('indexer.bulk', False)):
+        return None
+    return {
+        'max_docs': int(settings.get('indexer.bulk_max_docs', BULK_MAX_DOCS)),
+        'max_bytes': int(settings.get('indexer.bulk_max_bytes', BULK_MAX_BYTES)),
+        'queue_size': int(settings.get('indexer.bulk_queue_size', 0)),
+    }
+
+
+def get_bulk_writer(encoded_es, xmin, queue_size=0, **options):
+    '''Returns a BulkIndexer, in a writer thread if queue_size is set'''
+    bulk_indexer = BulkIndexer(encoded_es, xmin, **options)
+    if queue_size:
+        return ThreadedBulkWriter(bulk_indexer, queue_size)
+    return bulk_indexer
+
+
+def _is_retryable_status(status):
+    '''Too many requests and server errors are worth retrying'''
+    return status == 429 or status >= 500
+
+
+class BulkIndexer(object):
+    '''
+    Buffer rendered documents and flush them to elasticsearch in bulk
+
+    add and flush return the (update_info, last_exc) pairs of documents
+    whose write finished, last_exc being None on success or conflict.
+    '''
+    def __init__(
+            self,
+            encoded_es,
+            xmin,
+            max_docs=BULK_MAX_DOCS,
+            max_bytes=BULK_MAX_BYTES,
+            request_timeout=BULK_REQUEST_TIMEOUT,
+        ):
+        # pylint: disable=too-many-arguments
+        self.encoded_es = encoded_es
+        self.xmin = xmin
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.request_timeout = request_timeout
+        self._pending = []
+        self._pending_bytes = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _get_lines(self, uuid, doc):
+        action = {
+            'index': {
+                '_index': doc['item_type'],
+                '_type': doc['item_type'],
+                '_id': str(uuid),
+                '_version': self.xmin,
+                '_version_type': 'external_gte',
+            }
+        }
+        return json_renderer.dumps(action) + '\n' + json_renderer.dumps(doc) + '\n'
+
+    def add(self, update_info, doc):
+        '''Buffer a rendered document, flushing when a limit is reached'''
+        update_info['es_info']['item_type'] = doc['item_type']
+        lines = self._get_lines(update_info['uuid'], doc)
+        finished = []
+        if self._pending and self._pending_bytes + len(lines) > self.max_bytes:
+            finished.extend(self.flush())
+        # [update_info, bulk lines, last exception]
+        self._pending.append([update_info, lines, None])
+        self._pending_bytes += len(lines)
+        if len(self._pending) >= self.max_docs or self._pending_bytes >= self.max_bytes:
+            finished.extend(self.flush())
+        return finished
+
+    def flush(self):
+        '''Write all buffered documents, retrying with backoff'''
+        pending = self._pending
+        self._pending = []
+        self._pending_bytes = 0
+        if not pending:
+            return []
+        start_time = time.time()
+        for update_info, _, _ in pending:
+            update_info['es_info']['start_time'] = start_time
+        finished = []
+        for backoff in BULK_BACKOFFS:
+            time.sleep(backoff)
+            pending, done = self._send(pending, backoff)
+            finished.extend(done)
+            if not pending:
+                break
+        # Retryable errors that never succeeded
+        finished.extend(pending)
+        end_time = time.time()
+        results = []
+        for update_info, _, last_exc in finished:
+            es_info = update_info['es_info']
+            es_info['end_time'] = end_time
+            es_info['run_time'] = end_time - es_info['start_time']
+            results.append((update_info, last_exc))
+        return results
+
+    @staticmethod
+    def _set_backoff_info(item, backoff, start_time, error=None):
+        end_time = time.time()
+        item[0]['es_info']['backoffs'][str(backoff)] = {
+            'start_time': start_time,
+            'end_time': end_time,
+            'run_time': end_time - start_time,
+            'error': error,
+        }
+
+    def _send(self, pending, backoff):
+        '''Send one bulk request, returns (items to retry, finished items)'''
+        start_time = time.time()
+        body = ''.join(lines for _, lines, _ in pending)
+        try:
+            res = self.encoded_es.bulk(body=body, request_timeout=self.request_timeout)
+        except (ConnectionError, ReadTimeoutError, TransportError) as ecp:
+            msg = 'Retryable error bulk indexing %d documents: %r' % (len(pending), ecp)
+            log.warning(msg)
+            for item in pending:
+                item[2] = repr(ecp)
+                self._set_backoff_info(
+                    item, backoff, start_time, error={'msg': msg, 'last_exc': item[2]}
+                )
+            return pending, []
+        except Exception as ecp:  # pylint: disable=broad-except
+            msg = 'Error bulk indexing %d documents' % len(pending)
+            log.error(msg, exc_info=True)
+            for item in pending:
+                item[2] = repr(ecp)
+                self._set_backoff_info(
+                    item, backoff, start_time, error={'msg': msg, 'last_exc': None}
+                )
+            return [], pending
+        retry = []
+        finished = []
+        # Bulk response items are in the same order as the request actions
+        for item, res_item in zip(pending, res['items']):
+            uuid = item[0]['uuid']
+            result = res_item.get('index', {})
+            status = result.get('status', 500)
+            error = None
+            item[2] = None
+            if status == 409:
+                msg = 'Conflict indexing %s at version %s' % (uuid, self.xmin)
+                log.warning(msg)
+                error = {'msg': msg, 'last_exc': None}
+                item[0]['es_info']['conflict'] = True
+                finished.append(item)
+            elif status >= 300 or 'error' in result:
+                item[2] = repr(result.get('error'))
+                if _is_retryable_status(status):
+                    msg = 'Retryable error indexing %s: %s' % (uuid, item[2])
+                    log.warning(msg)
+                    error = {'msg': msg, 'last_exc': item[2]}
+                    retry.append(item)
+                else:
+                    msg = 'Error indexing %s: %s' % (uuid, item[2])
+                    log.error(msg)
+                    error = {'msg': msg, 'last_exc': None}
+                    finished.append(item)
+            else:
+                finished.append(item)
+            self._set_backoff_info(item, backoff, start_time, error=error)
+        return retry, finished
+
+
+class ThreadedBulkWriter(object):
+    '''
+    Run a BulkIndexer in a writer thread fed by a bounded queue
+
+    Same add and flush as BulkIndexer.  add only blocks while queue_size
+    documents wait to be written and returns the documents finished so far.
+    flush writes the rest, stops the thread and returns what is left.
+    '''
+    def __init__(self, bulk_indexer, queue_size):
+        self.bulk_indexer = bulk_indexer
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._finished = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name='bulk_writer', daemon=True,
+        )
+        self._thread.start()
+
+    def __len__(self):
+        return self._queue.qsize() + len(self.bulk_indexer)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            update_info, doc = item
+            try:
+                finished = self.bulk_indexer.add(update_info, doc)
+            except Exception as ecp:  # pylint: disable=broad-except
+                log.error('Error buffering %s for bulk indexing', update_info['uuid'], exc_info=True)
+                finished = [(update_info, repr(ecp))]
+            for result in finished:
+                self._finished.put(result)
+        for result in self.bulk_indexer.flush():
+            self._finished.put(result)
+
+    def _pop_finished(self):
+        results = []
+        while True:
+            try:
+                results.append(self._finished.get_nowait())
+            except queue.Empty:
+                return results
+
+    def add(self, update_info, doc):
+        '''Queue a rendered document, returns the writes finished so far'''
+        self._queue.put((update_info, doc))
+        return self._pop_finished()
+
+    def flush(self):
+        '''Write all queued documents and stop the writer thread'''
+        self._queue.put(_STOP)
+        self._thread.join()
+        return self._pop_finished()
@@ -1,5 +1,8 @@
+from functools import partial
+from snovault.cache import ManagerLRUCache
 from snovault.util import get_root_request
 from elasticsearch.helpers import scan
+from pyramid.settings import asbool
 from pyramid.threadlocal import get_current_request
 from zope.interface import alsoProvides
 from .interfaces import (
@@ -10,6 +13,17 @@ from .interfaces import (
 
 
 SEARCH_MAX = (2 ** 31) - 1
+# Uuids per terms query in get_many_by_uuid
+MANY_BATCH_SIZE = 1000
+# Uuids per search_after page when iterating a collection
+ITER_PAGE_SIZE = 1000
+# _source slices the cached view of a frame does not read.  They are left
+# out of reads for requests of that frame and fetched if used after all.
+FRAME_SOURCE_EXCLUDES = {
+    'object': ('audit', 'embedded'),
+    'audit': ('embedded',),
+    'audit-self': ('embedded',),
+}
 
 
 def includeme(config):
@@ -18,7 +32,19 @@ def includeme(config):
     es = registry[ELASTIC_SEARCH]
     es_index = RESOURCES_INDEX
     wrapped_storage = registry[STORAGE]
-    registry[STORAGE] = PickStorage(ElasticSearchStorage(es, es_index), wrapped_storage)
+    prefetch_linked = int(registry.settings.get('esstorage.prefetch_linked', 0))
+    frame_source_filter = asbool(
+        registry.settings.get('esstorage.frame_source_filter', False)
+    )
+    per_uuid_fallback = asbool(
+        registry.settings.get('esstorage.per_uuid_fallback', False)
+    )
+    registry[STORAGE] = PickStorage(
+        ElasticSearchStorage(es, es_index, frame_source_filter=frame_source_filter),
+        wrapped_storage,
+        prefetch_linked=prefetch_linked,
+        per_uuid_fallback=per_uuid_fallback,
+    )
 
 
 def force_database_for_request():
@@ -27,6 +53,149 @@ def force_database_for_request():
         request.datastore = 'database'
 
 
+def get_source_excludes(request):
+    ''' _source slices to leave out for the frame of request
+
+    The frame is the @@ view name ending the path, as in embeds, or else
+    the frame param.
+    '''
+    if request is None:
+        return ()
+    view_name = request.path_info.rsplit('/', 1)[-1]
+    if view_name.startswith('@@'):
+        frame = view_name[2:]
+    else:
+        frame = request.params.get('frame')
+    return FRAME_SOURCE_EXCLUDES.get(frame, ())
+
+
+class LazySource(dict):
+    ''' _source of a hit read without some slices
+
+    An excluded slice is fetched with fetch_slice(keys) when first used.
+    Reading the whole dict, by iterating it, its keys, items or values,
+    its length or comparing it, fetches all the excluded slices at once.
+    fetch_slice returns (source, complete), complete when the document
+    changed since it was read and source is all of the new version.
+    '''
+    def __init__(self, source, excluded, fetch_slice):
+        super().__init__(source)
+        self.excluded = set(excluded)
+        self.fetch_slice = fetch_slice
+
+    def _load(self, keys):
+        keys = [key for key in keys if key in self.excluded]
+        if keys:
+            self.excluded.difference_update(keys)
+            source, complete = self.fetch_slice(keys)
+            if complete:
+                self.excluded.clear()
+                dict.clear(self)
+            dict.update(self, source)
+
+    def _load_all(self):
+        self._load(sorted(self.excluded))
+
+    def __missing__(self, key):
+        if key not in self.excluded:
+            raise KeyError(key)
+        self._load([key])
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._load([key])
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        self._load([key])
+        return dict.get(self, key, default)
+
+    def setdefault(self, key, default=None):
+        self._load([key])
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *args):
+        self._load([key])
+        return dict.pop(self, key, *args)
+
+    def __iter__(self):
+        self._load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load_all()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        self._load_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        self._load_all()
+        return dict.__ne__(self, other)
+
+    def keys(self):
+        self._load_all()
+        return dict.keys(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._load_all()
+        return dict(dict.items(self))
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+
+class EditsIndex(object):
+    ''' Session edits compiled to the latest xid updating or renaming each uuid
+
+    Built once per request and checked with dict lookups by every
+    CachedModel.invalidated.
+    '''
+    def __init__(self, edits):
+        self.xids = tuple(xid for xid, _, _ in edits)
+        self.max_xid = max(self.xids, default=None)
+        self.updated = {}
+        self.renamed = {}
+        for xid, updated, renamed in edits:
+            for index, uuids in ((self.updated, updated), (self.renamed, renamed)):
+                for uuid in uuids:
+                    if index.get(uuid, xid) <= xid:
+                        index[uuid] = xid
+
+    def invalidates(self, version, embedded_uuids, linked_uuids):
+        ''' Was an embedded uuid updated or a linked uuid renamed at version or later '''
+        if self.max_xid is None or self.max_xid < version:
+            return False
+        for index, uuids in ((self.updated, embedded_uuids), (self.renamed, linked_uuids)):
+            if not index:
+                continue
+            for uuid in uuids:
+                xid = index.get(uuid)
+                if xid is not None and xid >= version:
+                    return True
+        return False
+
+
+def get_edits_index(request):
+    ''' EditsIndex of the session edits, compiled again only if they change '''
+    edits = dict.get(request.session, 'edits', None)
+    if not edits:
+        return None
+    edits_index = getattr(request, '_edits_index', None)
+    if edits_index is None or edits_index.xids != tuple(xid for xid, _, _ in edits):
+        edits_index = request._edits_index = EditsIndex(edits)
+    return edits_index
+
+
 class CachedModel(object):
     def __init__(self, hit):
         self.hit = hit
@@ -56,30 +225,41 @@ class CachedModel(object):
         request = get_root_request()
         if request is None:
             return False
-        edits = dict.get(request.session, 'edits', None)
-        if edits is None:
+        edits_index = get_edits_index(request)
+        if edits_index is None:
             return False
-        version = self.hit['_version']
         source = self.source
-        linked_uuids = set(source['linked_uuids'])
-        embedded_uuids = set(source['embedded_uuids'])
-        for xid, updated, linked in edits:
-            if xid < version:
-                continue
-            if not embedded_uuids.isdisjoint(updated):
-                return True
-            if not linked_uuids.isdisjoint(linked):
-                return True
-        return False
+        return edits_index.invalidates(
+            self.hit['_version'],
+            source['embedded_uuids'],
+            source['linked_uuids'],
+        )
 
     def used_for(self, item):
         alsoProvides(item, ICachedItem)
 
 
 class PickStorage(object):
-    def __init__(self, read, write):
+    def __init__(
+            self,
+            read,
+            write,
+            prefetch_linked=0,
+            per_uuid_fallback=False,
+        ):
         self.read = read
         self.write = write
+        # Up to prefetch_linked linked uuids of a model read from
+        # elasticsearch are read with it in one query, for the embeds that
+        # usually follow.  Prefetched models are kept for the request.
+        self.prefetch_linked = prefetch_linked
+        self.prefetched = ManagerLRUCache('snovault.esstorage.prefetched', 5000)
+        # With per_uuid_fallback only the invalidated uuids are read from
+        # the database for the rest of the request, instead of everything.
+        # Like the edits they are found invalidated by, they are kept per
+        # request.
+        self.per_uuid_fallback = per_uuid_fallback
+        self.stale_uuids = ManagerLRUCache('snovault.esstorage.stale_uuids', 10000)
 
     def storage(self):
         request = get_current_request()
@@ -87,34 +267,114 @@ class PickStorage(object):
             return self.read
         return self.write
 
+    def _prefetch_linked_models(self, model):
+        uuid = str(model.uuid)
+        linked_uuids = [
+            linked_uuid
+            for linked_uuid in model.source.get('linked_uuids', ())
+            if linked_uuid != uuid and linked_uuid not in self.prefetched
+        ]
+        if not linked_uuids or len(linked_uuids) > self.prefetch_linked:
+            return
+        for linked_model in self.read.get_many_by_uuid(linked_uuids):
+            self.prefetched[str(linked_model.uuid)] = linked_model
+
+    def _read_by_uuid(self, uuid):
+        model = self.prefetched.get(str(uuid))
+        if model is None:
+            model = self.read.get_by_uuid(uuid)
+            if model is not None and self.prefetch_linked:
+                self._prefetch_linked_models(model)
+        return model
+
+    def _is_stale(self, uuid):
+        return self.per_uuid_fallback and str(uuid) in self.stale_uuids
+
+    def _invalidated(self, model):
+        ''' Is the elasticsearch model invalidated, falling back per uuid or for the request '''
+        if not model.invalidated():
+            return False
+        if self.per_uuid_fallback:
+            self.stale_uuids[str(model.uuid)] = True
+        else:
+            force_database_for_request()
+        return True
+
     def get_by_uuid(self, uuid):
         storage = self.storage()
-        model = storage.get_by_uuid(uuid)
-        if storage is self.read:
-            model_invalidated = bool(model and model.invalidated())
-            if model_invalidated:
-                force_database_for_request()
-            if model is None or model_invalidated:
-                return self.write.get_by_uuid(uuid)
+        if storage is self.write or self._is_stale(uuid):
+            return self.write.get_by_uuid(uuid)
+        model = self._read_by_uuid(uuid)
+        if model is None or self._invalidated(model):
+            return self.write.get_by_uuid(uuid)
         return model
 
+    def get_many_by_uuid(self, uuids):
+        ''' Models for uuids in one elasticsearch query
+
+        Uuids not found or invalidated in elasticsearch are read from the
+        database in one more call.  Uuids not found at all are left out.
+        '''
+        storage = self.storage()
+        if storage is self.write:
+            return storage.get_many_by_uuid(uuids)
+        uuids = list(dict.fromkeys(str(uuid) for uuid in uuids))
+        stale = {uuid for uuid in uuids if self._is_stale(uuid)}
+        models = {}
+        for uuid in uuids:
+            model = self.prefetched.get(uuid)
+            if model is not None and uuid not in stale:
+                models[uuid] = model
+        missing = [
+            uuid for uuid in uuids
+            if uuid not in models and uuid not in stale
+        ]
+        if missing:
+            for model in self.read.get_many_by_uuid(missing):
+                models[str(model.uuid)] = model
+        fallback = []
+        for uuid in uuids:
+            model = models.get(uuid)
+            if model is not None and self._invalidated(model):
+                del models[uuid]
+            if uuid not in models:
+                fallback.append(uuid)
+        if fallback:
+            for model in self.write.get_many_by_uuid(fallback):
+                models[str(model.uuid)] = model
+        return [models[uuid] for uuid in uuids if uuid in models]
+
     def get_by_unique_key(self, unique_key, name, index=None):
         storage = self.storage()
         model = storage.get_by_unique_key(unique_key, name, index=index)
         if storage is self.read:
-            model_invalidated = bool(model and model.invalidated())
-            if model_invalidated:
-                force_database_for_request()
-            if model is None or model_invalidated:
+            if model is None or self._is_stale(model.uuid) or self._invalidated(model):
                 return self.write.get_by_unique_key(unique_key, name, index=index)
         return model
 
-    def get_rev_links(self, model, rel, *item_types):
+    def _rev_links_storage(self, model):
         storage = self.storage()
+        if (
+                self.per_uuid_fallback and storage is self.read and
+                not isinstance(model, CachedModel)
+            ):
+            # Database models fell back from elasticsearch, which would
+            # not have their latest rev links either
+            return self.write
+        return storage
+
+    def get_rev_links(self, model, rel, *item_types):
+        storage = self._rev_links_storage(model)
         if isinstance(model, CachedModel) and storage is self.write:
             model = storage.get_by_uuid(str(model.uuid))
         return storage.get_rev_links(model, rel, *item_types)
 
+    def get_rev_link_names(self, model, rel, *item_types, name_keys=None):
+        storage = self._rev_links_storage(model)
+        if isinstance(model, CachedModel) and storage is self.write:
+            model = storage.get_by_uuid(str(model.uuid))
+        return storage.get_rev_link_names(model, rel, *item_types, name_keys=name_keys)
+
     def __iter__(self, *item_types):
         return self.storage().__iter__(*item_types)
 
@@ -131,18 +391,69 @@ class PickStorage(object):
 class ElasticSearchStorage(object):
     writeable = False
 
-    def __init__(self, es, index):
+    def __init__(self, es, index, frame_source_filter=False):
         self.es = es
         self.index = index
+        self.frame_source_filter = frame_source_filter
+
+    def _source_params(self):
+        ''' Search params for the _source of the current request's frame
+
+        Returns the params and the excluded _source slices.
+        '''
+        excludes = ()
+        if self.frame_source_filter:
+            excludes = get_source_excludes(get_current_request())
+        if excludes:
+            return {'_source_exclude': list(excludes)}, excludes
+        return {'_source': True}, excludes
+
+    def _fetch_slice(self, hit, keys):
+        ''' The keys slices of the hit's _source, empty if the hit is gone
+
+        Returns (source, complete).  If the document was reindexed since
+        the hit was read, all of its new _source is returned instead and
+        the hit takes the new _version, so a model never mixes versions.
+        '''
+        query = {
+            'query': {
+                'ids': {
+                    'values': [hit['_id']]
+                }
+            },
+            'version': True
+        }
+        result = self.es.search(
+            index=hit['_index'], body=query, _source_include=list(keys), size=1
+        )
+        hits = result['hits']['hits']
+        if not hits:
+            return {}, False
+        if hits[0].get('_version') == hit.get('_version'):
+            return hits[0].get('_source', {}), False
+        result = self.es.search(index=hit['_index'], body=query, size=1)
+        hits = result['hits']['hits']
+        if not hits:
+            return {}, False
+        hit['_version'] = hits[0].get('_version')
+        return hits[0]['_source'], True
+
+    def _cached_model(self, hit, excludes):
+        if excludes:
+            hit['_source'] = LazySource(
+                hit['_source'], excludes, partial(self._fetch_slice, hit)
+            )
+        return CachedModel(hit)
 
     def _one(self, query, index=None):
         if index is None:
             index = self.index
-        data = self.es.search(index=index, body=query)
+        params, excludes = self._source_params()
+        data = self.es.search(index=index, body=query, **params)
         hits = data['hits']['hits']
         if len(hits) != 1:
             return None
-        model = CachedModel(hits[0])
+        model = self._cached_model(hits[0], excludes)
         return model
 
     def get_by_uuid(self, uuid):
@@ -154,11 +465,41 @@ class ElasticSearchStorage(object):
             },
             'version': True
         }
-        result = self.es.search(index=self.index, body=query, _source=True, size=1)
+        params, excludes = self._source_params()
+        result = self.es.search(index=self.index, body=query, size=1, **params)
         if result['hits']['total'] == 0:
             return None
         hit = result['hits']['hits'][0]
-        return CachedModel(hit)
+        return self._cached_model(hit, excludes)
+
+    def get_many_by_uuid(self, uuids):
+        ''' Models for uuids with one terms query per MANY_BATCH_SIZE uuids
+
+        The resources index is an alias over the per type indices so _mget,
+        which needs the index of every id, does not apply.  Uuids that are
+        not found are left out.
+        '''
+        uuids = list(dict.fromkeys(str(uuid) for uuid in uuids))
+        params, excludes = self._source_params()
+        models = []
+        for start in range(0, len(uuids), MANY_BATCH_SIZE):
+            batch = uuids[start:start + MANY_BATCH_SIZE]
+            query = {
+                'query': {
+                    'terms': {
+                        'uuid': batch
+                    }
+                },
+                'version': True
+            }
+            result = self.es.search(
+                index=self.index, body=query, size=len(batch), **params
+            )
+            models.extend(
+                self._cached_model(hit, excludes)
+                for hit in result['hits']['hits']
+            )
+        return models
 
     def get_by_unique_key(self, unique_key, name, index=None):
         term = 'unique_keys.' + unique_key
@@ -190,17 +531,54 @@ class ElasticSearchStorage(object):
             hit['_id'] for hit in scan(self.es, query=query)
         ]
 
+    def get_rev_link_names(self, model, rel, *item_types, name_keys=None):
+        name_keys = name_keys or {}
+        filter_ = {'term': {'links.' + rel: str(model.uuid)}}
+        if item_types:
+            filter_ = [
+                filter_,
+                {'terms': {'item_type': item_types}},
+            ]
+        query = {
+            '_source': ['item_type'] + [
+                'properties.' + name_key for name_key in set(name_keys.values())
+            ],
+            'query': {
+                'bool': {
+                    'filter': filter_,
+                }
+            }
+        }
+        results = []
+        for hit in scan(self.es, query=query):
+            source = hit['_source']
+            item_type = source['item_type']
+            name = None
+            if item_type in name_keys:
+                name = source.get('properties', {}).get(name_keys[item_type])
+            results.append((hit['_id'], item_type, name))
+        return results
+
     def __iter__(self, *item_types):
+        # Pages with search_after rather than a scroll, which would have to
+        # be kept alive while a streamed listing is written
         query = {
+            'size': ITER_PAGE_SIZE,
             'stored_fields': [],
+            'sort': [{'uuid': 'asc'}],
             'query': {
                 'bool': {
                     'filter': {'terms': {'item_type': item_types}} if item_types else {'match_all': {}}
                 }
             }
         }
-        for hit in scan(self.es, query=query):
-            yield hit['_id']
+        while True:
+            hits = self.es.search(index=self.index, body=query)['hits']['hits']
+            for hit in hits:
+                yield hit['_id']
+            if len(hits) < ITER_PAGE_SIZE:
+                return
+            query['search_after'] = hits[-1]['sort']
 
     def __len__(self, *item_types):
         query = {
@@ -0,0 +1,108 @@
+'''
+Invalidation from the index_dependencies table
+
+The indexer records the embedded_uuids and linked_uuids of every document it
+writes to elasticsearch in postgres.  get_related_uuids_from_db finds the
+documents to reindex for updated and renamed uuids with batched queries on
+that table rather than an elasticsearch terms query, so large edits do not
+fall back to a full reindex.
+
+The table only covers documents written while indexer.dependency_table is
+on, so turn it on together with a full reindex.  The rows of a document are
+replaced each time it is written, and removed when its item is purged with
+delete_by_uuid.  Rows of a document whose last write failed stay until it is
+written again, which at worst reindexes it for edits it no longer embeds.
+'''
+import logging
+
+from pyramid.settings import asbool
+
+from snovault import DBSESSION
+from snovault.storage import IndexDependency
+
+from .uuid_set import CompactUuidSet
+
+
+log = logging.getLogger('snovault.elasticsearch.es_index_listener')
+DEPENDENCY_WRITE_BATCH = 500
+RELATED_QUERY_BATCH = 10000
+
+
+def use_dependency_table(settings):
+    '''Is indexer.dependency_table on'''
+    return asbool(settings.get('indexer.dependency_table', False))
+
+
+def get_related_uuids_from_db(session, updated, renamed, batch_size=RELATED_QUERY_BATCH):
+    '''Returns the CompactUuidSet of uuids embedding updated or linking to renamed uuids'''
+    related_set = CompactUuidSet()
+    for kind, uuids in (('embedded', updated), ('linked', renamed)):
+        uuids = list(uuids)
+        for start in range(0, len(uuids), batch_size):
+            query = session.query(IndexDependency.source_rid).filter(
+                IndexDependency.kind == kind,
+                IndexDependency.target_rid.in_(uuids[start:start + batch_size]),
+            ).distinct()
+            related_set.update(rid for rid, in query)
+    return related_set
+
+
+class DependencyWriter(object):
+    '''
+    Replace the index_dependencies rows of written documents
+
+    The indexer renders documents in a read only snapshot transaction, so
+    by default rows are committed over a connection of their own.  Pass a
+    connection to write in a savepoint of its transaction instead.  Call
+    rendered with each document, written once its elasticsearch write
+    finished and flush at the end.  Only successful writes are recorded, a
+    conflict means a newer render of the document is indexed and has its
+    own rows.
+    '''
+    def __init__(self, registry, batch_size=DEPENDENCY_WRITE_BATCH, connection=None):
+        self.registry = registry
+        self.batch_size = batch_size
+        self.connection = connection
+        self._rendered = {}
+        self._pending = {}
+
+    def rendered(self, uuid, doc):
+        self._rendered[str(uuid)] = (
+            doc.get('embedded_uuids', ()),
+            doc.get('linked_uuids', ()),
+        )
+
+    def written(self, uuid, last_exc, conflict=False):
+        dependencies = self._rendered.pop(str(uuid), None)
+        if dependencies is None or last_exc or conflict:
+            return
+        self._pending[str(uuid)] = dependencies
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pending = self._pending
+        self._pending = {}
+        if not pending:
+            return
+        table = IndexDependency.__table__
+        rows = [
+            {'source': source, 'kind': kind, 'target': target}
+            for source, (embedded, linked) in pending.items()
+            for kind, targets in (('embedded', embedded), ('linked', linked))
+            for target in targets
+        ]
+        connection = self.connection
+        if connection is None:
+            connection = self.registry[DBSESSION]().get_bind().connect()
+        try:
+            begin = connection.begin if self.connection is None else connection.begin_nested
+            with begin():
+                connection.execute(table.delete().where(table.c.source.in_(list(pending))))
+                if rows:
+                    connection.execute(table.insert(), rows)
+        except Exception:  # pylint: disable=broad-except
+            log.error('Error writing index dependencies of %d documents', len(pending), exc_info=True)
+        finally:
+            if self.connection is None:
+                connection.close()
@@ -3,6 +3,7 @@ import boto3
 
 from botocore.config import Config
 from botocore.exceptions import ClientError
+from elasticsearch.helpers import scan
 from elasticsearch.exceptions import (
     ConflictError,
     ConnectionError,
@@ -27,6 +28,7 @@ from .interfaces import (
     RESOURCES_INDEX,
 )
 from .indexer_state import (
+    DoneCheckpoint,
     IndexerState,
     all_uuids,
     all_types,
@@ -36,7 +38,17 @@ from .indexer_state import (
     INDEXING_NODE_INDEX,
     AWS_REGION,
 )
+from .bulk_indexer import (
+    get_bulk_options,
+    get_bulk_writer,
+)
+from .index_dependencies import (
+    DependencyWriter,
+    get_related_uuids_from_db,
+    use_dependency_table,
+)
 from .simple_queue import SimpleUuidServer
+from .uuid_set import CompactUuidSet
 
 import datetime
 import logging
@@ -51,6 +63,8 @@ es_logger.setLevel(logging.ERROR)
 log = logging.getLogger('snovault.elasticsearch.es_index_listener')
 MAX_CLAUSES_FOR_ES = 8192
 DEFAULT_QUEUE = 'Simple'
+# Seconds between queue checks while only remote workers are indexing
+_REMOTE_WORKER_POLL = 1
 # Allow three minutes for indexer to stop before head indexer process continues
 _REMOTE_INDEXING_SHUTDOWN_SLEEP = 3*60
 # Allow indexer to remain up for 30 minutes after indexing before being shutdown
@@ -92,71 +106,62 @@ def includeme(config):
             registry[INDEXER] = Indexer(registry)
 
 
+def get_related_full_reindex_ratio(settings):
+    '''Fraction of indexed documents related to an edit that triggers a full reindex'''
+    return float(settings.get('indexer.related_full_reindex_ratio', 0.5))
+
+
+def get_resume_interrupted_cycle(settings):
+    '''Is indexer.resume_interrupted_cycle on'''
+    return asbool(settings.get('indexer.resume_interrupted_cycle', False))
+
+
 def get_related_uuids(request, es, updated, renamed):
-    '''Returns (set of uuids, False) or (list of all uuids, True) if full reindex triggered'''
+    '''Returns (CompactUuidSet, False) or (list of all uuids, True) if full reindex triggered'''
 
     updated_count = len(updated)
     renamed_count = len(renamed)
-    if (updated_count + renamed_count) > MAX_CLAUSES_FOR_ES:
-        return (list(all_uuids(request.registry)), True)  # guaranteed unique
-    elif (updated_count + renamed_count) == 0:
-        return (set(), False)
+    if use_dependency_table(request.registry.settings):
+        session = request.registry[DBSESSION]()
+        return (get_related_uuids_from_db(session, updated, renamed), False)
+    if (updated_count + renamed_count) == 0:
+        return (CompactUuidSet(), False)
 
     es.indices.refresh(RESOURCES_INDEX)
 
-    # TODO: batching may allow us to drive a partial reindexing much greater than 99999
-    #BATCH_COUNT = 100  # NOTE: 100 random uuids returned > 99999 results!
-    #beg = 0
-    #end = BATCH_COUNT
-    #related_set = set()
-    #updated_list = list(updated)  # Must be lists
-    #renamed_list = list(renamed)
-    #while updated_count > beg or renamed_count > beg:
-    #    if updated_count > end or beg > 0:
-    #        log.error('Indexer looking for related uuids by BATCH[%d,%d]' % (beg, end))
-    #
-    #    updated = []
-    #    if updated_count > beg:
-    #        updated = updated_list[beg:end]
-    #    renamed = []
-    #    if renamed_count > beg:
-    #        renamed = renamed_list[beg:end]
-    #
-    #     search ...
-    #     accumulate...
-    #
-    #    beg += BATCH_COUNT
-    #    end += BATCH_COUNT
-
-    query = {
-        'query': {
-            'bool': {
-                'should': [
-                    {
-                        'terms': {
-                            'embedded_uuids': updated,
-                            '_cache': False,
-                        },
-                    },
-                    {
-                        'terms': {
-                            'linked_uuids': renamed,
-                            '_cache': False,
+    # Only give up on a partial reindex once it would touch most documents
+    ratio = get_related_full_reindex_ratio(request.registry.settings)
+    max_related = int(es.count(index=RESOURCES_INDEX)['count'] * ratio)
+
+    related_set = CompactUuidSet()
+    for field, uuids in (('embedded_uuids', updated), ('linked_uuids', renamed)):
+        uuids = list(uuids)
+        for start in range(0, len(uuids), MAX_CLAUSES_FOR_ES):
+            query = {
+                'query': {
+                    'bool': {
+                        'filter': {
+                            'terms': {field: uuids[start:start + MAX_CLAUSES_FOR_ES]},
                         },
                     },
-                ],
-            },
-        },
-        '_source': False,
-    }
-    res = es.search(index=RESOURCES_INDEX, size=SEARCH_MAX, request_timeout=60, body=query)
+                },
+                '_source': False,
+            }
+            for hit in scan(es, query=query, index=RESOURCES_INDEX, request_timeout=60):
+                related_set.add(hit['_id'])
+            if len(related_set) > max_related:
+                log.info(
+                    'Full reindex, %d related uuids is over %.2f of documents',
+                    len(related_set), ratio,
+                )
+                return (list(all_uuids(request.registry)), True)  # guaranteed unique
 
-    if res['hits']['total'] > SEARCH_MAX:
-        return (list(all_uuids(request.registry)), True)  # guaranteed unique
+    return (related_set, False)
 
-    related_set = {hit['_id'] for hit in res['hits']['hits']}
 
-    return (related_set, False)
+def get_render_batch_size(settings):
+    '''Number of uuids rendered per @@index-data-batch embed, 0 is off'''
+    return int(settings.get('indexer.render_batch_size', 0))
 
 
 def _determine_indexing_protocol(request, uuid_count):
@@ -376,13 +381,23 @@ def index(request):
         snapshot_id = None
         (xmin, invalidated, restart) = indexer_state.priority_cycle(request)
         indexer_state.log_reindex_init_state()
-        # OPTIONAL: restart support
-        if restart:  # Currently not bothering with restart!!!
+        if restart and not get_resume_interrupted_cycle(request.registry.settings):
             xmin = -1
             invalidated = []
-        # OPTIONAL: restart support
+            restart = False
 
+        last_xmin = None
+        if restart:
+            # Resume the interrupted cycle at its xmin with the uuids not yet done
+            last_xmin = indexer_state.get().get('last_xmin')
         result = indexer_state.get_initial_state()  # get after checking priority!
+        if restart:
+            log.info('%s resuming interrupted cycle with %d uuids', indexer_state.title, len(invalidated))
+            result.update(
+                xmin=xmin,
+                last_xmin=last_xmin,
+                resumed=len(invalidated),
+            )
 
         if xmin == -1 or len(invalidated) == 0:
             xmin = get_current_xmin(request)
@@ -410,7 +425,7 @@ def index(request):
                 last_xmin=last_xmin,
             )
 
-        if len(invalidated) > SEARCH_MAX:  # Priority cycle already set up
+        if restart or len(invalidated) > SEARCH_MAX:  # Priority cycle already set up
             flush = True
         else:
 
@@ -424,9 +439,9 @@ def index(request):
                     TransactionRecord.xid >= last_xmin,
                 )
 
-                invalidated = set(invalidated)  # not empty if API index request occurred
-                updated = set()
-                renamed = set()
+                invalidated = CompactUuidSet(invalidated)  # not empty if API index request occurred
+                updated = CompactUuidSet()
+                renamed = CompactUuidSet()
                 max_xid = 0
                 txn_count = 0
                 for txn in txns.all():
@@ -440,7 +455,7 @@ def index(request):
                     updated.update(txn.data.get('updated', ()))
 
                 if invalidated:        # reindex requested, treat like updated
-                    updated |= invalidated
+                    updated.update(invalidated)
 
                 result['txn_count'] = txn_count
                 if txn_count == 0 and len(invalidated) == 0:
@@ -452,7 +467,7 @@ def index(request):
                 is_testing_full = request.json.get('is_testing_full', False)
                 if is_testing and is_testing_full:
                     full_reindex = False
-                    related_set = set(all_uuids(request.registry))
+                    related_set = CompactUuidSet(all_uuids(request.registry))
                 else:
                     (related_set, full_reindex) = get_related_uuids(request, request.registry[ELASTIC_SEARCH], updated, renamed)
                 if full_reindex:
@@ -462,8 +477,8 @@ def index(request):
                     invalidated = related_set | updated
                     result.update(
                         max_xid=max_xid,
-                        renamed=renamed,
-                        updated=updated,
+                        renamed=list(renamed),
+                        updated=list(updated),
                         referencing=len(related_set),
                         invalidated=len(invalidated),
                         txn_count=txn_count
@@ -492,20 +507,25 @@ def index(request):
             restart,
             xmin,
         ):
-        if len(stage_for_followup) > 0:
+        if len(stage_for_followup) > 0 and not restart:
             # Note: undones should be added before, because those uuids will (hopefully) be indexed in this cycle
+            # A resumed cycle keeps the prep list of the interrupted one
             indexer_state.prep_for_followup(xmin, invalidated)
 
         result = indexer_state.start_cycle(invalidated, result)
 
         # Do the work...
 
+        done_checkpoint = None
+        if get_resume_interrupted_cycle(request.registry.settings):
+            done_checkpoint = DoneCheckpoint(indexer_state)
         indexing_update_infos, errors, err_msg = request.registry[INDEXER].serve_objects(
             request,
             invalidated,
             xmin,
             snapshot_id=snapshot_id,
             restart=restart,
+            done_checkpoint=done_checkpoint,
         )
         if err_msg:
             log.warning('Could not start indexing: %s', err_msg)
@@ -667,6 +687,9 @@ class Indexer(object):
         self.chunk_size = None
         self.batch_size = None
         self.worker_runs = []
+        self.bulk_options = get_bulk_options(registry.settings)
+        self.render_batch_size = get_render_batch_size(registry.settings)
+        self.dependency_table = use_dependency_table(registry.settings)
         if registry.settings.get('indexer'):
             self._setup_queues(registry)
 
@@ -747,6 +770,10 @@ class Indexer(object):
         queue_worker_get_size = int(
             registry.settings.get('queue_worker_get_size', 2000000)
         )
+        # Seconds a worker may hold a batch before it is requeued, 0 is off
+        queue_lease_timeout = int(
+            registry.settings.get('queue_lease_timeout', 0)
+        )
         # Only Used for Redis Queues
         queue_host = registry.settings.get('queue_host', 'localhost')
         queue_port = registry.settings.get('queue_port', 6379)
@@ -757,6 +784,7 @@ class Indexer(object):
             'chunk_size': queue_worker_chunk_size,
             'batch_size': queue_worker_batch_size,
             'get_size': queue_worker_get_size,
+            'lease_timeout': queue_lease_timeout,
             'host': queue_host,
             'port': queue_port,
             'db': queue_db,
@@ -791,9 +819,11 @@ class Indexer(object):
                 return err_msg + 'Cannot failover to simple queue'
         return None
 
-    def _serve_objects_load_uuids(self, uuids):
+    def _serve_objects_load_uuids(self, uuids, run_args=None):
         err_msg = None
         try:
+            if run_args and self.queue_type != DEFAULT_QUEUE:
+                self.queue_server.set_run_args(run_args)
             uuids_loaded_len = self.queue_server.load_uuids(uuids)
             if not uuids_loaded_len:
                 err_msg = 'Uuids given to Indexer.serve_objects failed to load'
@@ -821,6 +851,7 @@ class Indexer(object):
             snapshot_id=None,
             restart=False,
             timeout=None,
+            done_checkpoint=None,
         ):
         '''Run indexing process with queue server and optional worker'''
         # pylint: disable=too-many-arguments
@@ -842,7 +873,15 @@ class Indexer(object):
                 len(short_uuids)
             )
             uuids = short_uuids
-        err_msg = self._serve_objects_load_uuids(uuids)
+        # Remote workers, see indexer_worker, index with the same run args
+        run_args = {
+            'batch_by': self.batch_size,
+            'restart': restart,
+            'snapshot_id': snapshot_id,
+            'uuid_len': 36,
+            'xmin': xmin,
+        }
+        err_msg = self._serve_objects_load_uuids(uuids, run_args=run_args)
         if err_msg:
             return None, errors, err_msg
         # Run Process Loop
@@ -853,7 +892,7 @@ class Indexer(object):
             if self.queue_worker and not self.queue_worker.is_running:
                 # Server Worker
                 update_infos, uuids_ran = self.run_worker(
-                    request, xmin, snapshot_id, restart
+                    request, xmin, snapshot_id, restart, done_checkpoint=done_checkpoint
                 )
                 if not uuids_ran:
                     break
@@ -861,6 +900,8 @@ class Indexer(object):
                     'worker_id':self.queue_worker.worker_id,
                     'uuids': uuids_ran,
                 })
+            elif not self.queue_worker:
+                time.sleep(_REMOTE_WORKER_POLL)
             # Handling Errors must happen or queue will not stop
             batch_errors = self.queue_server.pop_errors()
             for error in batch_errors:
@@ -871,7 +912,7 @@ class Indexer(object):
         self.queue_server.close_indexing()
         return update_infos, errors, err_msg
 
-    def run_worker(self, request, xmin, snapshot_id, restart):
+    def run_worker(self, request, xmin, snapshot_id, restart, done_checkpoint=None):
         '''Run the uuid queue worker'''
         batch_uuids = self.queue_worker.get_uuids(get_all=False)
         log.warning(
@@ -888,6 +929,7 @@ class Indexer(object):
                 xmin,
                 snapshot_id=snapshot_id,
                 restart=restart,
+                done_checkpoint=done_checkpoint,
             )
             update_infos.extend(batch_update_infos)
             batch_results = {
@@ -910,25 +952,39 @@ class Indexer(object):
             xmin,
             snapshot_id=None,
             restart=False,
+            done_checkpoint=None,
         ):
         # pylint: disable=too-many-arguments, unused-argument
-        '''Run indexing process on uuids'''
+        '''Run indexing process on uuids, checkpointing indexed uuids if done_checkpoint'''
         errors = []
         update_infos = []
-        for i, uuid in enumerate(uuids):
-            update_info = self.update_object(self.es, request, uuid, xmin)
+        update_info_gen = self.update_object_chunk(
+            self.es,
+            request,
+            uuids,
+            xmin,
+            bulk_options=self.bulk_options,
+            render_batch_size=self.render_batch_size,
+            restart=restart,
+            dependency_table=self.dependency_table,
+        )
+        for i, update_info in enumerate(update_info_gen):
             update_info['return_time'] = time.time()
             update_infos.append(update_info)
             error = update_info.get('error')
             if error is not None:
                 print('Error', error)
                 errors.append(error)
+            elif done_checkpoint is not None:
+                done_checkpoint.add(update_info['uuid'])
             if (i + 1) % 1000 == 0:
                 log.info('Indexing %d', i + 1)
+        if done_checkpoint is not None:
+            done_checkpoint.flush()
         return update_infos, errors
 
     @staticmethod
-    def update_object(encoded_es, request, uuid, xmin, restart=False):
+    def _get_update_info(uuid, xmin):
         update_info = {
             'uuid': uuid,
             'xmin': xmin,
@@ -938,21 +994,34 @@ class Indexer(object):
             'error': None,
             'return_time': None,
         }
-        req_info = {
+        update_info['req_info'] = {
             'start_time': None,
             'end_time': None,
             'run_time': None,
             'errors': [],
             'url': None
         }
-        es_info = {
+        update_info['es_info'] = {
             'start_time': None,
             'end_time': None,
             'run_time': None,
             'backoffs': {},
             'item_type': None,
+            'conflict': False,
         }
+        return update_info
+
+    @staticmethod
+    def render_object(request, uuid, xmin):
+        '''
+        Render the index-data document for uuid
+
+        Returns (update_info, doc, last_exc) where doc is None on error.
+        '''
+        update_info = Indexer._get_update_info(uuid, xmin)
+        req_info = update_info['req_info']
         request.datastore = 'database'
+        doc = None
         last_exc = None
         req_info['start_time'] = time.time()
         backoff = 0
@@ -975,75 +1044,230 @@ class Indexer(object):
             )
         req_info['end_time'] = time.time()
         req_info['run_time'] = req_info['end_time'] - req_info['start_time']
-        if last_exc is None:
-            es_info['start_time'] = time.time()
-            es_info['item_type'] = doc['item_type']
-            do_break = False
-            for backoff in [0, 10, 20, 40, 80]:
-                time.sleep(backoff)
-                backoff_info = {
-                    'start_time': time.time(),
-                    'end_time': None,
-                    'run_time': None,
-                    'error': None,
-                }
-                try:
-                    encoded_es.index(
-                        index=doc['item_type'], doc_type=doc['item_type'], body=doc,
-                        id=str(uuid), version=xmin, version_type='external_gte',
-                        request_timeout=30,
-                    )
-                except StatementError:
-                    # Can't reconnect until invalid transaction is rolled back
-                    raise
-                except ConflictError:
-                    msg = 'Conflict indexing %s at version %d' % (uuid, xmin)
-                    log.warning(msg)
-                    backoff_info['error'] = {
-                        'msg': msg,
-                        'last_exc': None,
-                    }
-                    do_break = True
-                except (ConnectionError, ReadTimeoutError, TransportError) as e:
-                    msg = 'Retryable error indexing %s: %r' % (uuid, e)
-                    log.warning(msg)
-                    last_exc = repr(e)
-                    backoff_info['error'] = {
-                        'msg': msg,
+        return update_info, doc, last_exc
+
+    @staticmethod
+    def render_object_batch(request, uuids, xmin):
+        '''
+        Render index-data documents for uuids with one @@index-data-batch embed
+
+        Yields the same (update_info, doc, last_exc) tuples as render_object.
+        Falls back to rendering one uuid at a time if the batch fails.
+        '''
+        request.datastore = 'database'
+        batch_url = '/@@index-data-batch?' + '&'.join(
+            'uuid=%s' % uuid for uuid in uuids
+        )
+        try:
+            results = request.embed(batch_url, as_user='INDEXER')['results']
+        except StatementError:
+            # Can't reconnect until invalid transaction is rolled back
+            raise
+        except Exception:  # pylint: disable=broad-except
+            log.warning(
+                'Error rendering batch of %d uuids, rendering one at a time',
+                len(uuids),
+                exc_info=True,
+            )
+            for uuid in uuids:
+                yield Indexer.render_object(request, uuid, xmin)
+            return
+        for result in results:
+            uuid = result['uuid']
+            update_info = Indexer._get_update_info(uuid, xmin)
+            req_info = update_info['req_info']
+            req_info['url'] = '/%s/@@index-data/' % uuid
+            req_info['start_time'] = result['start_time']
+            req_info['end_time'] = result['end_time']
+            req_info['run_time'] = result['end_time'] - result['start_time']
+            last_exc = result['error']
+            if last_exc is not None:
+                req_info['errors'].append(
+                    {
+                        'backoff': 0,
+                        'msg': 'Error rendering /%s/@@index-data' % uuid,
                         'last_exc': last_exc,
                     }
-                except Exception as e:
-                    msg = 'Error indexing %s' % (uuid)
-                    log.error(msg, exc_info=True)
-                    last_exc = repr(e)
-                    backoff_info['error'] = {
-                        'msg': msg,
-                        'last_exc': None,
-                    }
-                    do_break = True
-                else:
-                    # Get here on success and outside of try
-                    do_break = True
-                end_time = time.time()
-                backoff_info['end_time'] = end_time
-                backoff_info['run_time'] = end_time - backoff_info['start_time']
-                es_info['backoffs'][str(backoff)] = backoff_info
-                if do_break:
-                    break
-            es_info['end_time'] = time.time()
-            es_info['run_time'] = es_info['end_time'] - es_info['start_time']
-        update_info['req_info'] = req_info
-        update_info['es_info'] = es_info
+                )
+            yield update_info, result['document'], last_exc
+
+    @staticmethod
+    def render_objects(request, uuids, xmin, batch_size=None):
+        '''Yields render_object results, batch_size uuids per embed if set'''
+        if not batch_size or batch_size < 2:
+            for uuid in uuids:
+                yield Indexer.render_object(request, uuid, xmin)
+            return
+        uuids = list(uuids)
+        for start in range(0, len(uuids), batch_size):
+            yield from Indexer.render_object_batch(
+                request, uuids[start:start + batch_size], xmin
+            )
+
+    @staticmethod
+    def index_object(encoded_es, update_info, doc, xmin):
+        '''Write a rendered document to elasticsearch, returns last_exc'''
+        uuid = update_info['uuid']
+        es_info = update_info['es_info']
+        last_exc = None
+        es_info['start_time'] = time.time()
+        es_info['item_type'] = doc['item_type']
+        do_break = False
+        for backoff in [0, 10, 20, 40, 80]:
+            time.sleep(backoff)
+            backoff_info = {
+                'start_time': time.time(),
+                'end_time': None,
+                'run_time': None,
+                'error': None,
+            }
+            try:
+                encoded_es.index(
+                    index=doc['item_type'], doc_type=doc['item_type'], body=doc,
+                    id=str(uuid), version=xmin, version_type='external_gte',
+                    request_timeout=30,
+                )
+            except StatementError:
+                # Can't reconnect until invalid transaction is rolled back
+                raise
+            except ConflictError:
+                msg = 'Conflict indexing %s at version %d' % (uuid, xmin)
+                log.warning(msg)
+                backoff_info['error'] = {
+                    'msg': msg,
+                    'last_exc': None,
+                }
+                # A newer render is already indexed
+                es_info['conflict'] = True
+                do_break = True
+            except (ConnectionError, ReadTimeoutError, TransportError) as e:
+                msg = 'Retryable error indexing %s: %r' % (uuid, e)
+                log.warning(msg)
+                last_exc = repr(e)
+                backoff_info['error'] = {
+                    'msg': msg,
+                    'last_exc': last_exc,
+                }
+            except Exception as e:
+                msg = 'Error indexing %s' % (uuid)
+                log.error(msg, exc_info=True)
+                last_exc = repr(e)
+                backoff_info['error'] = {
+                    'msg': msg,
+                    'last_exc': None,
+                }
+                do_break = True
+            else:
+                # Get here on success and outside of try
+                do_break = True
+            end_time = time.time()
+            backoff_info['end_time'] = end_time
+            backoff_info['run_time'] = end_time - backoff_info['start_time']
+            es_info['backoffs'][str(backoff)] = backoff_info
+            if do_break:
+                break
+        es_info['end_time'] = time.time()
+        es_info['run_time'] = es_info['end_time'] - es_info['start_time']
+        return last_exc
+
+    @staticmethod
+    def finish_update_info(update_info, last_exc):
+        '''Set the error and end times of a rendered and written uuid'''
         if last_exc:
             update_info['error'] = {
                 'error_message': last_exc,
                 'timestamp': datetime.datetime.now().isoformat(),
-                'uuid': str(uuid)
+                'uuid': str(update_info['uuid'])
             }
         end_time = time.time()
         update_info['end_time'] = end_time
         update_info['run_time'] = end_time - update_info['start_time']
         return update_info
 
+    @staticmethod
+    def update_object(encoded_es, request, uuid, xmin, restart=False, dependency_table=False):
+        # pylint: disable=too-many-arguments
+        update_infos = list(
+            Indexer.update_object_chunk(
+                encoded_es,
+                request,
+                [uuid],
+                xmin,
+                restart=restart,
+                dependency_table=dependency_table,
+            )
+        )
+        return update_infos[0]
+
+    @staticmethod
+    def update_object_chunk(
+            encoded_es,
+            request,
+            uuids,
+            xmin,
+            bulk_options=None,
+            render_batch_size=None,
+            restart=False,
+            dependency_table=False,
+        ):
+        # pylint: disable=too-many-arguments, unused-argument
+        '''
+        Render and write a chunk of uuids
+
+        Documents are rendered render_batch_size at a time and written with
+        the _bulk api if bulk_options are given.  Update infos are yielded as
+        their documents are written, so they may come back in a different
+        order than uuids.  With dependency_table the embedded and linked
+        uuids of written documents are recorded for invalidation.
+        '''
+        rendered = Indexer.render_objects(
+            request, uuids, xmin, batch_size=render_batch_size
+        )
+        dependency_writer = None
+        if dependency_table:
+            dependency_writer = DependencyWriter(request.registry)
+            rendered = Indexer._track_dependencies(rendered, dependency_writer)
+        written = Indexer._write_objects(encoded_es, rendered, xmin, bulk_options)
+        for update_info, last_exc in written:
+            if dependency_writer is not None:
+                dependency_writer.written(
+                    update_info['uuid'],
+                    last_exc,
+                    conflict=update_info['es_info'].get('conflict', False),
+                )
+            yield Indexer.finish_update_info(update_info, last_exc)
+        if dependency_writer is not None:
+            dependency_writer.flush()
+
+    @staticmethod
+    def _track_dependencies(rendered, dependency_writer):
+        for update_info, doc, last_exc in rendered:
+            if last_exc is None:
+                dependency_writer.rendered(update_info['uuid'], doc)
+            yield update_info, doc, last_exc
+
+    @staticmethod
+    def _write_objects(encoded_es, rendered, xmin, bulk_options=None):
+        '''Yields (update_info, last_exc) as rendered documents are written'''
+        if not bulk_options:
+            for update_info, doc, last_exc in rendered:
+                if last_exc is None:
+                    last_exc = Indexer.index_object(encoded_es, update_info, doc, xmin)
+                yield update_info, last_exc
+            return
+        bulk_indexer = get_bulk_writer(encoded_es, xmin, **bulk_options)
+        try:
+            for update_info, doc, last_exc in rendered:
+                if last_exc is not None:
+                    yield update_info, last_exc
+                    continue
+                yield from bulk_indexer.add(update_info, doc)
+        except BaseException:
+            # Write what is buffered and stop any writer thread, the
+            # finished writes are lost with the exception
+            bulk_indexer.flush()
+            raise
+        yield from bulk_indexer.flush()
+
     def shutdown(self):
         pass
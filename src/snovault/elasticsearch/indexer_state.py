@@ -23,6 +23,7 @@ from .interfaces import (
     ELASTIC_SEARCH,
     INDEXER
 )
+from .uuid_set import CompactUuidSet
 import datetime
 import logging
 import pytz
@@ -38,6 +39,9 @@ import socket
 AWS_REGION = 'us-west-2'
 _HOSTNAME = socket.gethostname()
 SEARCH_MAX = 99999  # OutOfMemoryError if too high
+LIST_CHUNK_SIZE = 10000  # Entries per chunk document of an IndexerState list
+UUID_CHUNK_SIZE = 100000  # Uuids per compressed chunk document
+DONE_CHECKPOINT_SIZE = 10000  # Indexed uuids buffered before appending to the done set
 HEAD_NODE_INDEX = 'head_node'
 INDEXING_NODE_INDEX = 'indexing_node'
 
@@ -76,6 +80,17 @@ def _get_this_instance_name(instance_name=None):
     return instance_name, instance_state
 
 
+def _chunked(vals, chunk_size):
+    chunk = []
+    for val in vals:
+        chunk.append(val)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def setup_indexing_nodes(request, indexer_state, reset=False):
     time_now = float(time.time())
     did_fail = False
@@ -162,11 +177,11 @@ class IndexerState(object):
         self.state_id        = self.title + '_indexer'       # State of the current or last cycle
         self.todo_set        = self.title + '_in_progress'   # one cycle of uuids, sent to the Secondary Indexer
         #self.failed_set      = self.title + '_failed'
-        #self.done_set        = self.title + '_done'          # Trying to get all uuids from 'todo' to this set
+        self.done_set        = self.title + '_done'          # uuids of this cycle checkpointed as indexed
         self.troubled_set    = self.title + '_troubled'      # uuids that failed to index in any cycle
         self.last_set        = self.title + '_last_cycle'    # uuids in the most recent finished cycle
         self.success_set     = None                          # None is the same as self.done_set
-        self.cleanup_this_cycle = [self.todo_set]  # ,self.failed_set,self.done_set]  # Clean up at end of current cycle
+        self.cleanup_this_cycle = [self.todo_set,self.done_set]  # ,self.failed_set]  # Clean up at end of current cycle
         self.cleanup_last_cycle = [self.last_set,self.troubled_set]              # Clean up at beginning of next cycle
         self.override           = 'reindex_' + self.title      # If exists then reindex all
         # DO NOT INHERIT! These keys are for passing on to other indexers
@@ -227,51 +242,126 @@ class IndexerState(object):
 
     def delete_objs(self, ids, doc_type='meta'):
         for id in ids:
-            try:
-                self.es.delete(index=self.index, doc_type=doc_type, id=id)
-            except:
-                pass
+            # Chunked lists also remove their chunk documents
+            chunk_ids = [
+                self._chunk_id(id, chunk)
+                for chunk in range(len(self.get_obj(id, doc_type).get('sizes', [])))
+            ]
+            for obj_id in chunk_ids + [id]:
+                try:
+                    self.es.delete(index=self.index, doc_type=doc_type, id=obj_id)
+                except:
+                    pass
+
+    # Lists are stored as a head document {'sizes': [...], 'count': n} and
+    # chunk documents of at most LIST_CHUNK_SIZE entries, so they can be
+    # appended to and paged without reading or writing one giant document.
+    # Head documents with the entries in them are from before chunking.
+    @staticmethod
+    def _chunk_id(id, chunk):
+        return '%s:chunk:%d' % (id, chunk)
+
+    @staticmethod
+    def _chunk_values(obj):
+        if 'uuids' in obj:
+            return list(CompactUuidSet.decode(obj['uuids']))
+        return obj.get('list',[])
+
+    def _write_chunks(self, id, vals, head, chunk_size=None, packed=False):
+        '''Appends chunk documents of vals after those of head, then saves head'''
+        sizes = head.setdefault('sizes', [])
+        for chunk in _chunked(vals, chunk_size or LIST_CHUNK_SIZE):
+            if packed:
+                chunk = CompactUuidSet(chunk)
+                obj = {'uuids': chunk.encode()}
+            else:
+                obj = {'list': chunk}
+            self.put_obj(self._chunk_id(id, len(sizes)), obj)
+            sizes.append(len(chunk))
+        head['count'] = sum(sizes)
+        self.put_obj(id, head)
+        return head
+
+    def iter_list(self, id):
+        '''Yields the list one chunk document at a time'''
+        head = self.get_obj(id)
+        if 'sizes' not in head:
+            yield from self._chunk_values(head)
+            return
+        for chunk in range(len(head['sizes'])):
+            yield from self._chunk_values(self.get_obj(self._chunk_id(id, chunk)))
 
     def get_list(self, id):
-        return self.get_obj(id).get('list',[])
+        return list(self.iter_list(id))
+
+    def get_page(self, id, start, count):
+        '''Returns count entries from start, only reading the chunks they are in'''
+        head = self.get_obj(id)
+        if 'sizes' not in head:
+            return self._chunk_values(head)[start:start + count]
+        page = []
+        offset = 0
+        for chunk, size in enumerate(head['sizes']):
+            if offset + size > start and len(page) < count:
+                vals = self._chunk_values(self.get_obj(self._chunk_id(id, chunk)))
+                page.extend(vals[max(start - offset, 0):max(start - offset, 0) + count - len(page)])
+            offset += size
+        return page
 
     def get_count(self, id):
         return self.get_obj(id).get('count',0)
 
     def put_list(self, id, a_list):
-        return self.put_obj(id, { 'list': a_list, 'count': len(a_list) })
-
-    #def get_diff(self,orig_id, subtract_ids):
-    #    result_set = set(self.get_list(orig_id))
-    #
-    #    if len(result_set) > 0:
-    #        for id in subtract_ids:
-    #            subtract_list = self.get_list(id)
-    #            if len(subtract_list):
-    #                result_set = result_set.difference(set(subtract_list))
-    #    return result_set
+        self.delete_objs([id])
+        return self._write_chunks(id, a_list, {})
+
+    def put_uuid_set(self, id, uuids):
+        '''Stores uuids in compressed chunks, get_list returns them in sorted order'''
+        if not isinstance(uuids, CompactUuidSet):
+            uuids = CompactUuidSet(uuids)
+        self.delete_objs([id])
+        return self._write_chunks(id, uuids, {}, chunk_size=UUID_CHUNK_SIZE, packed=True)
+
+    def get_diff(self, orig_id, subtract_ids):
+        '''Returns a CompactUuidSet of the uuids in orig_id and not in subtract_ids'''
+        result_set = CompactUuidSet(self.iter_list(orig_id))
+        if len(result_set) > 0:
+            for id in subtract_ids:
+                if self.get_count(id):
+                    result_set = result_set - CompactUuidSet(self.iter_list(id))
+        return result_set
 
     def set_add(self, id, vals):
-        set_to_update = set(self.get_list(id))
-        if len(set_to_update) > 0:
-            set_to_update.update(vals)
-        else:
-            set_to_update = set(vals)
-        self.put_list(id, set_to_update)
-
-    def list_extend(self, id, vals):
-        list_to_extend = self.get_list(id)
-        if len(list_to_extend) > 0:
-            list_to_extend.extend(vals)  # TODO: consider capping at SEARCH_MAX (keeping count but not uuids).  Requires followup handoff work.
-        else:
-            list_to_extend = vals
-
-        self.put_list(id, list_to_extend)
+        existing = set(self.iter_list(id))
+        new_vals = []
+        for val in vals:
+            if val not in existing:
+                existing.add(val)
+                new_vals.append(val)
+        if new_vals:
+            self.list_extend(id, new_vals)
+
+    def list_extend(self, id, vals, packed=False):
+        '''Appends chunks, only the head document is read'''
+        head = self.get_obj(id)
+        if 'sizes' not in head:
+            # Rewrite a list from before chunking along with the new entries
+            vals = chain(self._chunk_values(head), vals)
+            head = {}
+        if packed:
+            return self._write_chunks(id, vals, head, chunk_size=UUID_CHUNK_SIZE, packed=True)
+        return self._write_chunks(id, vals, head)
 
     def rename_objs(self, from_id, to_id):
-        val = self.get_list(from_id)
-        if val:
-            self.put_list(to_id, val)
+        head = self.get_obj(from_id)
+        if head.get('count'):
+            self.delete_objs([to_id])
+            for chunk in range(len(head.get('sizes', []))):
+                self.put_obj(
+                    self._chunk_id(to_id, chunk),
+                    self.get_obj(self._chunk_id(from_id, chunk)),
+                )
+            self.put_obj(to_id, head)
             self.delete_objs([from_id])
 
     # Public access...
@@ -396,10 +486,11 @@ class IndexerState(object):
         if xmin == -1:  # or snapshot is None:
             return (-1, [], False)
 
-        #assert(self.get_count(self.done_set) == 0)  # Valid for cycle-level accounting only
-        #undone_uuids = self.get_diff(self.todo_set, [self.done_set])  # works for any accountingu
-        undone_uuids = self.get_list(self.todo_set)                    # works fastest for cycle-level accounting
-        if len(undone_uuids) <= 0:  # TODO SEARCH_MAX?  SEARCH_MAX/10
+        if self.get_count(self.todo_set) <= 0:  # TODO SEARCH_MAX?  SEARCH_MAX/10
+            return (-1, [], False)
+        # Only the uuids not checkpointed by a DoneCheckpoint are left
+        undone_uuids = self.get_diff(self.todo_set, [self.done_set])
+        if len(undone_uuids) <= 0:
             return (-1, [], False)
 
         # Note: do not clean up last cycle yet because we could be restarted multiple times.
@@ -408,9 +499,7 @@ class IndexerState(object):
 
     def prep_for_followup(self, xmin, uuids):
         '''Prepare a cycle of uuids for passing to a followup indexer (e.g. audits, viscache)'''
-        prep_list = [ "xmin:%s" % xmin ]
-        prep_list.extend(uuids)
-        self.put_list(self.followup_prep_list, prep_list)
+        self.put_list(self.followup_prep_list, chain([ "xmin:%s" % xmin ], uuids))
         # No need to preserve anything on the prep_list as it passes to the staged list in one cycle.
 
     def start_cycle(self, uuids, state=None):
@@ -426,7 +515,7 @@ class IndexerState(object):
         self.put(state)
         self.delete_objs(self.cleanup_last_cycle)
         self.delete_objs(self.cleanup_this_cycle)
-        self.put_list(self.todo_set, set(uuids))
+        self.put_uuid_set(self.todo_set, uuids)
         return state
 
     def add_errors(self, errors, finished=True):
@@ -445,7 +534,7 @@ class IndexerState(object):
                 #if len(troubled_uuids):
                 #    self.set_add(self.troubled_set, troubled_uuids)
                 #    # TODO: could make doubled_troubled set and use it to blacklist uuids
-                self.put_list(self.troubled_set, uuids)
+                self.put_uuid_set(self.troubled_set, uuids)
 
     def finish_cycle(self, state, errors=None):
         '''Every indexing cycle must be properly closed.'''
@@ -456,10 +545,9 @@ class IndexerState(object):
         # pass any staged items to followup
         if self.followup_prep_list is not None:
             # TODO: send signal for 'all' when appropriate.  Saves the following expensive lines.
-            hand_off_list = self.get_list(self.followup_prep_list)
-            if len(hand_off_list) > 0:  # Have to push because ready_list may still have previous cycles in it
+            if self.get_count(self.followup_prep_list) > 0:  # Have to push because ready_list may still have previous cycles in it
                 for id in self.followup_lists:
-                    self.list_extend(id, hand_off_list)
+                    self.list_extend(id, self.iter_list(self.followup_prep_list))
                     #log.warn("prmary added to %s" % id)
                 self.delete_objs([self.followup_prep_list])
 
@@ -675,8 +763,8 @@ class IndexerState(object):
 
         if uuids is not None:
             uuids_to_show = []
-            uuid_list = self.get_obj(self.todo_set)
-            if not uuid_list:
+            uuid_count = self.get_count(self.todo_set)
+            if not uuid_count:
                 uuids_to_show = 'No uuids indexing'
             else:
                 uuid_start = 0
@@ -684,21 +772,44 @@ class IndexerState(object):
                     uuid_start = int(uuids)
                 except:
                     pass
-                if uuid_start < uuid_list.get('count',0):
+                if uuid_start < uuid_count:
                     uuid_end = uuid_start+100
                     if uuid_start > 0:
                         uuids_to_show.append("... skipped first %d uuids" % (uuid_start))
-                    uuids_to_show.extend(uuid_list['list'][uuid_start:uuid_end])
-                    if uuid_list.get('count',0) > uuid_end:
-                        uuids_to_show.append("another %d uuids..." % (uuid_list.get('count',0) - uuid_end))
+                    uuids_to_show.extend(self.get_page(self.todo_set, uuid_start, uuid_end - uuid_start))
+                    if uuid_count > uuid_end:
+                        uuids_to_show.append("another %d uuids..." % (uuid_count - uuid_end))
                 elif uuid_start > 0:
-                    uuids_to_show.append("skipped past all %d uuids" % (uuid_list.get('count',0)))
+                    uuids_to_show.append("skipped past all %d uuids" % (uuid_count))
                 else:
                     uuids_to_show = 'No uuids indexing'
             display['uuids_in_progress'] = uuids_to_show
 
         return display
 
+class DoneCheckpoint(object):
+    '''
+    Appends indexed uuids to the done set of an IndexerState in batches
+
+    An interrupted cycle leaves its todo set and done set behind, so the
+    next priority_cycle resumes with only the uuids that were not done.
+    '''
+    def __init__(self, indexer_state, batch_size=DONE_CHECKPOINT_SIZE):
+        self.indexer_state = indexer_state
+        self.batch_size = batch_size
+        self._uuids = []
+
+    def add(self, uuid):
+        self._uuids.append(uuid)
+        if len(self._uuids) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._uuids:
+            self.indexer_state.list_extend(self.indexer_state.done_set, self._uuids, packed=True)
+            self._uuids = []
+
+
 @view_config(route_name='_indexer_state', request_method='GET', permission="index")
 def indexer_state_show(request):
     es = request.registry[ELASTIC_SEARCH]
@@ -0,0 +1,171 @@
+"""\
+Index uuids from a redis uuid queue served by another indexer
+
+The head indexer, with queue_server set and a redis queue_type, loads the
+invalidated uuids into the queue named queue_name and sets the xmin and
+snapshot_id run args.  Any number of these workers, on the same or other
+hosts, attach to that queue, render and index batches of uuids in the
+snapshot and report the results back to the queue.  Start one worker per
+process wanted; the head indexer needs queue_worker off to leave all the
+indexing to them.
+
+The config app section must not set indexer.
+
+Example.
+
+    %(prog)s production.ini --app-name app
+
+"""
+import atexit
+import datetime
+import logging
+import os
+import signal
+import socket
+import time
+from types import SimpleNamespace
+
+from pyramid import paster
+
+from . import mpindexer
+from .indexer import Indexer
+from .uuid_queue.adapter_queue import get_remote_worker
+
+
+log = logging.getLogger('snovault.elasticsearch.es_index_listener')
+
+EPILOG = __doc__
+DEFAULT_POLL_INTERVAL = 5
+
+
+def get_worker_id():
+    '''Worker ids name the host and process in the queue worker conns'''
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def get_queue_options(settings):
+    '''Queue options as the head Indexer reads them from settings'''
+    # pylint: disable=protected-access
+    queue_options = Indexer._get_queue_options(SimpleNamespace(settings=settings))
+    queue_options['uuid_len'] = 36
+    return queue_options
+
+
+def setup_snapshots(app):
+    '''Render in snapshots the same way the MPIndexer pool processes do'''
+    mpindexer.app = app
+    atexit.register(mpindexer.clear_snapshot)
+    signal.signal(signal.SIGALRM, mpindexer.clear_snapshot)
+
+
+def index_batch(uuids, run_args):
+    '''Index uuids with the server run args, returns the batch results'''
+    try:
+        update_infos = mpindexer.update_objects_in_snapshot((
+            uuids,
+            run_args['xmin'],
+            run_args['snapshot_id'],
+            run_args['restart'],
+        ))
+    except Exception as ecp:  # pylint: disable=broad-except
+        # Every uuid must be reported or the server waits for them
+        log.error('Error indexing batch of %d uuids', len(uuids), exc_info=True)
+        timestamp = datetime.datetime.now().isoformat()
+        errors = [
+            {'error_message': repr(ecp), 'timestamp': timestamp, 'uuid': uuid}
+            for uuid in uuids
+        ]
+    else:
+        errors = [
+            update_info['error']
+            for update_info in update_infos
+            if update_info.get('error') is not None
+        ]
+    return {
+        'errors': errors,
+        'successes': len(uuids) - len(errors),
+    }
+
+
+def run(
+        queue_name,
+        queue_type,
+        queue_options,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        worker_id=None,
+        max_batches=None,
+    ):
+    '''
+    Index batches from the latest server started as queue_name
+
+    The worker attaches again whenever a restarted server renames the
+    queue.  Runs until max_batches batches are indexed, if given.
+    '''
+    # pylint: disable=too-many-arguments, protected-access
+    worker_id = worker_id or get_worker_id()
+    queue_worker = None
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        attached = get_remote_worker(
+            queue_name,
+            queue_type,
+            queue_options,
+            worker_id,
+            current_worker=queue_worker,
+        )
+        if attached is not None and attached is not queue_worker:
+            log.warning('Indexer worker %s attached to %s', worker_id, attached._queue_name)
+        queue_worker = attached
+        run_args = queue_worker.get_run_args() if queue_worker else None
+        uuids = queue_worker.get_uuids() if run_args else []
+        if not uuids:
+            time.sleep(poll_interval)
+            continue
+        log.warning('Indexer worker %s running %d uuids', worker_id, len(uuids))
+        batch_results = index_batch(uuids, run_args)
+        err_msg = queue_worker.update_finished(batch_results)
+        if err_msg:
+            log.warning('Issue closing worker: %s', err_msg)
+        batches += 1
+    return batches
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Index uuids from a redis queue served by another indexer",
+        epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument(
+        '--queue-name', help="Queue name, defaults to queue_name in configfile")
+    parser.add_argument(
+        '--poll-interval', type=int, default=DEFAULT_POLL_INTERVAL,
+        help="Seconds to wait for uuids when the queue is empty")
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help="Print debug level logging")
+    parser.add_argument('config_uri', help="path to configfile")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    app = paster.get_app(
+        args.config_uri, args.app_name, options={'indexer_worker': 'true'},
+    )
+    if args.verbose:
+        logging.getLogger('snovault').setLevel(logging.DEBUG)
+
+    settings = app.registry.settings
+    queue_options = get_queue_options(settings)
+    queue_name = args.queue_name or queue_options['queue_name']
+    setup_snapshots(app)
+    return run(
+        queue_name,
+        settings['queue_type'],
+        queue_options,
+        poll_interval=args.poll_interval,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+'''
+Locality ordering of uuids for MPIndexer
+
+MPIndexer hands contiguous chunks of uuids to its pooled processes.  With
+indexer.locality_sort on, uuids are first ordered by item type and then by
+the link target they share with the most other uuids of the batch, so
+items embedding the same objects are rendered by the same process while
+its embed cache holds them.
+'''
+from collections import Counter
+
+from pyramid.settings import asbool
+
+
+def use_locality_sort(settings):
+    '''Is indexer.locality_sort on'''
+    return asbool(settings.get('indexer.locality_sort', False))
+
+
+def locality_order(storage, uuids, item_types=None):
+    '''
+    Returns uuids sorted by item type and most shared link target
+
+    item_types, if given, is filled with the item type of each uuid.
+    '''
+    uuids = [str(uuid) for uuid in uuids]
+    if item_types is None:
+        item_types = {}
+    targets = {}
+    for rid, item_type, target_rid in storage.get_link_targets(uuids):
+        uuid = str(rid)
+        item_types[uuid] = item_type
+        if target_rid is not None:
+            targets.setdefault(uuid, []).append(str(target_rid))
+    shared = Counter(
+        target
+        for uuid_targets in targets.values()
+        for target in uuid_targets
+    )
+
+    def locality_key(uuid):
+        hub = ''
+        uuid_targets = targets.get(uuid)
+        if uuid_targets:
+            hub = max(uuid_targets, key=lambda target: (shared[target], target))
+        return (item_types.get(uuid, ''), hub, uuid)
+
+    return sorted(uuids, key=locality_key)
@@ -2,7 +2,10 @@ import os
 from snovault import DBSESSION
 from contextlib import contextmanager
 from multiprocessing import get_context
-from multiprocessing.pool import Pool
+from multiprocessing.pool import (
+    Pool,
+    worker,
+)
 from pyramid.decorator import reify
 from pyramid.request import apply_request_extensions
 from pyramid.threadlocal import (
@@ -11,11 +14,21 @@ from pyramid.threadlocal import (
 )
 import atexit
 import logging
+import psutil
 import time
 import transaction
+from pyramid.settings import asbool
+from snovault.util import guided_chunks
+from .bulk_indexer import get_bulk_options
+from .index_dependencies import use_dependency_table
+from .locality import (
+    locality_order,
+    use_locality_sort,
+)
 from .indexer import (
     INDEXER,
     Indexer,
+    get_render_batch_size,
 )
 from .interfaces import (
     APP_FACTORY,
@@ -25,6 +38,23 @@ from .interfaces import (
 log = logging.getLogger('snovault.elasticsearch.es_index_listener')
 
 
+def get_maxtasks(settings, default):
+    '''Tasks per pooled process before it is replaced, None keeps processes'''
+    maxtasks = int(settings.get('indexer.maxtasks', default))
+    return maxtasks if maxtasks > 0 else None
+
+
+def use_adaptive_chunks(settings):
+    '''Is indexer.adaptive_chunks on'''
+    return asbool(settings.get('indexer.adaptive_chunks', False))
+
+
+def get_worker_rss_limit(settings):
+    '''Pooled process rss in bytes that has the process replaced, None is no limit'''
+    rss_limit = settings.get('indexer.worker_rss_limit')
+    return int(rss_limit) if rss_limit else None
+
+
 def includeme(config):
     if config.registry.settings.get('indexer_worker'):
         return
@@ -100,8 +130,14 @@ def snapshot(xmin, snapshot_id):
     import signal
     signal.alarm(0)
     set_snapshot(xmin, snapshot_id)
-    yield
-    signal.alarm(5)
+    try:
+        yield
+    except:
+        # A long lived process must not reuse a snapshot left broken
+        clear_snapshot()
+        raise
+    finally:
+        signal.alarm(5)
 
 
 def update_object_in_snapshot(args):
@@ -114,6 +150,7 @@ def update_object_in_snapshot(args):
             'end_time': None,
             'run_time': None,
             'pid':os.getpid(),
+            'rss': None,
         }
         update_info = Indexer.update_object(
             encoded_es,
@@ -121,31 +158,144 @@ def update_object_in_snapshot(args):
             uuid,
             xmin,
             restart=restart,
+            dependency_table=use_dependency_table(request.registry.settings),
         )
         update_info['snapshot_id'] = snapshot_id
         map_info['end_time'] = time.time()
         map_info['run_time'] = map_info['end_time'] - map_info['start_time']
+        map_info['rss'] = psutil.Process().memory_info().rss
         update_info['map_info'] = map_info
         return update_info
 
 
+def update_objects_in_snapshot(args):
+    uuids, xmin, snapshot_id, restart = args
+    with snapshot(xmin, snapshot_id):
+        request = get_current_request()
+        encoded_es = request.registry[ELASTIC_SEARCH]
+        map_info = {
+            'start_time': time.time(),
+            'end_time': None,
+            'run_time': None,
+            'pid':os.getpid(),
+            'rss': None,
+        }
+        update_infos = list(
+            Indexer.update_object_chunk(
+                encoded_es,
+                request,
+                uuids,
+                xmin,
+                bulk_options=get_bulk_options(request.registry.settings),
+                render_batch_size=get_render_batch_size(request.registry.settings),
+                restart=restart,
+                dependency_table=use_dependency_table(request.registry.settings),
+            )
+        )
+        map_info['end_time'] = time.time()
+        map_info['run_time'] = map_info['end_time'] - map_info['start_time']
+        map_info['rss'] = psutil.Process().memory_info().rss
+        for update_info in update_infos:
+            update_info['snapshot_id'] = snapshot_id
+            update_info['map_info'] = map_info
+        return update_infos
+
+
+def rss_limited_worker(inqueue, outqueue, *args, rss_limit=None):
+    '''
+    Pool worker that exits before taking a task once over rss_limit
+
+    The pool replaces the exited process as it does at maxtasksperchild,
+    and the other processes keep running.  This follows the rss_limit
+    check in snowflakes/memlimit.py, done between tasks so none is lost.
+    '''
+    process = psutil.Process()
+    get = inqueue.get
+    took_task = False
+
+    def get_below_rss_limit():
+        nonlocal took_task
+        rss = process.memory_info().rss
+        if took_task and rss > rss_limit:
+            log.info(
+                'Replacing indexer process %d, rss %d is over limit %d',
+                process.pid, rss, rss_limit,
+            )
+            # The pool worker exits on EOFError from its task queue
+            raise EOFError
+        took_task = True
+        return get()
+
+    inqueue.get = get_below_rss_limit
+    worker(inqueue, outqueue, *args)
+
+
+class RssLimitPool(Pool):
+    '''Pool replacing each process that grows past rss_limit'''
+    def __init__(self, *args, rss_limit=None, **kwargs):
+        self.rss_limit = rss_limit
+        super(RssLimitPool, self).__init__(*args, **kwargs)
+
+    def Process(self, ctx, *args, **kwds):
+        # pylint: disable=invalid-name, arguments-differ
+        if self.rss_limit:
+            kwds['target'] = rss_limited_worker
+            kwds['kwargs'] = {'rss_limit': self.rss_limit}
+        return ctx.Process(*args, **kwds)
+
+
 # Running in main process
 
+class RenderTimes(object):
+    '''Exponential moving average of render seconds per item type'''
+    def __init__(self, alpha=0.2, default=0.1):
+        self.alpha = alpha
+        self.default = default
+        self._times = {}
+
+    def record(self, update_info):
+        item_type = update_info.get('es_info', {}).get('item_type')
+        run_time = update_info.get('req_info', {}).get('run_time')
+        if item_type is None or run_time is None:
+            return
+        average = self._times.get(item_type)
+        if average is None:
+            self._times[item_type] = run_time
+        else:
+            self._times[item_type] = average + self.alpha * (run_time - average)
+
+    def estimate(self, item_type=None):
+        '''Average for item_type, the mean of all item types if unknown'''
+        if item_type in self._times:
+            return self._times[item_type]
+        if self._times:
+            return sum(self._times.values()) / len(self._times)
+        return self.default
+
+
 class MPIndexer(Indexer):
     maxtasks = 1  # pooled processes will exit and be replaced after this many tasks are completed.
 
     def __init__(self, registry, processes=None):
         super(MPIndexer, self).__init__(registry)
         self.initargs = (registry[APP_FACTORY], registry.settings,)
+        # Long lived processes keep their app and caches between tasks,
+        # each is replaced once it grows past worker_rss_limit instead.
+        self.maxtasks = get_maxtasks(registry.settings, self.maxtasks)
+        self.worker_rss_limit = get_worker_rss_limit(registry.settings)
+        self.locality_sort = use_locality_sort(registry.settings)
+        self.adaptive_chunks = use_adaptive_chunks(registry.settings)
+        self.render_times = RenderTimes()
 
     @reify
     def pool(self):
-        return Pool(
+        return RssLimitPool(
             processes=self.queue_worker.processes,
             initializer=initializer,
             initargs=self.initargs,
             maxtasksperchild=self.maxtasks,
             context=get_context('forkserver'),
+            rss_limit=self.worker_rss_limit,
         )
 
     def update_objects(
@@ -155,6 +305,7 @@ class MPIndexer(Indexer):
             xmin,
             snapshot_id=None,
             restart=False,
+            done_checkpoint=None,
         ):
         # pylint: disable=too-many-arguments, unused-argument
         '''Run multiprocess indexing process on uuids'''
@@ -165,31 +316,75 @@ class MPIndexer(Indexer):
         chunkiness = int((uuid_count - 1) / processes) + 1
         if chunkiness > chunk_size:
             chunkiness = chunk_size
-        tasks = [
-            (uuid, xmin, snapshot_id, restart)
-            for uuid in uuids
-        ]
+        item_types = {}
+        if self.locality_sort:
+            # Related uuids end up in the same chunk and so the same process
+            uuids = locality_order(self.esstorage.write, uuids, item_types=item_types)
         errors = []
         update_infos = []
         start_time = time.time()
         try:
-            for i, update_info in enumerate(
-                    self.pool.imap_unordered(
-                        update_object_in_snapshot,
-                        tasks,
-                        chunkiness)
+            if (
+                    self.adaptive_chunks or self.bulk_options or
+                    self.render_batch_size or self.dependency_table
                 ):
+                # Each task is a chunk of uuids rendered and written together,
+                # with one dependency table write per chunk
+                uuids = list(uuids)
+                if self.adaptive_chunks:
+                    # Chunks shrink with the estimated render time left
+                    chunks = guided_chunks(
+                        uuids,
+                        processes,
+                        chunk_size,
+                        cost=lambda uuid: self.render_times.estimate(item_types.get(uuid)),
+                    )
+                else:
+                    chunks = (
+                        uuids[start:start + chunkiness]
+                        for start in range(0, uuid_count, chunkiness)
+                    )
+                tasks = [
+                    (chunk, xmin, snapshot_id, restart)
+                    for chunk in chunks
+                ]
+                update_info_gen = (
+                    update_info
+                    for chunk_update_infos in self.pool.imap_unordered(
+                        update_objects_in_snapshot,
+                        tasks,
+                        1,
+                    )
+                    for update_info in chunk_update_infos
+                )
+            else:
+                tasks = [
+                    (uuid, xmin, snapshot_id, restart)
+                    for uuid in uuids
+                ]
+                update_info_gen = self.pool.imap_unordered(
+                    update_object_in_snapshot,
+                    tasks,
+                    chunkiness,
+                )
+            for i, update_info in enumerate(update_info_gen):
                 update_info['return_time'] = time.time()
                 update_infos.append(update_info)
+                self.render_times.record(update_info)
                 error = update_info.get('error')
                 if error is not None:
                     print('Error', error)
                     errors.append(error)
+                elif done_checkpoint is not None:
+                    done_checkpoint.add(update_info['uuid'])
                 if (i + 1) % 1000 == 0:
                     log.info('Indexing %d', i + 1)
         except:
             self.shutdown()
             raise
+        finally:
+            if done_checkpoint is not None:
+                done_checkpoint.flush()
         return update_infos, errors
 
     def shutdown(self):
@@ -132,8 +132,10 @@ class SimpleUuidServer(object):    #pylint: disable=too-many-instance-attributes
         '''
         if self.is_indexing():
             return None
-        for uuid in uuids:
-            self._load_uuid(uuid)
+        # Same order as _load_uuid of each uuid without the quadratic inserts
+        uuids = list(uuids)
+        uuids.reverse()
+        self._uuids[0:0] = uuids
         return len(self._uuids)
 
     # Run
@@ -136,3 +136,241 @@ def test_pick_storage_get_by_uuid_does_not_force_database_when_model_is_none(dum
     # Make sure it looks in PG and doesn't force request.
     assert model is pg_model
     assert dummy_request.datastore == 'elasticsearch'
+
+
+def _es_hit(uuid, linked_uuids=()):
+    return {
+        '_source': {'uuid': uuid, 'linked_uuids': list(linked_uuids)},
+        '_version': 1,
+    }
+
+
+def test_es_storage_get_many_by_uuid(mocker):
+    from ..esstorage import ElasticSearchStorage
+    mocker.patch('snovault.elasticsearch.esstorage.MANY_BATCH_SIZE', 2)
+    es = Mock()
+    es.search.side_effect = [
+        {'hits': {'hits': [_es_hit('a'), _es_hit('b')]}},
+        {'hits': {'hits': []}},
+    ]
+    storage = ElasticSearchStorage(es, 'resources')
+    models = storage.get_many_by_uuid(['a', 'b', 'a', 'c'])
+    assert [model.uuid for model in models] == ['a', 'b']
+    assert es.search.call_count == 2
+    first_query = es.search.call_args_list[0][1]['body']
+    assert first_query['query'] == {'terms': {'uuid': ['a', 'b']}}
+
+
+def test_es_storage_iter_pages_with_search_after(mocker):
+    from ..esstorage import ElasticSearchStorage
+    mocker.patch('snovault.elasticsearch.esstorage.ITER_PAGE_SIZE', 2)
+    es = Mock()
+    es.search.side_effect = [
+        {'hits': {'hits': [{'_id': 'a', 'sort': ['a']}, {'_id': 'b', 'sort': ['b']}]}},
+        {'hits': {'hits': [{'_id': 'c', 'sort': ['c']}]}},
+    ]
+    storage = ElasticSearchStorage(es, 'resources')
+    assert list(storage.__iter__('testing_link_target')) == ['a', 'b', 'c']
+    assert es.search.call_count == 2
+    first_query, second_query = [
+        call[1]['body'] for call in es.search.call_args_list
+    ]
+    assert first_query['size'] == 2
+    assert second_query['search_after'] == ['b']
+
+
+def test_pick_storage_get_many_by_uuid_reads_invalidated_from_database(dummy_request):
+    from pyramid.testing import testConfig
+    from ..esstorage import PickStorage
+    dummy_request.datastore = 'elasticsearch'
+    es_a, es_b, pg_b, pg_c = Mock(uuid='a'), Mock(uuid='b'), Mock(uuid='b'), Mock(uuid='c')
+    es_a.invalidated.return_value = False
+    es_b.invalidated.return_value = True
+    read = Mock()
+    write = Mock()
+    read.get_many_by_uuid.return_value = [es_a, es_b]
+    write.get_many_by_uuid.return_value = [pg_b, pg_c]
+    storage = PickStorage(read, write)
+    with testConfig(request=dummy_request):
+        models = storage.get_many_by_uuid(['a', 'b', 'c', 'd'])
+    assert models == [es_a, pg_b, pg_c]
+    read.get_many_by_uuid.assert_called_once_with(['a', 'b', 'c', 'd'])
+    write.get_many_by_uuid.assert_called_once_with(['b', 'c', 'd'])
+    assert dummy_request.datastore == 'database'
+
+
+def test_pick_storage_per_uuid_fallback(dummy_request, threadlocals):
+    from ..esstorage import PickStorage
+    dummy_request.datastore = 'elasticsearch'
+    es_model, pg_model = Mock(uuid='a'), Mock(uuid='a')
+    es_model.invalidated.return_value = True
+    read = Mock()
+    write = Mock()
+    read.get_by_uuid.return_value = es_model
+    read.get_by_unique_key.return_value = es_model
+    write.get_by_uuid.return_value = pg_model
+    write.get_many_by_uuid.return_value = [pg_model]
+    write.get_by_unique_key.return_value = pg_model
+    storage = PickStorage(read, write, per_uuid_fallback=True)
+    assert storage.get_by_uuid('a') == pg_model
+    # Only the stale uuid leaves elasticsearch
+    assert dummy_request.datastore == 'elasticsearch'
+    assert storage.storage() == read
+    es_model.invalidated.return_value = False
+    assert storage.get_by_uuid('a') == pg_model
+    assert storage.get_many_by_uuid(['a']) == [pg_model]
+    assert storage.get_by_unique_key('a-key', 'accession') == pg_model
+    read.get_by_uuid.assert_called_once_with('a')
+    read.get_many_by_uuid.assert_not_called()
+
+
+def test_pick_storage_stale_uuids_kept_per_request(dummy_request, threadlocals):
+    from pyramid.threadlocal import manager
+    from ..esstorage import PickStorage
+    dummy_request.datastore = 'elasticsearch'
+    es_model, pg_model = Mock(uuid='a'), Mock(uuid='a')
+    es_model.invalidated.return_value = True
+    read = Mock()
+    write = Mock()
+    read.get_by_uuid.return_value = es_model
+    write.get_by_uuid.return_value = pg_model
+    storage = PickStorage(read, write, per_uuid_fallback=True)
+    assert storage.get_by_uuid('a') == pg_model
+    # Another request without the edits reads elasticsearch again
+    es_model.invalidated.return_value = False
+    outer = manager.pop()
+    manager.push({'request': dummy_request, 'registry': outer['registry']})
+    try:
+        assert storage.get_by_uuid('a') == es_model
+    finally:
+        manager.pop()
+        manager.push(outer)
+    assert read.get_by_uuid.call_count == 2
+
+
+def test_pick_storage_prefetch_linked(dummy_request, threadlocals):
+    from ..esstorage import (
+        ElasticSearchStorage,
+        PickStorage,
+    )
+    dummy_request.datastore = 'elasticsearch'
+    es = Mock()
+    es.search.side_effect = [
+        {'hits': {'total': 1, 'hits': [_es_hit('a', ['a', 'b', 'c'])]}},
+        {'hits': {'hits': [_es_hit('b'), _es_hit('c')]}},
+    ]
+    storage = PickStorage(ElasticSearchStorage(es, 'resources'), Mock(), prefetch_linked=10)
+    assert storage.get_by_uuid('a').uuid == 'a'
+    assert storage.get_by_uuid('b').uuid == 'b'
+    assert [model.uuid for model in storage.get_many_by_uuid(['c', 'b'])] == ['c', 'b']
+    assert es.search.call_count == 2
+
+
+def test_get_source_excludes():
+    from types import SimpleNamespace
+    from ..esstorage import get_source_excludes
+    assert get_source_excludes(None) == ()
+    request = SimpleNamespace(path_info='/a/@@object', params={})
+    assert get_source_excludes(request) == ('audit', 'embedded')
+    request = SimpleNamespace(path_info='/a/', params={'frame': 'audit'})
+    assert get_source_excludes(request) == ('embedded',)
+    request = SimpleNamespace(path_info='/a/@@embedded', params={})
+    assert get_source_excludes(request) == ()
+
+
+def test_lazy_source_fetches_excluded_slice():
+    from ..esstorage import LazySource
+    fetch_slice = Mock(return_value=({'embedded': {'@id': '/a/'}}, False))
+    source = LazySource({'uuid': 'a'}, ['embedded', 'audit'], fetch_slice)
+    assert source['uuid'] == 'a'
+    assert source['embedded'] == {'@id': '/a/'}
+    assert source.get('embedded') == {'@id': '/a/'}
+    fetch_slice.assert_called_once_with(['embedded'])
+    fetch_slice.return_value = ({}, False)
+    assert source.get('audit') is None
+    with pytest.raises(KeyError):
+        source['paths']
+
+
+def test_lazy_source_loads_excluded_slices_on_full_read():
+    from ..esstorage import LazySource
+    fetch_slice = Mock(return_value=({'audit': {}, 'embedded': {'@id': '/a/'}}, False))
+    source = LazySource({'uuid': 'a'}, ['embedded', 'audit'], fetch_slice)
+    assert 'paths' not in source
+    fetch_slice.assert_not_called()
+    assert sorted(source) == ['audit', 'embedded', 'uuid']
+    fetch_slice.assert_called_once_with(['audit', 'embedded'])
+    assert dict(source) == {'audit': {}, 'embedded': {'@id': '/a/'}, 'uuid': 'a'}
+    assert 'embedded' in source
+    assert fetch_slice.call_count == 1
+
+
+def test_es_storage_frame_source_filter(dummy_request):
+    from pyramid.testing import testConfig
+    from ..esstorage import ElasticSearchStorage
+    es = Mock()
+    hit = _es_hit('a')
+    hit.update({'_index': 'snowball', '_id': 'a'})
+    es.search.side_effect = [
+        {'hits': {'total': 1, 'hits': [hit]}},
+        {'hits': {'hits': [{'_source': {'embedded': {'@id': '/a/'}}, '_version': 1}]}},
+    ]
+    storage = ElasticSearchStorage(es, 'resources', frame_source_filter=True)
+    dummy_request.path_info = '/a/@@object'
+    with testConfig(request=dummy_request):
+        model = storage.get_by_uuid('a')
+    assert es.search.call_args[1]['_source_exclude'] == ['audit', 'embedded']
+    assert model.source['embedded'] == {'@id': '/a/'}
+    assert es.search.call_args[1]['index'] == 'snowball'
+    assert es.search.call_args[1]['_source_include'] == ['embedded']
+
+
+def test_es_storage_frame_source_filter_reloads_new_version(dummy_request):
+    from pyramid.testing import testConfig
+    from ..esstorage import ElasticSearchStorage
+    es = Mock()
+    hit = _es_hit('a')
+    hit.update({'_index': 'snowball', '_id': 'a'})
+    new_source = dict(_es_hit('a')['_source'], embedded={'@id': '/b/'}, audit={})
+    es.search.side_effect = [
+        {'hits': {'total': 1, 'hits': [hit]}},
+        {'hits': {'hits': [{'_source': {'embedded': {'@id': '/b/'}}, '_version': 2}]}},
+        {'hits': {'hits': [{'_source': new_source, '_version': 2}]}},
+    ]
+    storage = ElasticSearchStorage(es, 'resources', frame_source_filter=True)
+    dummy_request.path_info = '/a/@@object'
+    with testConfig(request=dummy_request):
+        model = storage.get_by_uuid('a')
+    assert model.source['embedded'] == {'@id': '/b/'}
+    assert model.hit['_version'] == 2
+    assert 'audit' in model.source
+    assert es.search.call_count == 3
+    assert '_source_include' not in es.search.call_args[1]
+
+
+def test_cached_model_invalidated_by_edits_index(mocker):
+    from types import SimpleNamespace
+    from ..esstorage import CachedModel
+    request = SimpleNamespace(session={'edits': [
+        [5, ['b'], []],
+        [8, [], ['c']],
+    ]})
+    mocker.patch('snovault.elasticsearch.esstorage.get_root_request', return_value=request)
+
+    def model(version, embedded_uuids, linked_uuids):
+        return CachedModel({
+            '_version': version,
+            '_source': {'embedded_uuids': embedded_uuids, 'linked_uuids': linked_uuids},
+        })
+
+    assert model(5, ['a', 'b'], []).invalidated()
+    assert not model(6, ['a', 'b'], []).invalidated()
+    assert model(8, [], ['c']).invalidated()
+    assert not model(9, ['b'], ['c']).invalidated()
+    assert not model(1, ['c'], ['b']).invalidated()
+    edits_index = request._edits_index
+    model(1, ['a'], []).invalidated()
+    assert request._edits_index is edits_index
+    request.session['edits'].append([10, ['a'], []])
+    assert model(9, ['a'], []).invalidated()
+    assert request._edits_index is not edits_index
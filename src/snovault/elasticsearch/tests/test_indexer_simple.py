@@ -1,4 +1,5 @@
 """Tests the simple queue with a mocked indexer"""
+import json
 import time
 import uuid
 
@@ -11,6 +12,8 @@ import pytest
 
 from snovault import STORAGE
 from snovault.app import main
+from snovault.elasticsearch import bulk_indexer as bulk_indexer_module
+from snovault.elasticsearch.bulk_indexer import BulkIndexer
 from snovault.elasticsearch.indexer import Indexer
 from snovault.elasticsearch.mpindexer import MPIndexer
 from snovault.elasticsearch.interfaces import (
@@ -45,6 +48,10 @@ class MockES(object):  # pylint: disable=too-few-public-methods
     There is a pytest module for this!
     https://pypi.org/project/pytest-elasticsearch/
     """
+    def __init__(self, bulk_statuses=None):
+        self.bulk_bodies = []
+        self._bulk_statuses = list(bulk_statuses or [])
+
     @staticmethod
     def index(
             index=None,
@@ -60,6 +67,23 @@ class MockES(object):  # pylint: disable=too-few-public-methods
         if raise_ecp:
             raise raise_ecp('Fake es index exception.')
 
+    def bulk(self, body=None, request_timeout=None):  # pylint: disable=unused-argument
+        '''Fake bulk, item statuses for each call are popped from bulk_statuses'''
+        self.bulk_bodies.append(body)
+        actions = [json.loads(line) for line in body.splitlines()[::2]]
+        statuses = self._bulk_statuses.pop(0) if self._bulk_statuses else []
+        items = []
+        for i, action in enumerate(actions):
+            status = statuses[i] if i < len(statuses) else 201
+            result = {'_id': action['index']['_id'], 'status': status}
+            if status >= 300:
+                result['error'] = {'type': 'fake_exception'}
+            items.append({'index': result})
+        return {
+            'errors': any('error' in item['index'] for item in items),
+            'items': items,
+        }
+
 
 class MockRegistry(dict):
     """
@@ -108,6 +132,7 @@ class MockRequest(object):  # pylint: disable=too-few-public-methods
     """
     def __init__(self, embed_wait=None):
         self.embeded_uuids = []
+        self.batch_urls = []
         self._embed_wait = embed_wait
         self._embed_errors = 0
 
@@ -115,8 +140,29 @@ class MockRequest(object):  # pylint: disable=too-few-public-methods
         '''Raise a given number of errors during embeds'''
         self._embed_errors = cnt
 
+    def _embed_batch_result(self, uuid_str):
+        result = {
+            'uuid': uuid_str,
+            'document': None,
+            'error': None,
+            'start_time': time.time(),
+            'end_time': None,
+        }
+        try:
+            result['document'] = self.embed('/%s/@@index-data/' % uuid_str)
+        except ValueError as ecp:
+            result['error'] = repr(ecp)
+        result['end_time'] = time.time()
+        return result
+
     def embed(self, url, as_user=None):  # pylint: disable=unused-argument
         '''Fake embed'''
+        if url.startswith('/@@index-data-batch?'):
+            self.batch_urls.append(url)
+            uuids = [param.split('=')[1] for param in url.split('?')[1].split('&')]
+            return {
+                'results': [self._embed_batch_result(uuid_str) for uuid_str in uuids]
+            }
         doc = {
             'item_type': 'fake item type',
         }
@@ -237,6 +283,225 @@ def _test_smsimp_indexrun_emberr(small_index_objs):
     assert uuids_ran == SMALL_UUIDS_CNT
 
 
+def _get_bulk_update_info(uuid_str):
+    update_info = {
+        'uuid': uuid_str,
+        'es_info': {
+            'start_time': None,
+            'end_time': None,
+            'run_time': None,
+            'backoffs': {},
+            'item_type': None,
+            'conflict': False,
+        },
+    }
+    return update_info
+
+
+def test_bulk_indexer_max_docs():
+    """Test bulk indexer flushes by document count"""
+    encoded_es = MockES()
+    bulk_indexer = BulkIndexer(encoded_es, 5, max_docs=3)
+    finished = []
+    for uuid_str in _get_uuids(7):
+        finished.extend(
+            bulk_indexer.add(_get_bulk_update_info(uuid_str), {'item_type': 'item'})
+        )
+    assert len(finished) == 6
+    assert len(bulk_indexer) == 1
+    finished.extend(bulk_indexer.flush())
+    assert len(finished) == 7
+    assert len(encoded_es.bulk_bodies) == 3
+    for update_info, last_exc in finished:
+        assert last_exc is None
+        assert update_info['es_info']['item_type'] == 'item'
+        assert update_info['es_info']['backoffs']['0']['error'] is None
+    action = json.loads(encoded_es.bulk_bodies[0].splitlines()[0])['index']
+    assert action['_version'] == 5
+    assert action['_version_type'] == 'external_gte'
+
+
+def test_bulk_indexer_max_bytes():
+    """Test bulk indexer flushes by byte size"""
+    encoded_es = MockES()
+    bulk_indexer = BulkIndexer(encoded_es, 5, max_bytes=1)
+    for uuid_str in _get_uuids(3):
+        finished = bulk_indexer.add(_get_bulk_update_info(uuid_str), {'item_type': 'item'})
+        assert len(finished) == 1
+    assert len(encoded_es.bulk_bodies) == 3
+
+
+def test_bulk_indexer_item_errors():
+    """Test bulk indexer conflicts, retries and errors per item"""
+    encoded_es = MockES(bulk_statuses=[[409, 429, 400], [201]])
+    bulk_indexer = BulkIndexer(encoded_es, 5)
+    uuids = sorted(_get_uuids(3))
+    for uuid_str in uuids:
+        bulk_indexer.add(_get_bulk_update_info(uuid_str), {'item_type': 'item'})
+    with mock.patch('snovault.elasticsearch.bulk_indexer.time.sleep') as sleep:
+        finished = {
+            update_info['uuid']: (update_info, last_exc)
+            for update_info, last_exc in bulk_indexer.flush()
+        }
+    sleep.assert_called_with(10)
+    assert len(encoded_es.bulk_bodies) == 2
+    conflict_info, conflict_exc = finished[uuids[0]]
+    assert conflict_exc is None
+    assert conflict_info['es_info']['backoffs']['0']['error']['msg'].startswith('Conflict')
+    retry_info, retry_exc = finished[uuids[1]]
+    assert retry_exc is None
+    assert retry_info['es_info']['backoffs']['0']['error']['last_exc']
+    assert retry_info['es_info']['backoffs']['10']['error'] is None
+    _, error_exc = finished[uuids[2]]
+    assert error_exc
+
+
+def test_threaded_bulk_writer():
+    """Test threaded bulk writer returns every write with its result"""
+    from snovault.elasticsearch.bulk_indexer import (
+        ThreadedBulkWriter,
+        get_bulk_writer,
+    )
+    encoded_es = MockES(bulk_statuses=[[201, 201], [201, 400]])
+    bulk_writer = get_bulk_writer(encoded_es, 5, queue_size=1, max_docs=2)
+    assert isinstance(bulk_writer, ThreadedBulkWriter)
+    uuids = sorted(_get_uuids(5))
+    finished = []
+    for uuid_str in uuids:
+        finished.extend(
+            bulk_writer.add(_get_bulk_update_info(uuid_str), {'item_type': 'item'})
+        )
+    finished.extend(bulk_writer.flush())
+    assert not bulk_writer._thread.is_alive()  # pylint: disable=protected-access
+    assert len(encoded_es.bulk_bodies) == 3
+    last_excs = {update_info['uuid']: last_exc for update_info, last_exc in finished}
+    assert sorted(last_excs) == uuids
+    assert [uuid_str for uuid_str in uuids if last_excs[uuid_str]] == [uuids[3]]
+
+
+def test_write_objects_stops_bulk_writer_on_render_error():
+    """Test the bulk writer thread is flushed and stopped if rendering fails"""
+    encoded_es = MockES(bulk_statuses=[[201]])
+    bulk_writers = []
+    get_bulk_writer = bulk_indexer_module.get_bulk_writer
+
+    def rendered():
+        yield _get_bulk_update_info(_get_uuids(1)[0]), {'item_type': 'item'}, None
+        raise ValueError('render failed')
+
+    def spy_bulk_writer(*args, **kwargs):
+        bulk_writers.append(get_bulk_writer(*args, **kwargs))
+        return bulk_writers[-1]
+
+    with mock.patch('snovault.elasticsearch.indexer.get_bulk_writer', spy_bulk_writer):
+        with pytest.raises(ValueError):
+            list(Indexer._write_objects(  # pylint: disable=protected-access
+                encoded_es, rendered(), 5, {'queue_size': 1, 'max_docs': 2},
+            ))
+    assert not bulk_writers[0]._thread.is_alive()  # pylint: disable=protected-access
+    assert len(encoded_es.bulk_bodies) == 1
+
+
+def _letter_uuid(letter):
+    return str(uuid.UUID(int=ord(letter)))
+
+
+def _get_related_uuids(doc_count, hits_by_uuid, updated, renamed, ratio=None):
+    from snovault.elasticsearch.indexer import get_related_uuids
+
+    def _scan(es, query=None, **kwargs):  # pylint: disable=unused-argument
+        field, uuids = list(query['query']['bool']['filter']['terms'].items())[0]
+        for uuid_str in uuids:
+            for hit_id in hits_by_uuid.get((field, uuid_str), []):
+                yield {'_id': _letter_uuid(hit_id)}
+
+    registry = MockRegistry(1)
+    if ratio is not None:
+        registry.settings['indexer.related_full_reindex_ratio'] = ratio
+    request = mock.Mock(registry=registry)
+    encoded_es = mock.Mock()
+    encoded_es.count.return_value = {'count': doc_count}
+    with mock.patch('snovault.elasticsearch.indexer.scan', _scan), \
+            mock.patch('snovault.elasticsearch.indexer.MAX_CLAUSES_FOR_ES', 2), \
+            mock.patch(
+                'snovault.elasticsearch.indexer.all_uuids', return_value=['all']
+            ):
+        return get_related_uuids(request, encoded_es, updated, renamed)
+
+
+def test_get_related_uuids_batches():
+    """Test related uuids are collected over several batches"""
+    hits_by_uuid = {
+        ('embedded_uuids', 'a'): ['x', 'y'],
+        ('embedded_uuids', 'c'): ['z'],
+        ('linked_uuids', 'd'): ['x', 'w'],
+    }
+    related_set, full_reindex = _get_related_uuids(
+        100, hits_by_uuid, ['a', 'b', 'c'], ['d']
+    )
+    assert not full_reindex
+    assert related_set == {_letter_uuid(letter) for letter in 'wxyz'}
+
+
+def test_get_related_uuids_full_reindex_ratio():
+    """Test full reindex only past the configured ratio of documents"""
+    hits_by_uuid = {('embedded_uuids', 'a'): ['x', 'y', 'z']}
+    assert _get_related_uuids(10, hits_by_uuid, ['a'], [], ratio=0.2) == (['all'], True)
+    related_set, full_reindex = _get_related_uuids(10, hits_by_uuid, ['a'], [], ratio=0.3)
+    assert not full_reindex
+    assert related_set == {_letter_uuid(letter) for letter in 'xyz'}
+
+
+def test_smsimp_indexserve_bulk():
+    """Test simple indexer serve with bulk indexing"""
+    batch_size = SMALL_UUIDS_CNT // SMALL_BATCH_DIV
+    registry = MockRegistry(batch_size)
+    registry.settings['indexer.bulk'] = 'true'
+    registry.settings['indexer.bulk_max_docs'] = 4
+    indexer = Indexer(registry)
+    invalidated = _get_uuids(SMALL_UUIDS_CNT)
+    request = MockRequest()
+    update_infos, errors, err_msg = indexer.serve_objects(
+        request,
+        invalidated,
+        1,  # xmin
+        snapshot_id=None,
+        restart=False,
+        timeout=SMALL_SERVE_TIMEOUT,
+    )
+    assert err_msg is None
+    assert not errors
+    assert len(request.embeded_uuids) == len(invalidated)
+    assert registry[ELASTIC_SEARCH].bulk_bodies
+    for update_info in update_infos:
+        assert update_info['es_info']['run_time'] is not None
+
+
+def test_smsimp_indexserve_render_batch():
+    """Test simple indexer serve rendering uuids in batches"""
+    batch_size = SMALL_UUIDS_CNT // SMALL_BATCH_DIV
+    registry = MockRegistry(batch_size)
+    registry.settings['indexer.render_batch_size'] = 4
+    indexer = Indexer(registry)
+    invalidated = _get_uuids(SMALL_UUIDS_CNT)
+    request = MockRequest()
+    request.set_embed_errors(2)
+    _, errors, err_msg = indexer.serve_objects(
+        request,
+        invalidated,
+        None,  # xmin
+        snapshot_id=None,
+        restart=False,
+        timeout=SMALL_SERVE_TIMEOUT,
+    )
+    assert err_msg is None
+    assert len(errors) == 2
+    assert len(request.embeded_uuids) == len(invalidated) - 2
+    assert request.batch_urls
+    for url in request.batch_urls:
+        assert url.count('uuid=') <= 4
+
+
 def test_simple_mpindexinit():
     """test simple mpindexer"""
     batch_size = SMALL_UUIDS_CNT // SMALL_BATCH_DIV
@@ -249,6 +514,67 @@ def test_simple_mpindexinit():
     assert True
 
 
+def test_mpindexer_worker_rss_limit():
+    """Test the pool replaces only a process once it is over the rss limit"""
+    from snovault.elasticsearch import mpindexer as mpindexer_module
+    registry = MockRegistry(10)
+    registry.settings['indexer.maxtasks'] = 0
+    registry.settings['indexer.worker_rss_limit'] = 1000
+    mpindexer = MPIndexer(registry)
+    assert mpindexer.maxtasks is None
+    assert mpindexer.worker_rss_limit == 1000
+    gets = []
+
+    def worker(inqueue, outqueue, *args):
+        while True:
+            try:
+                gets.append(inqueue.get())
+            except EOFError:
+                break
+
+    inqueue = mock.Mock()
+    inqueue.get.return_value = 'task'
+    with mock.patch.object(mpindexer_module, 'worker', worker), \
+            mock.patch.object(mpindexer_module.psutil, 'Process') as process:
+        process.return_value.memory_info.return_value.rss = 1500
+        mpindexer_module.rss_limited_worker(inqueue, mock.Mock(), rss_limit=1000)
+    # Exits before taking a second task
+    assert gets == ['task']
+
+
+def test_locality_order():
+    """Test uuids are grouped by item type and most shared link target"""
+    from snovault.elasticsearch.locality import locality_order
+    storage = mock.Mock()
+    storage.get_link_targets.return_value = [
+        ('u1', 'lab', None),
+        ('u2', 'experiment', 'hub'),
+        ('u2', 'experiment', 'aaa'),
+        ('u3', 'experiment', 'zzz'),
+        ('u4', 'experiment', 'hub'),
+    ]
+    assert locality_order(storage, ['u4', 'u3', 'u2', 'u1']) == [
+        'u2', 'u4', 'u3', 'u1',
+    ]
+
+
+def test_render_times():
+    """Test render time averages per item type"""
+    from snovault.elasticsearch.mpindexer import RenderTimes
+    render_times = RenderTimes(alpha=0.5, default=0.3)
+    assert render_times.estimate('experiment') == 0.3
+    for run_time in (1.0, 3.0):
+        render_times.record({
+            'es_info': {'item_type': 'experiment'},
+            'req_info': {'run_time': run_time},
+        })
+    render_times.record({'es_info': {'item_type': 'lab'}, 'req_info': {'run_time': 1.0}})
+    render_times.record({'es_info': {'item_type': None}, 'req_info': {'run_time': 9.0}})
+    assert render_times.estimate('experiment') == 2.0
+    assert render_times.estimate('lab') == 1.0
+    assert render_times.estimate() == 1.5
+
+
 class TestIndexer(TestCase):
     """Test Indexer in indexer.py"""
     @classmethod
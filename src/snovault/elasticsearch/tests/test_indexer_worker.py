@@ -0,0 +1,70 @@
+from snovault.elasticsearch import indexer_worker
+
+
+class DummyWorker(object):
+    _queue_name = 'indxQ0'
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.results = []
+
+    def get_run_args(self):
+        return {'xmin': 10, 'snapshot_id': None, 'restart': False}
+
+    def get_uuids(self):
+        return self.batches.pop(0) if self.batches else []
+
+    def update_finished(self, batch_results):
+        self.results.append(batch_results)
+        return None
+
+
+def test_indexer_worker_index_batch(mocker):
+    update_objects = mocker.patch(
+        'snovault.elasticsearch.mpindexer.update_objects_in_snapshot',
+        return_value=[
+            {'uuid': 'a', 'error': None},
+            {'uuid': 'b', 'error': {'uuid': 'b', 'error_message': 'bad'}},
+        ],
+    )
+    run_args = {'xmin': 10, 'snapshot_id': 'snap', 'restart': False}
+    batch_results = indexer_worker.index_batch(['a', 'b'], run_args)
+    update_objects.assert_called_once_with((['a', 'b'], 10, 'snap', False))
+    assert batch_results == {
+        'errors': [{'uuid': 'b', 'error_message': 'bad'}],
+        'successes': 1,
+    }
+
+
+def test_indexer_worker_index_batch_failed(mocker):
+    mocker.patch(
+        'snovault.elasticsearch.mpindexer.update_objects_in_snapshot',
+        side_effect=RuntimeError('no database'),
+    )
+    run_args = {'xmin': 10, 'snapshot_id': None, 'restart': False}
+    batch_results = indexer_worker.index_batch(['a', 'b'], run_args)
+    assert batch_results['successes'] == 0
+    assert [error['uuid'] for error in batch_results['errors']] == ['a', 'b']
+
+
+def test_indexer_worker_run(mocker):
+    queue_worker = DummyWorker([['a', 'b'], ['c']])
+    get_remote_worker = mocker.patch(
+        'snovault.elasticsearch.indexer_worker.get_remote_worker',
+        return_value=queue_worker,
+    )
+    mocker.patch(
+        'snovault.elasticsearch.mpindexer.update_objects_in_snapshot',
+        side_effect=lambda args: [{'uuid': uuid, 'error': None} for uuid in args[0]],
+    )
+    sleep = mocker.patch('snovault.elasticsearch.indexer_worker.time.sleep')
+    batches = indexer_worker.run(
+        'indxQ', 'REDIS_LIST', {}, poll_interval=0, worker_id='w', max_batches=2,
+    )
+    assert batches == 2
+    assert queue_worker.results == [
+        {'errors': [], 'successes': 2},
+        {'errors': [], 'successes': 1},
+    ]
+    assert get_remote_worker.call_args[1]['current_worker'] is queue_worker
+    assert not sleep.called
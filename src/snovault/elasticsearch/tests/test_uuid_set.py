@@ -0,0 +1,35 @@
+import pickle
+import uuid
+
+from snovault.elasticsearch.uuid_set import CompactUuidSet
+
+
+def _get_uuids(cnt):
+    return [str(uuid.uuid4()) for _ in range(cnt)]
+
+
+def test_compact_uuid_set(mocker):
+    mocker.patch('snovault.elasticsearch.uuid_set.PENDING_MAX', 3)
+    uuids = _get_uuids(20)
+    first = CompactUuidSet(uuids[:12])
+    second = CompactUuidSet(uuids[8:])
+    assert not CompactUuidSet()
+    assert len(first) == 12
+    assert list(first) == sorted(uuids[:12])
+    assert uuids[0] in first
+    assert uuid.UUID(uuids[0]) in first
+    assert uuids[19] not in first
+    assert 'not-a-uuid' not in first
+    assert (first | second) == set(uuids)
+    assert (first - second) == set(uuids[:8])
+    assert (first - set(uuids[8:])) == set(uuids[:8])
+    first.add(uuids[0])
+    first.update(second)
+    assert len(first) == 20
+
+
+def test_compact_uuid_set_encode():
+    uuid_set = CompactUuidSet(_get_uuids(100))
+    assert CompactUuidSet.decode(uuid_set.encode()) == uuid_set
+    assert pickle.loads(pickle.dumps(uuid_set)) == uuid_set
+    assert pickle.loads(pickle.dumps(CompactUuidSet())) == CompactUuidSet()
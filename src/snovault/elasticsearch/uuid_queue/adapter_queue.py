@@ -52,6 +52,46 @@ def _get_uncombined_uuids(uuid_len, combo_uuid):
     return uuids
 
 
+def get_remote_worker(
+        queue_name,
+        queue_type,
+        queue_options,
+        worker_id,
+        current_worker=None,
+    ):
+    '''
+    Attach a worker to a queue server running in another process or host
+
+    Only queues with a shared store, not the in memory base queue, can
+    have remote workers.  Redis servers append their restart count to
+    queue_name so the worker attaches to the latest server.  Returns
+    current_worker if it is still attached to the latest server and None
+    if no server has started.
+    '''
+    # pylint: disable=protected-access
+    client_class = QueueTypes.get_queue_client_class(queue_type)
+    if not client_class or queue_type == BASE_QUEUE_TYPE:
+        raise ValueError('Queue %s cannot have remote workers' % queue_type)
+    client = client_class(queue_options)
+    server_queue_name = client.get_server_queue_name(queue_name)
+    if not server_queue_name:
+        return None
+    if current_worker and current_worker._queue_name == server_queue_name:
+        return current_worker
+    worker_queue = client.get_queue(
+        server_queue_name,
+        queue_type,
+        is_worker=True,
+    )
+    worker_queue.add_worker_conn(worker_id)
+    return WorkerAdapter(
+        server_queue_name,
+        queue_options,
+        worker_id,
+        worker_queue,
+    )
+
+
 class QueueTypes(object):
     '''
     Queue Type Manager
@@ -196,9 +236,35 @@ class QueueAdapter(object):
         self._queue.update_uuid_count(success_cnt)
         return success_cnt
 
+    # Leases
+    def _requeue_expired_leases(self):
+        '''
+        Put values leased by workers that did not finish in time back in the
+        queue and reset those worker connections
+
+        Returns the number of uuids requeued
+        '''
+        requeued_cnt = 0
+        worker_conns = self._queue.get_worker_conns()
+        for worker_id, values in self._queue.pop_expired_leases():
+            bytes_added, _ = self._queue.load_uuids(values)
+            uuid_cnt = bytes_added // self._queue_options['uuid_len']
+            self._queue.update_uuid_count(uuid_cnt, requeued=True)
+            worker_conn = worker_conns.get(worker_id)
+            if worker_conn:
+                self._queue.update_worker_conn(worker_id, 0, worker_conn['get_cnt'])
+            print(
+                'UuidQueue adapter, requeued %d uuids from expired lease'
+                ' of worker %s' % (uuid_cnt, worker_id)
+            )
+            requeued_cnt += uuid_cnt
+        return requeued_cnt
+
     # Run
     def is_indexing(self, errs_cnt=0):
         '''Is an indexing process currently running'''
+        if self._queue_options.get('lease_timeout'):
+            self._requeue_expired_leases()
         if self.has_uuids(errs_cnt=errs_cnt) or self._has_errors():
             return True
         worker_conns = self._queue.get_worker_conns()
@@ -223,6 +289,10 @@ class QueueAdapter(object):
         '''Close indexing sessions'''
         self._queue.close_indexing()
 
+    def set_run_args(self, run_args):
+        '''Set run args, xmin and snapshot_id, for remote workers'''
+        self._queue.set_run_args(run_args)
+
 
 class WorkerAdapter(object):
     '''
@@ -255,10 +325,17 @@ class WorkerAdapter(object):
         batch_size = self._queue_options['batch_size']
         get_size = self._queue_options['get_size']
         get_count = get_size // batch_size + 1
+        lease_timeout = self._queue_options.get('lease_timeout')
         if batch_size == 1:
             uuids = self._queue.get_uuids(1)
+            if lease_timeout and uuids:
+                self._queue.add_lease(self.worker_id, uuids, lease_timeout)
         else:
             combined_uuids_list = self._queue.get_uuids(get_count)
+            if lease_timeout and combined_uuids_list:
+                self._queue.add_lease(
+                    self.worker_id, combined_uuids_list, lease_timeout
+                )
             for combined_uuids in combined_uuids_list:
                 uncombined_uuids = self._get_uncombined_uuids(
                     self._queue_options['uuid_len'],
@@ -289,8 +366,23 @@ class WorkerAdapter(object):
         return uuids
 
     # Run
+    def get_run_args(self):
+        '''Run args set by the server, empty until the server sets them'''
+        return self._queue.get_run_args()
+
     def update_finished(self, batch_results):
-        '''Update server with batch results'''
+        '''
+        Update server with batch results
+
+        * With a lease_timeout, results for an expired lease are dropped
+        since the server requeued those uuids for another worker
+        '''
+        if (
+                self._queue_options.get('lease_timeout') and
+                not self._queue.release_lease(self.worker_id)
+            ):
+            self.uuid_cnt = 0
+            return 'Lease expired for worker %s, uuids were requeued' % self.worker_id
         self._queue.update_success_count(batch_results['successes'])
         self._queue.update_errors_count(len(batch_results['errors']))
         msg = self._queue.update_finished(self.worker_id, batch_results)
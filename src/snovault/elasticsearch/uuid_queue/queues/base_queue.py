@@ -50,6 +50,8 @@ class BaseQueueMeta(object):
         self._success_count = 0
         self._worker_conns = {}
         self._worker_results = {}
+        self._run_args = {}
+        self._leases = {}
 
     def get_server_restarts(self):  # pylint: disable=no-self-use
         '''
@@ -115,11 +117,12 @@ class BaseQueueMeta(object):
         """Boolean for if uuid has uuids"""
         return self._uuid_count > 0
 
-    def update_uuid_count(self, len_values):
+    def update_uuid_count(self, len_values, requeued=False):
         '''
         Update successfully loaded and got values
+        - Requeued values were already added
         '''
-        if len_values > 0:
+        if len_values > 0 and not requeued:
             self._added_count += len_values
         self._uuid_count += len_values
 
@@ -131,6 +134,39 @@ class BaseQueueMeta(object):
         '''Update errors for indexed uuids'''
         self._errors_count += len_values
 
+    # Leases
+    def add_lease(self, worker_id, values, timeout):
+        '''Lease values got by worker until timeout seconds from now'''
+        _, leased_values = self._leases.get(worker_id, (None, []))
+        leased_values.extend(values)
+        self._leases[worker_id] = (time.time() + timeout, leased_values)
+
+    def release_lease(self, worker_id):
+        '''Release the worker lease, False if it expired and was popped'''
+        return self._leases.pop(worker_id, None) is not None
+
+    def pop_expired_leases(self):
+        '''Remove and return (worker_id, values) of expired leases'''
+        now = time.time()
+        expired = [
+            worker_id
+            for worker_id, (expires, _) in self._leases.items()
+            if expires <= now
+        ]
+        return [
+            (worker_id, self._leases.pop(worker_id)[1])
+            for worker_id in expired
+        ]
+
+    # Run Args
+    def get_run_args(self):
+        '''Return run args needed for workers'''
+        return self._run_args.copy()
+
+    def set_run_args(self, run_args):
+        '''Add run args needed for workers'''
+        self._run_args = run_args.copy()
+
 
 class BaseQueue(object):
     '''
@@ -195,9 +231,9 @@ class BaseQueue(object):
         """Return Queue Meta has uuids"""
         return self._qmeta.has_uuids(errs_cnt=errs_cnt)
 
-    def update_uuid_count(self, len_values):
+    def update_uuid_count(self, len_values, requeued=False):
         """Return Queue Meta update uuid count"""
-        return self._qmeta.update_uuid_count(len_values)
+        return self._qmeta.update_uuid_count(len_values, requeued=requeued)
 
     def update_success_count(self, len_values):
         """Return Queue Meta success uuid count"""
@@ -207,6 +243,28 @@ class BaseQueue(object):
         """Return Queue Meta errors uuid count"""
         return self._qmeta.update_errors_count(len_values)
 
+    # Leases
+    def add_lease(self, worker_id, values, timeout):
+        """Lease values to worker through queue meta"""
+        self._qmeta.add_lease(worker_id, values, timeout)
+
+    def release_lease(self, worker_id):
+        """Release worker lease through queue meta"""
+        return self._qmeta.release_lease(worker_id)
+
+    def pop_expired_leases(self):
+        """Pop expired leases through queue meta"""
+        return self._qmeta.pop_expired_leases()
+
+    # Run Args
+    def get_run_args(self):
+        """Return Queue Meta run args"""
+        return self._qmeta.get_run_args()
+
+    def set_run_args(self, run_args):
+        """Set Queue Meta run args"""
+        return self._qmeta.set_run_args(run_args)
+
     def _get_uuid(self):
         if self._uuids:
             return self._uuids.pop()
@@ -240,17 +298,32 @@ class BaseQueue(object):
             print('Base queue failed to load uuids: %s' % repr(ecp))
             return False
 
+    def _is_valid_uuid(self, uuid):
+        '''Can the uuid, or combined uuids, be stored as one queue value'''
+        return (
+            isinstance(uuid, str) and
+            0 < len(uuid) <= self.max_value_size
+        )
+
     def load_uuids(self, uuids):
         '''
         The only way to load uuids in queue
+        - Same order as _load_uuid of each uuid without the quadratic inserts
         '''
         bytes_added = 0
         failed_uuids = []
+        valid_uuids = []
         for uuid in uuids:
-            if self._load_uuid(uuid):
+            if self._is_valid_uuid(uuid):
+                valid_uuids.append(uuid)
                 bytes_added += len(uuid)
             else:
                 failed_uuids.append(uuid)
+        if failed_uuids:
+            # ToDo: Make log
+            print('Base queue failed to load %d uuids' % len(failed_uuids))
+        valid_uuids.reverse()
+        self._uuids[0:0] = valid_uuids
         return bytes_added, failed_uuids
 
     # Run
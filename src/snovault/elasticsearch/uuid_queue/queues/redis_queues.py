@@ -50,6 +50,17 @@ class RedisClient(StrictRedis):
             raise ValueError('Queue %s is not available' % queue_type)
         return queue_class(queue_name, self, is_worker=is_worker)
 
+    def get_server_queue_name(self, queue_name):
+        '''
+        Name of the queue the latest server started as queue_name
+
+        Servers append their restart count to queue_name, see RedisQueueMeta
+        '''
+        restarts = self.get(PD_RESTARTS)
+        if not restarts:
+            return None
+        return queue_name + str(int(restarts) - 1)
+
 
 class RedisQueueMeta(BaseQueueMeta):
     # pylint: disable=too-many-instance-attributes
@@ -202,13 +213,13 @@ class RedisQueueMeta(BaseQueueMeta):
         cnt = added_cnt - (success_cnt + errors_cnt)
         return cnt > 0
 
-    def update_uuid_count(self, len_values):
+    def update_uuid_count(self, len_values, requeued=False):
         '''
         Update uuid count, total added and current left
-        - Added when loading uuids
+        - Added when loading uuids, unless requeued from a lease
         - Subtracted when getting uuids
         '''
-        if len_values > 0:
+        if len_values > 0 and not requeued:
             self._client.incrby(self._key_addedcount, len_values)
         self._client.incrby(self._key_uuidcount, len_values)
 
@@ -220,6 +231,43 @@ class RedisQueueMeta(BaseQueueMeta):
         '''Update errors for indexed uuids'''
         self._client.incrby(self._key_errorscount, len_values)
 
+    # Leases
+    def _get_time(self):
+        '''Redis server time, the same clock for workers on every host'''
+        seconds, microseconds = self._client.time()
+        return seconds + microseconds / 1000000
+
+    def add_lease(self, worker_id, values, timeout):
+        '''Lease values got by worker until timeout seconds from now'''
+        pipe = self._client.pipeline()
+        pipe.rpush(self._key_lease_values + ':' + worker_id, *values)
+        pipe.zadd(self._key_leases, {worker_id: self._get_time() + timeout})
+        pipe.execute()
+
+    def release_lease(self, worker_id):
+        '''
+        Release the worker lease, False if it expired and was popped
+        - zrem only succeeds once so a lease is released or popped, not both
+        '''
+        if not self._client.zrem(self._key_leases, worker_id):
+            return False
+        self._client.delete(self._key_lease_values + ':' + worker_id)
+        return True
+
+    def pop_expired_leases(self):
+        '''Remove and return (worker_id, values) of expired leases'''
+        expired = []
+        worker_ids = self._client.zrangebyscore(
+            self._key_leases, '-inf', self._get_time()
+        )
+        for worker_id in worker_ids:
+            if not self._client.zrem(self._key_leases, worker_id):
+                continue
+            values_key = self._key_lease_values + ':' + worker_id
+            expired.append((worker_id, self._client.lrange(values_key, 0, -1)))
+            self._client.delete(values_key)
+        return expired
+
     # Run Args
     def _setup_redis_keys(self):
         """
@@ -237,6 +285,8 @@ class RedisQueueMeta(BaseQueueMeta):
         wk(worker connection, Base)-Base key for worker connection hashes with worker id
         wr(worker results, base for hash)-Base key for worker results.  Conns can have
         mulitple results
+        lz(leases, sorted set)-Worker ids scored by lease expire time
+        lv(lease values, base for list)-Base key for leased values with worker id
         Ex)
             if self.queue_name = 'testqueuename'
             redis keys will look like
@@ -256,6 +306,9 @@ class RedisQueueMeta(BaseQueueMeta):
         self._key_workers = self._key_metabase + ':wi'
         self._key_worker_conn = self._key_metabase + ':wk'
         self._key_worker_results = self._key_metabase + ':wr'
+        # Leases
+        self._key_leases = self._key_metabase + ':lz'
+        self._key_lease_values = self._key_metabase + ':lv'
 
     def set_args(self, kill_workers=False):
         """Initialize indexing run args"""
@@ -264,6 +317,9 @@ class RedisQueueMeta(BaseQueueMeta):
         self._client.delete(self._key_errors)
         self._client.set(self._key_errorscount, 0)
         self._client.set(self._key_successescount, 0)
+        for worker_id in self._client.zrange(self._key_leases, 0, -1):
+            self._client.delete(self._key_lease_values + ':' + worker_id)
+        self._client.delete(self._key_leases)
         if kill_workers:
             # Worker Connections
             self._client.delete(self._key_workers)
@@ -274,6 +330,7 @@ class RedisQueueMeta(BaseQueueMeta):
         if run_args:
             run_args['batch_by'] = int(run_args['batch_by'])
             run_args['restart'] = False if run_args['restart'] == 'false' else True
+            run_args['snapshot_id'] = run_args['snapshot_id'] or None
             run_args['uuid_len'] = int(run_args['uuid_len'])
             run_args['xmin'] = int(run_args['xmin'])
         return run_args
@@ -293,7 +350,8 @@ class RedisQueueMeta(BaseQueueMeta):
         set_run_args = {
             'batch_by': run_args['batch_by'],
             'restart': run_args['restart'],
-            'snapshot_id': run_args['snapshot_id'],
+            # Redis cannot store None
+            'snapshot_id': run_args['snapshot_id'] or '',
             'uuid_len': run_args['uuid_len'],
             'xmin': run_args['xmin'],
         }
@@ -349,6 +407,19 @@ class RedisQueue(BaseQueue):
             return True
         return False
 
+    def load_uuids(self, uuids):
+        '''
+        The only way to load uuids in queue
+        '''
+        bytes_added = 0
+        failed_uuids = []
+        for uuid in uuids:
+            if self._is_valid_uuid(uuid) and self._load_uuid(uuid):
+                bytes_added += len(uuid)
+            else:
+                failed_uuids.append(uuid)
+        return bytes_added, failed_uuids
+
     # Run
     def close_indexing(self):
         '''Close indexing sessions'''
@@ -21,6 +21,7 @@ from ..adapter_queue import (
     QueueTypes,
     QueueAdapter,
     WorkerAdapter,
+    get_remote_worker,
 )
 
 from ..queues.base_queue import (
@@ -190,6 +191,13 @@ def test_get_uncombined_uuids():
     assert uuids_list == uncombined_uuids
 
 
+# get_remote_worker
+def test_get_remote_worker_base():
+    """Test in memory base queues cannot have remote workers"""
+    with pytest.raises(ValueError):
+        get_remote_worker('base-queue-name', BASE_QUEUE_TYPE, {}, 'worker-id')
+
+
 class TestQueueTypes(TestCase):
     """
     Test QueueTypes class
@@ -276,11 +284,14 @@ class TestQueueAdapter(TestCase):
         'has_uuids',
         '_load_uuids',
         'load_uuids',
+        # Leases
+        '_requeue_expired_leases',
         # Run
         'is_indexing',
         # Queue Client
         '_get_queue',
         'close_indexing', # not tested
+        'set_run_args', # tested in queues
     ]
 
     @classmethod
@@ -488,6 +499,47 @@ class TestQueueAdapter(TestCase):
             # pylint: disable=protected-access
             self.assertIsInstance(tmp_queue_server._queue, queue_class)
 
+    def test_get_remote_worker_redis(self):
+        '''Test get_remote_worker attaches to the latest redis server'''
+        queue_type, _ = REDIS_QUEUE_CLASSES[0]
+        queue_options = {
+            'processes': 1,
+            'chunk_size': 1,
+            'batch_size': 10,
+            'uuid_len': 2,
+            'host': 'localhost',
+            'port': 6379,
+        }
+        tmp_queue_server = QueueAdapter(
+            'remote-queue-name',
+            queue_type,
+            queue_options
+        )
+        tmp_queue_server.set_run_args({
+            'batch_by': 10,
+            'restart': False,
+            'snapshot_id': None,
+            'uuid_len': 2,
+            'xmin': 1234,
+        })
+        remote_worker = get_remote_worker(
+            'remote-queue-name',
+            queue_type,
+            queue_options,
+            'remote-worker-id',
+        )
+        # pylint: disable=protected-access
+        self.assertEqual(
+            tmp_queue_server._queue_name,
+            remote_worker._queue_name,
+        )
+        self.assertTrue(
+            'remote-worker-id' in tmp_queue_server._queue.get_worker_conns()
+        )
+        run_args = remote_worker.get_run_args()
+        self.assertEqual(1234, run_args['xmin'])
+        self.assertIsNone(run_args['snapshot_id'])
+
     def test_update_worker_conn(self):
         '''Test update_worker_conn'''
         update_uuid_cnt = 9
@@ -608,6 +660,47 @@ class TestQueueAdapter(TestCase):
         self.queue_server._queue._qmeta._uuid_count = 130
         self.assertTrue(self.queue_server.is_indexing())
 
+    def test_is_indexing_requeues_expired_lease(self):
+        '''
+        Test is_indexing requeues uuids of a worker whose lease expired
+        and drops the late results of that worker
+        '''
+        queue_options = self.queue_options.copy()
+        queue_options['get_size'] = 10
+        queue_options['lease_timeout'] = 10
+        tmp_queue_server = QueueAdapter(
+            'lease-queue-name',
+            self.queue_type,
+            queue_options
+        )
+        tmp_queue_worker = tmp_queue_server.get_worker()
+        tmp_queue_server.load_uuids(self.load_uuids)
+        with mock.patch('time.time', mock.MagicMock(return_value=MOCK_TIME)):
+            got_uuids = tmp_queue_worker.get_uuids()
+        self.assertEqual(20, len(got_uuids))
+        with mock.patch('time.time', mock.MagicMock(return_value=MOCK_TIME + 5)):
+            self.assertEqual(0, tmp_queue_server._requeue_expired_leases())
+        with mock.patch('time.time', mock.MagicMock(return_value=MOCK_TIME + 50)):
+            self.assertTrue(tmp_queue_server.is_indexing())
+        # pylint: disable=protected-access
+        self.assertEqual(
+            len(self.load_uuids),
+            tmp_queue_server._queue._qmeta._uuid_count
+        )
+        worker_conn = tmp_queue_server._queue.get_worker_conns()[
+            tmp_queue_worker.worker_id
+        ]
+        self.assertEqual(0, worker_conn['uuid_cnt'])
+        msg = tmp_queue_worker.update_finished({
+            'successes': len(got_uuids),
+            'errors': [],
+        })
+        self.assertTrue(msg.startswith('Lease expired'))
+        self.assertEqual(0, tmp_queue_worker.uuid_cnt)
+        self.assertEqual(0, tmp_queue_server._queue._qmeta._success_count)
+        requeued_uuids = tmp_queue_worker.get_uuids(get_all=True)
+        self.assertListEqual(sorted(self.load_uuids), sorted(requeued_uuids))
+
     # Queue Client
     def test_get_queue_base(self):
         '''Test _get_queue for base queue'''
@@ -676,6 +769,7 @@ class TestWorkerAdapater(TestCase):
         '_get_uuids',
         'get_uuids',
         # Run
+        'get_run_args',
         'update_finished',
     ]
 
@@ -46,6 +46,8 @@ class TestBaseQueueMeta(TestCase):
         ('_uuid_count', int),
         ('_worker_conns', dict),
         ('_worker_results', dict),
+        ('_run_args', dict),
+        ('_leases', dict),
         ('queue_name', str),
         ('_added_count', int), # not tested
         ('_errors_count', int), # not tested
@@ -66,6 +68,13 @@ class TestBaseQueueMeta(TestCase):
         # Uuids
         'has_uuids',
         'update_uuid_count',
+        # Leases
+        'add_lease',
+        'release_lease',
+        'pop_expired_leases',
+        # Run Args
+        'get_run_args',
+        'set_run_args',
         'get_server_restarts', # not tested
         'update_errors_count', # not tested
         'update_success_count', # not tested
@@ -215,6 +224,39 @@ class TestBaseQueueMeta(TestCase):
             id(self.queue_meta.get_worker_conns())
         )
 
+    # Leases
+    def test_release_lease(self):
+        '''Test a lease is released once'''
+        self.queue_meta.add_lease('w1', ['a', 'b'], 10)
+        self.assertTrue(self.queue_meta.release_lease('w1'))
+        self.assertFalse(self.queue_meta.release_lease('w1'))
+        self.assertListEqual([], self.queue_meta.pop_expired_leases())
+
+    def test_pop_expired_leases(self):
+        '''Test expired leases are popped with all their values'''
+        with mock.patch('time.time', mock.MagicMock(return_value=MOCK_TIME)):
+            self.queue_meta.add_lease('w1', ['a'], 10)
+            self.queue_meta.add_lease('w1', ['b'], 10)
+            self.queue_meta.add_lease('w2', ['c'], 100)
+        with mock.patch('time.time', mock.MagicMock(return_value=MOCK_TIME + 50)):
+            expired = self.queue_meta.pop_expired_leases()
+        self.assertListEqual([('w1', ['a', 'b'])], expired)
+        self.assertFalse(self.queue_meta.release_lease('w1'))
+        self.assertTrue(self.queue_meta.release_lease('w2'))
+
+    # Run Args
+    def test_get_run_args(self):
+        '''Test get_run_args returns what set_run_args set'''
+        self.assertDictEqual({}, self.queue_meta.get_run_args())
+        run_args = {'xmin': 1234, 'snapshot_id': None}
+        self.queue_meta.set_run_args(run_args)
+        run_args['xmin'] = 5678
+        self.assertDictEqual(
+            {'xmin': 1234, 'snapshot_id': None},
+            self.queue_meta.get_run_args(),
+        )
+        self.queue_meta.set_run_args({})
+
     def test_get_worker_conn_count(self):
         '''Test get_worker_conn_count'''
         # pylint: disable=protected-access
@@ -271,8 +313,16 @@ class TestBaseQueue(TestCase):
         '_get_uuid',
         'get_uuids',
         '_load_uuid',
+        '_is_valid_uuid',
         'load_uuids',
         'update_finished',
+        # Leases
+        'add_lease', # passes to qmeta
+        'release_lease', # passes to qmeta
+        'pop_expired_leases', # passes to qmeta
+        # Run Args
+        'get_run_args', # passes to qmeta
+        'set_run_args', # passes to qmeta
         'close_indexing', # not tested
         'get_server_restarts', # not tested
         'update_errors_count', # not tested
@@ -439,6 +489,16 @@ class TestBaseQueue(TestCase):
         # pylint: disable=protected-access
         self.assertListEqual(self.queue._uuids, uuids_to_add)
 
+    def test_load_uuids_failed(self):
+        '''Test load_uuids reports values that cannot be queued'''
+        too_big = 'f' * (self.queue.max_value_size + 1)
+        uuids_to_add = ['a', '', 'b', None, too_big, 'c']
+        res_bytes_added, res_failed_uuids = self.queue.load_uuids(uuids_to_add)
+        self.assertEqual(3, res_bytes_added)
+        self.assertListEqual(res_failed_uuids, ['', None, too_big])
+        # pylint: disable=protected-access
+        self.assertListEqual(self.queue._uuids, ['c', 'b', 'a'])
+
     def test_load_uuids_none(self):
         '''Test load_uuids with none'''
         uuids_to_add = []
@@ -86,6 +86,8 @@ class TestRedisQueueMeta(TestCase):
         ('_key_workers', str),
         ('_key_worker_conn', str),
         ('_key_worker_results', str),
+        ('_key_leases', str),
+        ('_key_lease_values', str),
     ]
     meth_func = [
         # Errors
@@ -109,6 +111,11 @@ class TestRedisQueueMeta(TestCase):
         'set_args',
         'get_run_args',
         'set_run_args',
+        # Leases
+        '_get_time',
+        'add_lease',
+        'release_lease',
+        'pop_expired_leases',
         # base - not used?
         'get_worker_conn_count',
         '_get_blank_worker',
@@ -543,6 +550,24 @@ class TestRedisQueueMeta(TestCase):
         '''
         pass
 
+    # Leases
+    def test_release_lease(self):
+        '''Test a lease is released once'''
+        self.queue_meta.add_lease('w1', ['a', 'b'], 10)
+        self.assertTrue(self.queue_meta.release_lease('w1'))
+        self.assertFalse(self.queue_meta.release_lease('w1'))
+        self.assertListEqual([], self.queue_meta.pop_expired_leases())
+
+    def test_pop_expired_leases(self):
+        '''Test expired leases are popped with all their values'''
+        self.queue_meta.add_lease('w1', ['a'], -10)
+        self.queue_meta.add_lease('w1', ['b'], -10)
+        self.queue_meta.add_lease('w2', ['c'], 100)
+        expired = self.queue_meta.pop_expired_leases()
+        self.assertListEqual([('w1', ['a', 'b'])], expired)
+        self.assertFalse(self.queue_meta.release_lease('w1'))
+        self.assertTrue(self.queue_meta.release_lease('w2'))
+
 
 class TestRedisQueue(TestCase):
     '''Test Redis Queue'''
@@ -576,7 +601,13 @@ class TestRedisQueue(TestCase):
         'load_uuids',
         'pop_errors',
         'update_uuid_count',
+        # Leases
+        'add_lease', # passes to qmeta
+        'release_lease', # passes to qmeta
+        'pop_expired_leases', # passes to qmeta
         # Run Args
+        'get_run_args', # passes to qmeta
+        'set_run_args', # passes to qmeta
         'update_finished',
         'close_indexing', # not tested
         'get_server_restarts', # not tested
@@ -0,0 +1,182 @@
+'''
+Compact uuid sets for indexer invalidation bookkeeping
+
+An indexing cycle can invalidate millions of uuids.  Held as python sets of
+strings that costs well over 100 bytes a uuid, and the same uuids are
+stored again in the indexer state meta documents.  CompactUuidSet keeps
+them as one sorted bytes object of 16 byte packed uuids, with a small
+buffer of recent adds, and encodes to zlib compressed base64 for storage.
+
+Iteration yields uuid strings in sorted order, so only use it where the
+order of uuids does not matter.
+'''
+import base64
+import heapq
+import uuid as uuid_module
+import zlib
+
+
+UUID_BYTES = 16
+PENDING_MAX = 65536
+
+
+def _pack(value):
+    if isinstance(value, uuid_module.UUID):
+        return value.bytes
+    return uuid_module.UUID(str(value)).bytes
+
+
+def _unique(sorted_values):
+    last = None
+    for value in sorted_values:
+        if value != last:
+            yield value
+            last = value
+
+
+class CompactUuidSet(object):
+    '''
+    A set of uuids packed into sorted 16 byte records
+
+    Supports add, update, membership, len, iteration, union and difference.
+    Adds go to a pending set that is merged into the packed data when the
+    packed records are read, or when it grows past PENDING_MAX and as many
+    uuids as are packed, so each merge is paid for by as many adds.
+    '''
+    __slots__ = ('_data', '_pending')
+
+    def __init__(self, uuids=()):
+        self._data = b''
+        self._pending = set()
+        self.update(uuids)
+
+    @classmethod
+    def _from_packed(cls, data):
+        result = cls()
+        result._data = data
+        return result
+
+    def _records(self):
+        data = self._data
+        for start in range(0, len(data), UUID_BYTES):
+            yield data[start:start + UUID_BYTES]
+
+    def _compact(self):
+        if not self._pending:
+            return
+        merged = _unique(heapq.merge(self._records(), sorted(self._pending)))
+        self._data = b''.join(merged)
+        self._pending = set()
+
+    def _merge(self, other, keep_other):
+        '''Merge packed records, keeping or dropping those in other'''
+        self._compact()
+        other._compact()
+        if keep_other:
+            records = _unique(heapq.merge(self._records(), other._records()))
+        else:
+            records = (record for record in self._records() if record not in other)
+        return self._from_packed(b''.join(records))
+
+    def add(self, value):
+        self._pending.add(_pack(value))
+        pending_count = len(self._pending)
+        if pending_count >= PENDING_MAX and pending_count * UUID_BYTES >= len(self._data):
+            self._compact()
+
+    def update(self, *iterables):
+        for values in iterables:
+            if isinstance(values, CompactUuidSet):
+                merged = self._merge(values, keep_other=True)
+                self._data = merged._data
+                continue
+            for value in values:
+                self.add(value)
+
+    def union(self, *others):
+        result = self._from_packed(self._data)
+        result._pending = set(self._pending)
+        for other in others:
+            if not isinstance(other, CompactUuidSet):
+                other = CompactUuidSet(other)
+            result.update(other)
+        return result
+
+    def difference(self, *others):
+        result = self.union()
+        for other in others:
+            if not isinstance(other, CompactUuidSet):
+                other = CompactUuidSet(other)
+            result = result._merge(other, keep_other=False)
+        return result
+
+    __or__ = union
+    __sub__ = difference
+
+    def __contains__(self, value):
+        if isinstance(value, bytes):
+            record = value
+        else:
+            try:
+                record = _pack(value)
+            except ValueError:
+                return False
+        if record in self._pending:
+            return True
+        data = self._data
+        low, high = 0, len(data) // UUID_BYTES
+        while low < high:
+            mid = (low + high) // 2
+            mid_record = data[mid * UUID_BYTES:(mid + 1) * UUID_BYTES]
+            if mid_record == record:
+                return True
+            if mid_record < record:
+                low = mid + 1
+            else:
+                high = mid
+        return False
+
+    def __len__(self):
+        self._compact()
+        return len(self._data) // UUID_BYTES
+
+    def __bool__(self):
+        return bool(self._data) or bool(self._pending)
+
+    def __iter__(self):
+        self._compact()
+        for record in self._records():
+            yield str(uuid_module.UUID(bytes=record))
+
+    def __eq__(self, other):
+        if isinstance(other, CompactUuidSet):
+            self._compact()
+            other._compact()
+            return self._data == other._data
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    def __getstate__(self):
+        self._compact()
+        return (self._data,)
+
+    def __setstate__(self, state):
+        self._data, = state
+        self._pending = set()
+
+    def __repr__(self):
+        return '<%s of %d uuids>' % (self.__class__.__name__, len(self))
+
+    def encode(self):
+        '''Returns the set as zlib compressed base64 text'''
+        self._compact()
+        return base64.b64encode(zlib.compress(self._data)).decode('ascii')
+
+    @classmethod
+    def decode(cls, text):
+        '''Returns the set from the text of encode'''
+        data = zlib.decompress(base64.b64decode(text))
+        if len(data) % UUID_BYTES:
+            raise ValueError('Packed uuid data is not a multiple of %d bytes' % UUID_BYTES)
+        return cls._from_packed(data)
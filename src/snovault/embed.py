@@ -50,7 +50,8 @@ def embed(request, *elements, **kw):
     """
     # Should really be more careful about what gets included instead.
     # Cache cut response time from ~800ms to ~420ms.
-    embed_cache = request.registry[CONNECTION].embed_cache
+    connection = request.registry[CONNECTION]
+    embed_cache = connection.embed_cache
     as_user = kw.get('as_user')
     path = join(*elements)
     path = unquote_bytes_to_wsgi(native_(path))
@@ -60,7 +61,13 @@ def embed(request, *elements, **kw):
     else:
         cached = embed_cache.get(path, None)
         if cached is None:
-            cached = _embed(request, path)
+            shared_cache = connection.shared_embed_cache
+            if shared_cache is not None:
+                cached = shared_cache.get(request, path)
+            if cached is None:
+                cached = _embed(request, path)
+                if shared_cache is not None:
+                    shared_cache.set(request, path, cached)
             embed_cache[path] = cached
         result, embedded, linked = cached
         result = quick_deepcopy(result)
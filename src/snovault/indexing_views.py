@@ -1,3 +1,4 @@
+from pyramid.httpexceptions import HTTPForbidden
 from pyramid.security import (
     Authenticated,
     Everyone,
@@ -5,7 +6,16 @@ from pyramid.security import (
 )
 from pyramid.traversal import resource_path
 from pyramid.view import view_config
-from .resources import Item
+from sqlalchemy.exc import StatementError
+from .resources import (
+    Item,
+    Root,
+)
+import logging
+import time
+
+
+log = logging.getLogger(__name__)
 
 
 def includeme(config):
@@ -78,3 +88,38 @@ def item_index_data(context, request):
     }
 
     return document
+
+
+@view_config(context=Root, name='index-data-batch', permission='index', request_method='GET')
+def index_data_batch(context, request):
+    """ Render index-data for every ?uuid= in a single request
+
+    Items share the connection item and embed caches, so linked objects
+    common to the batch are only rendered once.
+    """
+    results = []
+    for uuid in request.params.getall('uuid'):
+        result = {
+            'uuid': uuid,
+            'document': None,
+            'error': None,
+            'start_time': time.time(),
+            'end_time': None,
+        }
+        try:
+            item = context[uuid]
+            if not isinstance(item, Item) or not request.has_permission('index', item):
+                raise HTTPForbidden(uuid)
+            # Embedded and linked uuids must be collected for each item
+            request._embedded_uuids = set()
+            request._linked_uuids = set()
+            result['document'] = item_index_data(item, request)
+        except StatementError:
+            # Can't reconnect until invalid transaction is rolled back
+            raise
+        except Exception as e:
+            log.error('Error rendering /%s/@@index-data', uuid, exc_info=True)
+            result['error'] = repr(e)
+        result['end_time'] = time.time()
+        results.append(result)
+    return {'results': results}
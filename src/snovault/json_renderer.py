@@ -17,6 +17,80 @@ class JSON(pyramid.renderers.JSON):
         return json.dumps(value, default=default, **self.kw)
 
 
+# Characters of encoded json per chunk of a streamed response
+STREAM_CHUNK_SIZE = 65536
+
+
+class StreamingList(list):
+    '''A list whose items are generated as the response is written
+
+    Views return one in place of a list too large to hold in memory and
+    the JSON renderer writes it item by item.  Nothing is generated before
+    the response is written, so it is true and has no length until then.
+    Only iterate it once.
+    '''
+    def __init__(self, items):
+        super().__init__()
+        self._items = items
+
+    def __bool__(self):
+        return True
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def close(self):
+        close = getattr(self._items, 'close', None)
+        if close is not None:
+            close()
+
+
+def _is_streaming(value):
+    return isinstance(value, dict) and any(
+        isinstance(item, StreamingList) for item in value.values()
+    )
+
+
+def _iter_parts(value, encoder):
+    '''Encode the dict value, its StreamingList values an item at a time'''
+    yield '{'
+    for index, (key, item) in enumerate(value.items()):
+        if index:
+            yield ', '
+        yield encoder.encode(str(key)) + ': '
+        if not isinstance(item, StreamingList):
+            yield encoder.encode(item)
+            continue
+        yield '['
+        for item_index, member in enumerate(item):
+            if item_index:
+                yield ', '
+            yield encoder.encode(member)
+        yield ']'
+    yield '}'
+
+
+def _iter_chunks(value, **kw):
+    '''Encode value incrementally, joining the encoded parts into chunks'''
+    encoder_cls = kw.pop('cls', None) or json.JSONEncoder
+    chunk = []
+    size = 0
+    try:
+        for part in _iter_parts(value, encoder_cls(**kw)):
+            chunk.append(part)
+            size += len(part)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield ''.join(chunk)
+    finally:
+        for item in value.values():
+            if isinstance(item, StreamingList):
+                item.close()
+
+
 class BinaryFromJSON:
     def __init__(self, app_iter):
         self.app_iter = app_iter
@@ -28,6 +102,11 @@ class BinaryFromJSON:
         for s in self.app_iter:
             yield s.encode('utf-8')
 
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
 
 class JSONResult(object):
     def __init__(self):
@@ -36,6 +115,8 @@ class JSONResult(object):
 
     @classmethod
     def serializer(cls, value, **kw):
+        if _is_streaming(value):
+            return BinaryFromJSON(_iter_chunks(value, **kw))
         fp = cls()
         json.dump(value, fp, **kw)
         if str is bytes:
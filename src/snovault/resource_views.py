@@ -9,11 +9,16 @@ from pyramid.exceptions import PredicateMismatch
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.httpexceptions import HTTPMovedPermanently
 from pyramid.settings import asbool
+from pyramid.threadlocal import (
+    get_current_request,
+    manager,
+)
 from pyramid.view import (
     render_view_to_response,
     view_config,
 )
 from urllib.parse import urlencode
+import transaction
 from snosearch.fields import AllResponseField
 from snosearch.fields import CollectionSearchWithFacetsResponseField
 from snosearch.fields import ColumnsResponseField
@@ -32,7 +37,11 @@ from .calculated import calculate_select_properties
 from .calculated import calculate_filtered_properties
 from .calculated import _should_render_property
 from .etag import etag_tid
-from .interfaces import CONNECTION
+from .json_renderer import StreamingList
+from .interfaces import (
+    CALCULATED_PROPERTIES,
+    CONNECTION,
+)
 from .elasticsearch.interfaces import ELASTIC_SEARCH
 from .resources import (
     AbstractCollection,
@@ -55,6 +64,55 @@ def remove_item_keys(item, request):
     return item
 
 
+def _iter_listing_items(context, request, frame, limit):
+    items = (
+        item for item in itervalues(context)
+        if request.has_permission('view', item)
+    )
+
+    if limit is not None:
+        items = islice(items, limit)
+
+    for item in items:
+        yield remove_item_keys(request.embed(request.resource_path(item, '@@' + frame)), request)
+
+
+def _stream_listing(request):
+    """Stream limit=all listings of top level json requests when configured
+
+    Only the default JSON renderer streams.  Subrequests render with their
+    own renderer and html pages are rendered from the whole result.
+    """
+    if request.__parent__ is not None or getattr(request, 'override_renderer', None):
+        return False
+    if not asbool(request.registry.settings.get('collection_listing.stream', False)):
+        return False
+    format = request.params.get('format')
+    if format is not None:
+        return format.lower() == 'json'
+    acceptable = request.accept.acceptable_offers(['text/html', 'application/json'])
+    return bool(acceptable) and acceptable[0][0] == 'application/json'
+
+
+def _in_request_context(request, iterable):
+    """Iterate with the request threadlocals in a read only transaction
+
+    Streamed responses are written after the request transaction has ended
+    and the request threadlocals are popped.  Both are set up again for the
+    whole iteration, which must not start within a request.
+    """
+    if get_current_request() is not None:
+        raise RuntimeError('Streamed listings are iterated as the response is written')
+    txn = transaction.begin()
+    txn.doom()
+    manager.push({'request': request, 'registry': request.registry})
+    try:
+        yield from iterable
+    finally:
+        manager.pop()
+        transaction.abort()
+
+
 def collection_view_listing_db_with_additional_properties(context, request, additional_properties):
     result = {}
 
@@ -69,18 +127,11 @@ def collection_view_listing_db_with_additional_properties(context, request, addi
         except ValueError:
             limit = 25
 
-    items = (
-        item for item in itervalues(context)
-        if request.has_permission('view', item)
-    )
-
-    if limit is not None:
-        items = islice(items, limit)
-
-    result['@graph'] = [
-        remove_item_keys(request.embed(request.resource_path(item, '@@' + frame)), request)
-        for item in items
-    ]
+    items = _iter_listing_items(context, request, frame, limit)
+    if limit is None and _stream_listing(request):
+        result['@graph'] = StreamingList(_in_request_context(request, items))
+    else:
+        result['@graph'] = list(items)
 
     if limit is not None and len(result['@graph']) == limit:
         params = [(k, v) for k, v in request.params.items() if k != 'limit']
@@ -188,11 +239,14 @@ def item_view(context, request):
     return request.embed(path, as_user=True)
 
 
-def item_links(context, request):
+def item_links(context, request, fields=None):
     # This works from the schema rather than the links table
     # so that upgrade on GET can work.
+    # Only links under fields are converted to paths when given.
     properties = context.__json__(request)
     for path in context.type_info.schema_links:
+        if fields is not None and path.split('.', 1)[0] not in fields:
+            continue
         uuid_to_path(request, properties, path)
     return properties
 
@@ -216,6 +270,7 @@ def uuid_to_path(request, obj, path):
         return
     conn = request.registry[CONNECTION]
     if isinstance(value, list):
+        conn.get_many_by_uuid(value)
         obj[name] = [
             request.resource_path(conn[v])
             for v in value
@@ -269,7 +324,6 @@ def item_view_object_with_select_calculated_properties(context, request):
     name='filtered_object'
 )
 def item_view_filtered_object(context, request):
-    properties = item_links(context, request)
     qs = QueryString(request)
     include = qs.param_values_to_list(
         params=qs.get_key_filters(
@@ -281,6 +335,15 @@ def item_view_filtered_object(context, request):
             key='exclude'
         )
     ) or None
+    fields = None
+    if include is not None:
+        # Links only need resolving if rendered or read by a calculated property
+        plan = request.registry[CALCULATED_PROPERTIES].plan_for(
+            context, include=include, exclude=exclude
+        )
+        if plan.depends_on is not None:
+            fields = plan.depends_on.union(include)
+    properties = item_links(context, request, fields)
     calculated = calculate_filtered_properties(
         context,
         request,
@@ -397,9 +460,8 @@ def item_view_edit(context, request):
     for propname in schema_rev_links:
         properties[propname] = sorted(
             request.resource_path(child)
-            for child in (
-                conn.get_by_uuid(uuid) for uuid in context.get_rev_links(propname)
-            ) if request.has_permission('visible_for_edit', child)
+            for child in conn.get_many_by_uuid(context.get_rev_links(propname))
+            if request.has_permission('visible_for_edit', child)
         )
 
     return properties
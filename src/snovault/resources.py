@@ -280,6 +280,12 @@ class Item(Resource):
         types = types[type_name].subtypes
         return self.registry[CONNECTION].get_rev_links(self.model, rel, *types)
 
+    def get_rev_link_paths(self, name):
+        types = self.registry[TYPES]
+        type_name, rel = self.rev[name]
+        types = types[type_name].subtypes
+        return self.registry[CONNECTION].get_rev_link_paths(self.model, rel, *types)
+
     def unique_keys(self, properties):
         return {
             name: [v for prop in props for v in ensurelist(properties.get(prop, ()))]
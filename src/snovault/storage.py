@@ -4,6 +4,7 @@ from sqlalchemy import (
     DDL,
     ForeignKey,
     bindparam,
+    case,
     event,
     func,
     null,
@@ -91,6 +92,26 @@ class RDBStorage(object):
             return default
         return model
 
+    def get_many_by_uuid(self, rids):
+        """ Load resources with their keys and links preloaded
+
+        Runs a handful of set based queries per batch instead of a query per
+        uuid and per relationship. Uuids that are not found are skipped.
+        Rev links are left to load when used, hub items have thousands.
+        """
+        rids = [uuid.UUID(str(rid)) for rid in rids]
+        session = self.DBSession()
+        models = []
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(Resource).filter(
+                Resource.rid.in_(rids[start:start + self.batchsize])
+            ).options(
+                orm.selectinload(Resource.unique_keys),
+                orm.selectinload(Resource.rels),
+            )
+            models.extend(query.all())
+        return models
+
     def get_by_unique_key(self, unique_key, name, default=None, index=None):
         session = self.DBSession()
         try:
@@ -108,6 +129,59 @@ class RDBStorage(object):
         else:
             return [link.source_rid for link in model.revs if link.rel == rel]
 
+    def get_rev_link_names(self, model, rel, *item_types, name_keys=None):
+        """ (uuid, item_type, name) of every rev link in one query
+
+        The name is the property named by name_keys for the source item
+        type, or None when the item type has no name key.
+        """
+        session = self.DBSession()
+        name = null()
+        if name_keys:
+            name = case([
+                (
+                    Resource.item_type == item_type,
+                    PropertySheet.properties.op('->>', return_type=types.String)(name_key),
+                )
+                for item_type, name_key in name_keys.items()
+            ], else_=null())
+        query = session.query(
+            Link.source_rid, Resource.item_type, name
+        ).join(
+            Resource, Resource.rid == Link.source_rid
+        ).filter(
+            Link.target_rid == model.rid,
+            Link.rel == rel,
+        )
+        if name_keys:
+            query = query.join(
+                CurrentPropertySheet, CurrentPropertySheet.rid == Link.source_rid
+            ).join(
+                PropertySheet, PropertySheet.sid == CurrentPropertySheet.sid
+            ).filter(
+                CurrentPropertySheet.name == ''
+            )
+        if item_types:
+            query = query.filter(Resource.item_type.in_(item_types))
+        return query.all()
+
+    def get_link_targets(self, rids):
+        """ (uuid, item_type, link target uuid) rows for the resources of rids
+
+        Resources without links have one row with a None target.
+        """
+        rids = [uuid.UUID(str(rid)) for rid in rids]
+        session = self.DBSession()
+        for start in range(0, len(rids), self.batchsize):
+            query = session.query(
+                Resource.rid, Resource.item_type, Link.target_rid
+            ).outerjoin(
+                Link, Link.source_rid == Resource.rid
+            ).filter(
+                Resource.rid.in_(rids[start:start + self.batchsize])
+            )
+            yield from query
+
     def __iter__(self, *item_types):
         session = self.DBSession()
         query = session.query(Resource.rid)
@@ -180,6 +254,10 @@ class RDBStorage(object):
                 session.delete(current_propsheet)
             # now delete the resource, keys and links(via cascade)
             session.delete(model)
+            # and the index dependencies of its document
+            session.query(IndexDependency).filter(
+                IndexDependency.source_rid == model.rid
+            ).delete(synchronize_session=False)
             sp.commit()
         except Exception as e:
             sp.rollback()
@@ -553,6 +631,21 @@ class Blob(Base):
     data = Column(types.LargeBinary)
 
 
+class IndexDependency(Base):
+    """ What an indexed document embeds and links to
+
+    Written by the indexer, kind is 'embedded' or 'linked', so that the
+    documents to reindex can be found with set based queries.
+    """
+    __tablename__ = 'index_dependencies'
+    source_rid = Column('source', UUID, primary_key=True)
+    kind = Column(types.String, primary_key=True)
+    target_rid = Column('target', UUID, primary_key=True)
+    __table_args__ = (
+        schema.Index('ix_index_dependencies_target_kind', 'target', 'kind'),
+    )
+
+
 class TransactionRecord(Base):
     __tablename__ = 'transactions'
     order = Column(types.Integer, autoincrement=True, primary_key=True)
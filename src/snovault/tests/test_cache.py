@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from pyramid.threadlocal import manager
+from snovault.cache import SharedLRUCache
+from snovault.interfaces import DBSESSION
+
+
+class DummyRequest(object):
+    datastore = 'database'
+    host_url = 'http://localhost'
+
+    def __init__(self, method='GET', principals=('system.Everyone',)):
+        self.method = method
+        self.effective_principals = list(principals)
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    shared_cache = SharedLRUCache('test.shared_cache', 2)
+    monkeypatch.setattr(shared_cache, 'poll', lambda session: None)
+    # Stand in for the first poll
+    shared_cache.invalidate((), ())
+    return shared_cache
+
+
+@contextmanager
+def request_threadlocals(shared_cache, method='GET', registry=None, principals=('system.Everyone',)):
+    request = DummyRequest(method, principals)
+    if registry is None:
+        registry = {DBSESSION: lambda: None}
+    manager.push({'request': request, 'registry': registry})
+    try:
+        shared_cache.new_request(SimpleNamespace(request=request))
+        yield request
+    finally:
+        manager.pop()
+
+
+def test_shared_cache_get_set(shared_cache):
+    value = ({'@id': '/a/'}, {'a'}, {'a', 'b'})
+    with request_threadlocals(shared_cache) as request:
+        assert shared_cache.get(request, '/a/@@object') is None
+        assert shared_cache.set(request, '/a/@@object', value)
+    with request_threadlocals(shared_cache) as request:
+        result, embedded, linked = shared_cache.get(request, '/a/@@object')
+    assert result == {'@id': '/a/'}
+    assert embedded == {'a'}
+    assert linked == {'a', 'b'}
+
+
+def test_shared_cache_keyed_by_principals(shared_cache):
+    admin = ('system.Everyone', 'system.Authenticated', 'group.admin')
+    value = ({'@id': '/a/', 'status': 'in progress'}, {'a'}, {'a'})
+    with request_threadlocals(shared_cache, principals=admin) as request:
+        assert shared_cache.set(request, '/a/@@object', value)
+    with request_threadlocals(shared_cache) as request:
+        assert shared_cache.get(request, '/a/@@object') is None
+    with request_threadlocals(shared_cache, principals=reversed(admin)) as request:
+        assert shared_cache.get(request, '/a/@@object') == value
+
+
+def test_shared_cache_invalidate(shared_cache):
+    with request_threadlocals(shared_cache) as request:
+        shared_cache.set(request, '/a/@@object', ({}, {'a'}, {'a', 'b'}))
+    assert shared_cache.invalidate(['b'], []) == 0
+    assert len(shared_cache) == 1
+    assert shared_cache.invalidate([], ['b']) == 1
+    assert len(shared_cache) == 0
+
+
+def test_shared_cache_rejects_stale_set(shared_cache):
+    with request_threadlocals(shared_cache) as request:
+        shared_cache.invalidate(['a'], [])
+        assert not shared_cache.set(request, '/a/@@object', ({}, {'a'}, {'a'}))
+        assert shared_cache.set(request, '/c/@@object', ({}, {'c'}, {'c'}))
+    with request_threadlocals(shared_cache) as request:
+        assert shared_cache.set(request, '/a/@@object', ({}, {'a'}, {'a'}))
+
+
+def test_shared_cache_capacity(shared_cache):
+    with request_threadlocals(shared_cache) as request:
+        for name in ('a', 'b', 'c'):
+            shared_cache.set(request, '/%s/@@object' % name, ({}, {name}, {name}))
+        assert shared_cache.get(request, '/a/@@object') is None
+        assert shared_cache.get(request, '/c/@@object') is not None
+    assert len(shared_cache) == 2
+
+
+def test_shared_cache_skips_writes(shared_cache):
+    with request_threadlocals(shared_cache) as request:
+        shared_cache.set(request, '/a/@@object', ({}, {'a'}, {'a'}))
+    with request_threadlocals(shared_cache, method='POST') as request:
+        assert shared_cache.get(request, '/a/@@object') is None
+        assert not shared_cache.set(request, '/b/@@object', ({}, {'b'}, {'b'}))
+
+
+def test_shared_cache_poll(session):
+    from snovault.storage import (
+        Resource,
+        TransactionRecord,
+    )
+    shared_cache = SharedLRUCache('test.shared_cache', 10)
+    registry = {DBSESSION: lambda: session}
+    with request_threadlocals(shared_cache, registry=registry) as request:
+        # The first poll only records where to start
+        shared_cache.get(request, '/a/@@object')
+    with request_threadlocals(shared_cache, registry=registry) as request:
+        assert shared_cache.set(request, '/a/@@object', ({}, {'a'}, {'a'}))
+    resource = Resource('test_item', {'': {}})
+    session.add(resource)
+    session.flush()
+    record = session.query(TransactionRecord).one()
+    record.data = {'updated': ['a'], 'renamed': []}
+    session.flush()
+    with request_threadlocals(shared_cache, registry=registry) as request:
+        assert shared_cache.get(request, '/a/@@object') is None
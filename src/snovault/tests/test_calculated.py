@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+from snovault.calculated import (
+    CalculatedProperties,
+    ItemNamespace,
+)
+from snovault.interfaces import CONNECTION
+
+
+class Base(object):
+    def title(self, name):
+        return name.title()
+
+
+class Child(Base):
+    pass
+
+
+def double(count):
+    return count * 2
+
+
+def define_prefix(name):
+    return name[:1]
+
+
+def uses_prefix(prefix):
+    return prefix + '!'
+
+
+def make_properties():
+    calculated_properties = CalculatedProperties()
+    calculated_properties.register_prop(None, 'title', Base, attr='title')
+    calculated_properties.register_prop(double, 'double', Base, condition='count')
+    calculated_properties.register_prop(define_prefix, 'prefix', Base, define=True)
+    calculated_properties.register_prop(uses_prefix, 'shout', Child)
+    return calculated_properties
+
+
+def evaluate(plan, context, ns):
+    request = SimpleNamespace(registry={CONNECTION: None})
+    return plan(ItemNamespace(context, request, plan.defined, ns))
+
+
+def test_plan_for_is_cached():
+    calculated_properties = make_properties()
+    plan = calculated_properties.plan_for(Child())
+    assert calculated_properties.plan_for(Child) is plan
+    assert list(plan.props) == ['title', 'double', 'prefix', 'shout']
+    assert calculated_properties.plan_for(Base()) is not plan
+    calculated_properties.register_prop(double, 'other', Child)
+    assert calculated_properties.plan_for(Child) is not plan
+
+
+def test_plan_evaluates_properties():
+    calculated_properties = make_properties()
+    plan = calculated_properties.plan_for(Child)
+    assert evaluate(plan, Child(), {'name': 'abc', 'count': 2}) == {
+        'title': 'Abc',
+        'double': 4,
+        'prefix': 'a',
+        'shout': 'a!',
+    }
+    # Condition not met
+    assert 'double' not in evaluate(plan, Child(), {'name': 'abc', 'count': 0})
+
+
+def test_plan_include_exclude():
+    calculated_properties = make_properties()
+    plan = calculated_properties.plan_for(Child, include=['shout'])
+    # Defined properties stay available as arguments
+    assert evaluate(plan, Child(), {'name': 'abc'}) == {'shout': 'a!'}
+    plan = calculated_properties.plan_for(Child, exclude=['title', 'shout'])
+    assert list(plan.props) == ['double', 'prefix']
+
+
+def test_props_for_returns_copy():
+    calculated_properties = make_properties()
+    props = calculated_properties.props_for(Child)
+    props.clear()
+    assert len(calculated_properties.props_for(Child)) == 4
+
+
+def test_plan_depends_on():
+    calculated_properties = make_properties()
+    calculated_properties.register_prop(double, 'reads_more', Child, depends_on=['other'])
+    plan = calculated_properties.plan_for(Child, include=['shout'])
+    # Through the defined prefix property
+    assert plan.depends_on == {'prefix', 'name'}
+    plan = calculated_properties.plan_for(Child, include=['double', 'reads_more'])
+    assert plan.depends_on == {'count', 'other'}
+    assert calculated_properties.plan_for(Child, include=['title']).depends_on == {'name'}
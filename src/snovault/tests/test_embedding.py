@@ -72,3 +72,66 @@ def test_updated_target(content, testapp):
     url = '/testing-link-targets/' + targets[0]['uuid']
     res = testapp.patch_json(url, {})
     assert set(res.headers['X-Updated'].split(',')) == {targets[0]['uuid']}
+
+
+def test_index_data_batch(content, testapp):
+    uuids = [sources[0]['uuid'], targets[1]['uuid'], 'not-an-item']
+    res = testapp.get('/@@index-data-batch?' + '&'.join('uuid=%s' % uuid for uuid in uuids))
+    results = {result['uuid']: result for result in res.json['results']}
+    assert [result['uuid'] for result in res.json['results']] == uuids
+    for uuid in uuids[:2]:
+        single = testapp.get('/%s/@@index-data' % uuid).maybe_follow().json
+        document = results[uuid]['document']
+        assert results[uuid]['error'] is None
+        assert document['embedded_uuids'] == single['embedded_uuids']
+        assert document['linked_uuids'] == single['linked_uuids']
+    assert results['not-an-item']['document'] is None
+    assert results['not-an-item']['error']
+
+
+def test_rev_link_paths_match_items(content, testapp, dummy_request, threadlocals):
+    from snovault import (
+        CONNECTION,
+        TYPES,
+    )
+    testapp.post_json('/testing-link-sources/', {
+        'name': 'C',
+        'target': targets[0]['uuid'],
+        'uuid': '4a7e5b21-0b3d-4c63-9c4e-6f7d1f2a8e35',
+        'status': 'current',
+    }, status=201)
+    conn = dummy_request.registry[CONNECTION]
+    checked = 0
+    for type_info in dummy_request.registry[TYPES].by_item_type.values():
+        if not type_info.factory.rev:
+            continue
+        for uuid in conn.__iter__(type_info.name):
+            item = conn.get_by_uuid(uuid)
+            for name in item.rev:
+                expected = [
+                    dummy_request.resource_path(conn.get_by_uuid(rev_uuid))
+                    for rev_uuid in item.get_rev_links(name)
+                ]
+                assert [path for _, _, path in item.get_rev_link_paths(name)] == expected
+                checked += len(expected)
+    assert checked >= 3
+
+
+def test_uses_item_path():
+    from snovault.connection import _uses_item_path
+    from snovault.resources import Item
+
+    class Named(Item):
+        name_key = 'name'
+
+    class Renamed(Item):
+        @property
+        def __name__(self):
+            return 'renamed'
+
+    class RenamedChild(Renamed):
+        pass
+
+    assert _uses_item_path(Named)
+    assert not _uses_item_path(Renamed)
+    assert not _uses_item_path(RenamedChild)
@@ -25,3 +25,66 @@ def test_heterogeneous_stream():
     assert list(heterogeneous_stream(gm)) == [
         1.0, 0, 2.0, 1, 3.0, 2, 3, 4, 5, 6, 7, 8, 9
     ]
+
+
+class DictES(object):
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, index, doc_type, id):
+        return {'_source': self.docs[id]}
+
+    def index(self, index, doc_type, id, body):
+        self.docs[id] = body
+
+    def delete(self, index, doc_type, id):
+        del self.docs[id]
+
+
+def test_indexer_state_chunked_lists(monkeypatch):
+    from snovault.elasticsearch import indexer_state
+    monkeypatch.setattr(indexer_state, 'LIST_CHUNK_SIZE', 3)
+    es = DictES()
+    state = indexer_state.IndexerState(es, 'snovault')
+    state.put_list('a_list', iter(range(7)))
+    assert es.docs['a_list'] == {'sizes': [3, 3, 1], 'count': 7}
+    state.list_extend('a_list', [7, 8])
+    assert state.get_list('a_list') == list(range(9))
+    assert state.get_count('a_list') == 9
+    assert state.get_page('a_list', 2, 4) == [2, 3, 4, 5]
+    state.rename_objs('a_list', 'b_list')
+    assert state.get_list('b_list') == list(range(9))
+    state.delete_objs(['b_list'])
+    assert es.docs == {}
+
+
+def test_indexer_state_list_before_chunking():
+    from snovault.elasticsearch.indexer_state import IndexerState
+    es = DictES()
+    state = IndexerState(es, 'snovault')
+    es.docs['a_list'] = {'list': ['a', 'b'], 'count': 2}
+    assert state.get_page('a_list', 1, 5) == ['b']
+    state.set_add('a_list', ['b', 'c'])
+    assert state.get_list('a_list') == ['a', 'b', 'c']
+
+
+def test_indexer_state_resume_from_done_set():
+    from uuid import uuid4
+    from snovault.elasticsearch.indexer_state import (
+        DoneCheckpoint,
+        IndexerState,
+    )
+    es = DictES()
+    state = IndexerState(es, 'snovault')
+    uuids = [str(uuid4()) for _ in range(5)]
+    es.docs['indexing'] = {'xmin': 1}
+    state.start_cycle(uuids, {'xmin': 10, 'last_xmin': 1})
+    done_checkpoint = DoneCheckpoint(state, batch_size=2)
+    for uuid in uuids[:3]:
+        done_checkpoint.add(uuid)
+    assert state.get_count(state.done_set) == 2
+    done_checkpoint.flush()
+    xmin, undone_uuids, restart = state.priority_cycle(None)
+    assert xmin == 10
+    assert restart
+    assert undone_uuids == set(uuids[3:])
@@ -0,0 +1,40 @@
+import json
+
+from snovault.json_renderer import (
+    JSONResult,
+    StreamingList,
+)
+
+
+def _items(count, closed):
+    try:
+        for index in range(count):
+            yield {'index': index}
+    finally:
+        closed.append(True)
+
+
+def test_json_result_streams_streaming_list(mocker):
+    mocker.patch('snovault.json_renderer.STREAM_CHUNK_SIZE', 10)
+    closed = []
+    value = {'@graph': StreamingList(_items(3, closed)), 'total': 3}
+    app_iter = JSONResult.serializer(value)
+    chunks = list(app_iter)
+    assert len(chunks) > 1
+    assert json.loads(b''.join(chunks).decode('utf-8')) == {
+        '@graph': [{'index': 0}, {'index': 1}, {'index': 2}],
+        'total': 3,
+    }
+    app_iter.close()
+    assert closed == [True]
+
+
+def test_json_result_streams_empty_streaming_list():
+    closed = []
+    value = {'@graph': StreamingList(_items(0, closed))}
+    # Truth tests do not start the items
+    assert value['@graph']
+    assert not closed
+    app_iter = JSONResult.serializer(value)
+    assert json.loads(b''.join(app_iter).decode('utf-8')) == {'@graph': []}
+    assert closed == [True]
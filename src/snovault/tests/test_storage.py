@@ -189,6 +189,126 @@ def test_delete_compound(session, storage):
     assert session.query(CurrentPropertySheet).count() == 0
 
 
+def test_get_many_by_uuid(session, storage):
+    from uuid import uuid4
+    from snovault.storage import (
+        Key,
+        Link,
+        Resource,
+    )
+    name = 'testdata'
+    resources = [Resource('test_item', {name: {'foo': str(i)}}) for i in range(3)]
+    session.add_all(resources)
+    session.flush()
+    session.add(Key(rid=resources[0].rid, name='foo', value='0'))
+    session.add(Link(source_rid=resources[1].rid, rel='parent', target_rid=resources[0].rid))
+    session.flush()
+    session.expire_all()
+    rids = [str(resource.rid) for resource in resources]
+    models = {
+        str(model.rid): model
+        for model in storage.get_many_by_uuid(rids + [str(uuid4())])
+    }
+    assert sorted(models) == sorted(rids)
+    assert models[rids[2]][name] == {'foo': '2'}
+    assert [(key.name, key.value) for key in models[rids[0]].unique_keys] == [('foo', '0')]
+    assert [link.target_rid for link in models[rids[1]].rels] == [resources[0].rid]
+    assert storage.get_rev_links(models[rids[0]], 'parent') == [resources[1].rid]
+    assert storage.get_rev_links(models[rids[0]], 'parent', 'other_item') == []
+
+
+def test_get_rev_link_names(session, storage):
+    from snovault.storage import (
+        Link,
+        Resource,
+    )
+    target = Resource('test_item', {'': {'name': 'target'}})
+    sources = [
+        Resource('test_item', {'': {'name': 'one'}}),
+        Resource('other_item', {'': {'name': 'two'}}),
+    ]
+    session.add_all([target] + sources)
+    session.flush()
+    session.add_all([
+        Link(source_rid=source.rid, rel='parent', target_rid=target.rid)
+        for source in sources
+    ])
+    session.flush()
+    results = storage.get_rev_link_names(target, 'parent', name_keys={'test_item': 'name'})
+    assert sorted(results, key=lambda result: result[1]) == [
+        (sources[1].rid, 'other_item', None),
+        (sources[0].rid, 'test_item', 'one'),
+    ]
+    assert storage.get_rev_link_names(target, 'parent', 'other_item') == [
+        (sources[1].rid, 'other_item', None),
+    ]
+
+
+def test_get_link_targets(session, storage):
+    from snovault.storage import (
+        Link,
+        Resource,
+    )
+    target = Resource('test_item', {'': {}})
+    source = Resource('test_item', {'': {}})
+    lonely = Resource('other_item', {'': {}})
+    session.add_all([target, source, lonely])
+    session.flush()
+    session.add(Link(source_rid=source.rid, rel='parent', target_rid=target.rid))
+    session.flush()
+    results = storage.get_link_targets([str(source.rid), str(lonely.rid)])
+    assert sorted(results, key=lambda result: result[1]) == [
+        (lonely.rid, 'other_item', None),
+        (source.rid, 'test_item', target.rid),
+    ]
+
+
+def test_index_dependencies(session):
+    from uuid import uuid4
+    from snovault.elasticsearch.index_dependencies import (
+        DependencyWriter,
+        get_related_uuids_from_db,
+    )
+    from snovault.interfaces import DBSESSION
+    source, other, stale, embedded, linked = [str(uuid4()) for _ in range(5)]
+    # Write in the test transaction so the rows are rolled back
+    writer = DependencyWriter({DBSESSION: lambda: session}, connection=session.connection())
+    writer.rendered(source, {'embedded_uuids': [source, embedded], 'linked_uuids': [linked]})
+    writer.rendered(other, {'embedded_uuids': [other], 'linked_uuids': [embedded]})
+    writer.rendered(stale, {'embedded_uuids': [stale, embedded], 'linked_uuids': []})
+    writer.written(source, None)
+    # Failed writes and writes losing to a newer version are not recorded
+    writer.written(other, 'Error')
+    writer.written(stale, None, conflict=True)
+    writer.flush()
+    assert get_related_uuids_from_db(session, [embedded], []) == {source}
+    assert get_related_uuids_from_db(session, [], [linked], batch_size=1) == {source}
+    assert get_related_uuids_from_db(session, [], [embedded]) == set()
+    writer.rendered(source, {'embedded_uuids': [source], 'linked_uuids': []})
+    writer.written(source, None)
+    writer.flush()
+    assert get_related_uuids_from_db(session, [embedded], [linked]) == set()
+
+
+def test_delete_removes_index_dependencies(session, storage):
+    from snovault.storage import (
+        IndexDependency,
+        Resource,
+    )
+    resource = Resource('test_item', {'testdata': {'foo': 'bar'}})
+    other = Resource('test_item', {'testdata': {'foo': 'baz'}})
+    session.add_all([resource, other])
+    session.flush()
+    session.add_all([
+        IndexDependency(source_rid=resource.rid, kind='embedded', target_rid=resource.rid),
+        IndexDependency(source_rid=other.rid, kind='embedded', target_rid=resource.rid),
+    ])
+    session.flush()
+    storage.delete_by_uuid(str(resource.rid))
+    rows = session.query(IndexDependency).all()
+    assert [(row.source_rid, row.target_rid) for row in rows] == [(other.rid, resource.rid)]
+
+
 def test_keys(session):
     from sqlalchemy.orm.exc import FlushError
     from snovault.storage import (
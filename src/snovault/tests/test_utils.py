@@ -41,7 +41,10 @@ def test_select_distinct_values_returns_calculated(dummy_request, threadlocals,
 def test_select_distinct_values_uses_calculated(dummy_request, threadlocals, posted_targets_and_sources, mocker):
     mocker.patch.object(dummy_request, 'embed')
     select_distinct_values(dummy_request, 'reverse', *['/testing-link-targets/one/'])
-    dummy_request.embed.assert_called_with('/testing-link-targets/one/', '@@object')
+    dummy_request.embed.assert_called_with(
+        '/testing-link-targets/one/',
+        '@@object_with_select_calculated_properties?field=reverse'
+    )
 
 
 def test_select_distinct_values_skips_calculated(dummy_request, threadlocals, posted_targets_and_sources, mocker):
@@ -299,3 +302,20 @@ def test_get_uuids_from_file():
         '7a5e9183-b52f-4f75-9708-8e077b086b4e',
         'e2f35c88-a792-4dea-b5d2-30dc52ed2495'
     ]
+
+
+def test_guided_chunks():
+    from snovault.util import guided_chunks
+    chunks = list(guided_chunks(range(100), 4, 10))
+    assert [item for chunk in chunks for item in chunk] == list(range(100))
+    sizes = [len(chunk) for chunk in chunks]
+    assert sizes[0] == 10
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[-1] == 1
+    # Costly items get chunks of their own
+    chunks = list(guided_chunks('aabbbb', 1, 10, cost={'a': 10, 'b': 1}.get))
+    assert chunks == [['a'], ['a'], ['b', 'b'], ['b'], ['b']]
+    assert list(guided_chunks([], 2, 10)) == []
+    sizes = [len(chunk) for chunk in guided_chunks(range(100), 4, 10, min_size=4)]
+    assert sum(sizes) == 100
+    assert min(sizes[:-1]) == 4
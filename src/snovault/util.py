@@ -81,8 +81,11 @@ def select_distinct_values(request, value_path, *from_paths):
     values = from_paths
     for name in value_path:
         calculated_properties = _get_calculated_properties_from_paths(request, values)
-        # Don't waste time calculating properties if the field isn't calculated.
-        frame = '@@object' if name in calculated_properties else '@@object?skip_calculated=true'
+        # Only calculate the property asked for, if it is calculated at all.
+        if name in calculated_properties:
+            frame = '@@object_with_select_calculated_properties?' + urlencode({'field': name})
+        else:
+            frame = '@@object?skip_calculated=true'
         objs = (request.embed(member, frame) for member in values)
         value_lists = (ensurelist(obj.get(name, [])) for obj in objs)
         values = {value for value_list in value_lists for value in value_list}
@@ -196,3 +199,33 @@ def get_uuids_from_file(path):
             for uuid in f.readlines()
         ]
     return uuids
+
+
+def guided_chunks(items, processes, max_size, cost=None, min_size=1):
+    '''
+    Yields lists of items for a pool of processes with guided sizes
+
+    Each chunk holds about a 1/(2 * processes) share of the cost left, so
+    chunks start large and shrink toward the end and the last ones finish
+    together.  cost(item) defaults to 1 and chunks hold from min_size, or
+    the items left, to max_size items.
+    '''
+    items = list(items)
+    if cost is None:
+        costs = [1.0] * len(items)
+    else:
+        costs = [cost(item) for item in items]
+    remaining = sum(costs)
+    start = 0
+    while start < len(items):
+        target = remaining / (2 * max(processes, 1))
+        end = start
+        chunk_cost = 0.0
+        while end < len(items) and end - start < max_size:
+            if end - start >= min_size and chunk_cost + costs[end] > target:
+                break
+            chunk_cost += costs[end]
+            end += 1
+        yield items[start:end]
+        remaining -= chunk_cost
+        start = end